@@ -0,0 +1,135 @@
+"""Deterministic synthetic library generator.
+
+Builds a library database with realistic-looking data: author popularity
+follows a long-tailed distribution, genres are weighted like a typical home
+collection, ISBN-13s have valid check digits and books are spread over
+several years of additions. The same seed always produces the same library.
+
+Usage:
+    python -m benchmarks.generate bench.db --books 100000 [--files 100] [--seed 42]
+"""
+import os
+import io
+import random
+import itertools
+import argparse
+from datetime import datetime, timedelta
+
+from library import Library
+from library.core import INSERT_BOOK_SQL
+from library.dedupe import add_identifiers, book_keys
+from library.similar import index_books
+
+BATCH_SIZE = 10000
+# Positions in INSERT_BOOK_SQL rows
+ISBN = 6
+FILE_PATH = 9
+
+WORDS = (
+    "shadow night garden river silent empire lost city secret light winter stone "
+    "house fire dream war blood king queen last star ocean forest machine glass "
+    "iron road song memory storm heart golden dark island mountain broken letter "
+    "voyage hidden crown wild paper clock moon summer distant kingdom thief map"
+).split()
+FIRST_NAMES = (
+    "James Mary John Patricia Robert Jennifer Michael Linda William Elizabeth David "
+    "Barbara Richard Susan Joseph Jessica Thomas Sarah Charles Karen Haruki Chimamanda "
+    "Gabriel Toni Fyodor Jane Leo Virginia Orhan Isabel Kazuo Zadie Salman Arundhati"
+).split()
+LAST_NAMES = (
+    "Smith Johnson Williams Brown Jones Garcia Miller Davis Rodriguez Martinez Lee "
+    "Walker Hall Allen Young King Wright Scott Green Baker Adams Nelson Hill Campbell "
+    "Murakami Adichie Marquez Morrison Dostoevsky Austen Tolstoy Woolf Pamuk Allende"
+).split()
+GENRES = {
+    "Fiction": 30, "Fantasy": 12, "Science Fiction": 10, "Mystery": 10, "Thriller": 8,
+    "Romance": 7, "Biography": 5, "History": 5, "Science": 4, "Self-Help": 3,
+    "Non-fiction": 3, "Poetry": 1, "Art": 1, "Other": 1,
+}
+GENRE_NAMES = list(GENRES)
+GENRE_WEIGHTS = list(GENRES.values())
+
+
+def isbn13(rng):
+    """A random ISBN-13 with a valid check digit"""
+    digits = [9, 7, 8] + [rng.randrange(10) for _ in range(9)]
+    total = sum(d * (1 if i % 2 == 0 else 3) for i, d in enumerate(digits))
+    return "".join(map(str, digits)) + str((10 - total % 10) % 10)
+
+
+def make_authors(rng, count):
+    return [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(count)]
+
+
+def generate_books(count, seed=42):
+    """Yield book tuples in INSERT_BOOK_SQL column order"""
+    rng = random.Random(seed)
+    authors = make_authors(rng, max(10, count // 8))
+    # Zipf-like author popularity: a few authors write many of the books
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(authors))))
+    start = datetime(2015, 1, 1)
+    span = (datetime(2025, 1, 1) - start).total_seconds()
+    for n in range(count):
+        author = rng.choices(authors, cum_weights=cum_weights)[0]
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 5))).title()
+        genre = rng.choices(GENRE_NAMES, GENRE_WEIGHTS)[0]
+        year = int(min(2024, max(1800, rng.gauss(1995, 25))))
+        description = f"A {genre.lower()} novel about {' '.join(rng.choice(WORDS) for _ in range(12))}."
+        added = start + timedelta(seconds=span * n / max(count, 1) + rng.random())
+        yield (
+            f"bench-{seed}-{n:08d}",
+            title,
+            author,
+            genre,
+            description,
+            year,
+            isbn13(rng),
+            f"https://via.placeholder.com/150?text={title.replace(' ', '+')}",
+            added.strftime("%Y-%m-%d %H:%M:%S"),
+            "",
+            *book_keys(title, author),
+        )
+
+
+def _insert(library, batch):
+    with library.pool.transaction() as conn:
+        conn.executemany(INSERT_BOOK_SQL, batch)
+        add_identifiers(conn, [(row[0], row[ISBN]) for row in batch])
+        index_books(conn, (row[:5] for row in batch))
+
+
+def generate_library(db_path, books, files=0, file_size=64 * 1024, seed=42, uploads_dir=None):
+    """Create (or extend) a library with generated books and optional attached files"""
+    library = Library(db_path, uploads_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), "bench_uploads"))
+    rows = generate_books(books, seed)
+    batch = []
+    for n, row in enumerate(rows):
+        if n < files:
+            # Attach a text file whose content is unique to this book
+            rng = random.Random(f"{seed}-{n}")
+            text = " ".join(rng.choice(WORDS) for _ in range(file_size // 6)).encode()
+            row = row[:FILE_PATH] + (library.store_file(io.BytesIO(text), f"{row[0]}.txt"),) + row[FILE_PATH + 1:]
+            with library.pool.transaction() as conn:
+                library.blobs.add_ref(conn, row[FILE_PATH])
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            _insert(library, batch)
+            batch = []
+    if batch:
+        _insert(library, batch)
+    return library
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic library for benchmarks")
+    parser.add_argument("db", help="database file to create")
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--files", type=int, default=0, help="how many books get an attached file")
+    parser.add_argument("--file-size", type=int, default=64 * 1024)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    generate_library(args.db, args.books, args.files, args.file_size, args.seed).close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Query-plan regression checks for every data-access query.
+
+Each check runs EXPLAIN QUERY PLAN on the SQL the library actually executes
+(imported from the modules, not copied) against a generated library, and
+fails if the plan doesn't use the expected index, scans the books table or
+sorts in a temporary B-tree. Run it after touching a query or an index:
+
+    python -m benchmarks.plans [--books 5000]
+
+The exit status is non-zero when any plan regressed. The same checks run
+with the test suite, in tests/test_query_plans.py.
+"""
+import os
+import sys
+import sqlite3
+import argparse
+import tempfile
+
+from library.backup import CHANGED_BOOKS_SQL
+from library.core import (
+    ALL_BOOKS_SQL, BOOK_BY_ID_SQL, CARD_FIELDS, FIRST_PAGE_SQL, NEXT_PAGE_SQL, PUBLISHED_BETWEEN_SQL,
+)
+from library.dedupe import DUPLICATE_BY_ISBN_SQL, SAME_AUTHOR_SQL
+from library.enrich import PENDING_SQL
+from library.facets import ALL_VALUES_SQL, TOP_VALUES_SQL, facet_filters, selection
+from library.fulltext import SEARCH_CONTENTS_SQL
+from library.importer import EXISTING_ISBNS_SQL, EXISTING_KEYS_SQL
+from library.jobs import CLAIM_SQL
+from library.models import book_columns
+from library.search import SEARCH_SQL
+from library.similar import CANDIDATES_SQL, POSTINGS_SQL, TERM_DF_SQL, VECTOR_SQL
+from library.stats import RECENT_SQL, TOP_GENRE_SQL, TOTAL_AUTHORS_SQL, TOTAL_BOOKS_SQL
+from library.trash import PURGE_SQL
+
+from benchmarks.generate import generate_library
+
+CARD_COLUMNS = book_columns(CARD_FIELDS)
+ISBN = '9780000000002'
+
+
+def facet_page(selected):
+    filters, params = facet_filters(selection(selected))
+    return FIRST_PAGE_SQL.format(columns=CARD_COLUMNS, filters=filters), (*params, 24)
+
+
+# name: (sql, parameters, substrings the plan must contain, what the plan may also do).
+# 'scan' allows reading the whole books table, 'sort' a temporary B-tree.
+CHECKS = {
+    'get_book': (BOOK_BY_ID_SQL, ('x',), ['USING INDEX sqlite_autoindex_books_1 (id=?)'], ()),
+    'all_books': (ALL_BOOKS_SQL, (), ['SCAN books'], ('scan',)),
+    'books_page.first': (
+        FIRST_PAGE_SQL.format(columns=CARD_COLUMNS, filters=''), (24,), ['SCAN books USING INDEX idx_books_live'], ()
+    ),
+    'books_page.next': (
+        NEXT_PAGE_SQL.format(columns=CARD_COLUMNS, filters=''), ('2020-01-01 00:00:00', 'x', 24),
+        ['USING INDEX idx_books_live ((date_added,id)>(?,?))'], ()
+    ),
+    # One facet value walks its index in page order
+    'books_page.genre': (*facet_page({'genre': ['Fantasy']}), ['USING INDEX idx_books_live_genre (genre=?)'], ()),
+    'books_page.author': (*facet_page({'author': ['Linda Johnson']}), ['USING INDEX idx_books_live_author (author=?)'], ()),
+    'books_page.decade': (*facet_page({'decade': ['1990']}), ['USING INDEX idx_books_live_decade (<expr>=?)'], ()),
+    'books_page.has_file': (*facet_page({'has_file': ['yes']}), ['USING INDEX idx_books_live_files'], ()),
+    # Books without a genre are looked up through the index, then the few are sorted
+    'books_page.no_genre': (*facet_page({'genre': ['']}), ['USING COVERING INDEX idx_books_live_genre (genre=?)'], ('sort',)),
+    'facets.top_values': (TOP_VALUES_SQL, ('author', 50), ['USING COVERING INDEX idx_facet_counts_top (facet=? AND count>?)'], ()),
+    # Decades are sorted by number, a handful of rows
+    'facets.all_values': (
+        ALL_VALUES_SQL, ('decade', 50), ['USING COVERING INDEX idx_facet_counts_top (facet=? AND count>?)'], ('sort',)
+    ),
+    'published_between': (
+        PUBLISHED_BETWEEN_SQL, (1990, 2000, 100),
+        ['USING INDEX idx_books_live_year (published_year>? AND published_year<?)'], ()
+    ),
+    # BM25 ranking always sorts the (limited) matches
+    'search': (SEARCH_SQL.format(filters=''), ('"dune"*', 100), ['VIRTUAL TABLE INDEX', 'USING INTEGER PRIMARY KEY (rowid=?)'], ('sort',)),
+    'search_contents': (
+        SEARCH_CONTENTS_SQL, ('"dune"*', 20), ['VIRTUAL TABLE INDEX', 'USING INDEX idx_books_file_path (file_path=?)'], ()
+    ),
+    'stats.total_books': (TOTAL_BOOKS_SQL, (), ['USING COVERING INDEX'], ()),
+    'stats.total_authors': (TOTAL_AUTHORS_SQL, (), ['USING COVERING INDEX idx_books_live_author'], ()),
+    # Groups come from the index in order; only the handful of genres is sorted by count
+    'stats.top_genre': (TOP_GENRE_SQL, (), ['USING COVERING INDEX idx_books_live_genre'], ('sort',)),
+    'stats.recent': (RECENT_SQL, (3,), ['SCAN books USING INDEX idx_books_live'], ()),
+    'dedupe.isbn': (
+        DUPLICATE_BY_ISBN_SQL, (ISBN,),
+        ['USING PRIMARY KEY (isbn13=?)', 'USING INDEX sqlite_autoindex_books_1 (id=?)'], ()
+    ),
+    'dedupe.same_author': (SAME_AUTHOR_SQL, ('tolkien',), ['USING INDEX idx_books_author_key (author_key=?)'], ()),
+    'import.existing_isbns': (
+        EXISTING_ISBNS_SQL.format(placeholders='?, ?'), (ISBN, ISBN),
+        ['USING PRIMARY KEY (isbn13=?)', 'USING INDEX sqlite_autoindex_books_1 (id=?)'], ()
+    ),
+    'import.existing_keys': (
+        EXISTING_KEYS_SQL.format(placeholders='?, ?'), ('tolkien', 'herbert'),
+        ['USING COVERING INDEX idx_books_author_key (author_key=?)'], ()
+    ),
+    # Either the unenriched index or a rowid range, depending on how much is left
+    'enrich.pending': (PENDING_SQL, (0, 50), ['SEARCH books'], ()),
+    'backup.changes': (
+        CHANGED_BOOKS_SQL, (0, 1000),
+        ['USING INTEGER PRIMARY KEY (rowid>?)', 'USING INDEX sqlite_autoindex_books_1 (id=?)'], ()
+    ),
+    'jobs.claim': (CLAIM_SQL, ('2020-01-01 00:00:00', '2020-01-01 00:00:00'), ['USING INDEX idx_jobs_queued'], ()),
+    'similar.vector': (VECTOR_SQL, ('bench-42-00000001',), ['USING PRIMARY KEY (book_id=?)'], ()),
+    'similar.term_df': (TERM_DF_SQL, ('["genre:fantasy"]',), ['USING PRIMARY KEY (term=?)'], ()),
+    # Postings are stored in weight order, so the heaviest are read without sorting
+    'similar.postings': (POSTINGS_SQL, ('genre:fantasy', 500), ['USING PRIMARY KEY (term=?)'], ()),
+    'similar.candidates': (
+        CANDIDATES_SQL.format(columns=CARD_COLUMNS), ('["bench-42-00000001"]',), ['USING INDEX sqlite_autoindex_books_1 (id=?)'], ()
+    ),
+    'trash.purge': (PURGE_SQL, ('2020-01-01 00:00:00', 500), ['USING COVERING INDEX idx_books_deleted'], ()),
+}
+
+
+def query_plan(conn, sql, params):
+    """Return the EXPLAIN QUERY PLAN detail lines of sql"""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_plans(conn, checks=CHECKS):
+    """Return {name: (plan, problems)} for every check whose plan regressed"""
+    failures = {}
+    for name, (sql, params, expected, allowed) in checks.items():
+        plan = query_plan(conn, sql, params)
+        text = "\n".join(plan)
+        problems = [f"missing '{part}'" for part in expected if part not in text]
+        if 'scan' not in allowed:
+            # "SCAN books" without an index reads every row
+            problems += [f"full scan: {line}" for line in plan if line.strip() in ('SCAN books', 'SCAN TABLE books')]
+        if 'sort' not in allowed:
+            problems += [f"sort: {line}" for line in plan if 'USE TEMP B-TREE' in line]
+        if problems:
+            failures[name] = (plan, problems)
+    return failures
+
+
+def copy_database(db_path, dest_path):
+    """Copy a live database with the online backup API, so ANALYZE never writes to it"""
+    source, target = sqlite3.connect(db_path), sqlite3.connect(dest_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the query plan of every data-access query")
+    parser.add_argument("--books", type=int, default=5000, help="size of the generated library")
+    parser.add_argument("--db", help="check against a copy of this database instead of a generated one")
+    parser.add_argument("--verbose", "-v", action="store_true", help="print every plan")
+    args = parser.parse_args(argv)
+
+    folder = tempfile.mkdtemp(prefix="library-plans-")
+    if args.db:
+        from library import Library
+        copy_database(args.db, os.path.join(folder, "plans.db"))
+        library = Library(os.path.join(folder, "plans.db"), pool_size=1)
+    else:
+        library = generate_library(os.path.join(folder, "plans.db"), args.books)
+    with library.pool.connection() as conn:
+        # Plans depend on statistics, as they would on a real library
+        conn.execute("ANALYZE")
+        failures = check_plans(conn)
+        for name, (sql, params, _, _) in CHECKS.items():
+            status = "FAIL" if name in failures else "ok"
+            print(f"{status:4} {name}")
+            if args.verbose or name in failures:
+                for line in query_plan(conn, sql, params):
+                    print(f"       {line}")
+                for problem in failures.get(name, ([], []))[1]:
+                    print(f"     ! {problem}")
+    library.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Benchmark the data layer and page renders against a synthetic library.
+
+Each measurement is repeated and reported as min/median/mean/p95 seconds.
+Results are written as JSON so runs can be compared:
+
+    python -m benchmarks.run --books 100000 --output after.json
+    python -m benchmarks.run --books 100000 --compare before.json
+
+Page renders are measured with Streamlit's AppTest when Streamlit is
+installed; otherwise they are skipped.
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import platform
+import argparse
+import statistics
+import tempfile
+from datetime import datetime
+
+from benchmarks.generate import WORDS, GENRE_NAMES, generate_library
+from library.downloads import download_url
+
+PAGES = ["Home", "List of Available Books", "Search Book", "Remove Book"]
+
+
+def measure(func, repeat, setup=None):
+    """Run func repeat times and summarize the wall-clock timings.
+
+    setup, if given, runs untimed before each call.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        'repeat': repeat,
+        'min': timings[0],
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+    }
+
+
+def bench_data_layer(library, repeat, seed):
+    """Time the data layer; reads are measured with a cold query cache"""
+    rng = random.Random(seed)
+    results = {}
+
+    def measure_cold(func, times):
+        return measure(func, times, setup=library.cache.invalidate)
+
+    queries = [rng.choice(WORDS)[:4] for _ in range(repeat)]
+    results['get_all_books'] = measure_cold(library.all_books, max(1, repeat // 5))
+    results['books_page.first'] = measure_cold(lambda: library.books_page(None), repeat)
+    with library.pool.connection() as conn:
+        deep = conn.execute(
+            "SELECT date_added, id FROM books ORDER BY date_added, id LIMIT 1 OFFSET "
+            "(SELECT COUNT(*) / 2 FROM books)"
+        ).fetchone()
+    results['books_page.middle'] = measure_cold(lambda: library.books_page(deep), repeat)
+    results['search_books.prefix'] = measure_cold(lambda: library.search(queries.pop() if queries else "sha"), repeat)
+    results['search_books.field'] = measure_cold(lambda: library.search(f"genre:{rng.choice(GENRE_NAMES)} {rng.choice(WORDS)}"), repeat)
+    results['home_stats'] = measure_cold(library.stats, repeat)
+    results['home_stats.cached'] = measure(library.stats, repeat)
+
+    added = []
+    results['add_book_to_db'] = measure(lambda: added.append(library.add_book({
+        'title': f"Benchmark {rng.choice(WORDS)} {len(added)}", 'author': "Bench Mark", 'genre': "Other",
+        'description': "", 'published_year': 2020, 'isbn': "", 'cover_image': "",
+    })), repeat)
+    results['remove_book'] = measure(lambda: library.remove_book(added.pop()), repeat)
+    page_ids = [book.id for book in library.books_page(None, 24)]
+    results['remove_books.page'] = measure(
+        lambda: library.remove_books(page_ids), repeat, setup=lambda: library.restore_books(page_ids)
+    )
+    library.restore_books(page_ids)
+
+    page = library.books_page(None, 24)
+    results['get_download_link.page'] = measure(
+        lambda: [download_url("http://localhost:8502", library.blobs.root, book.file_path, book.title) for book in page],
+        repeat
+    )
+    return results
+
+
+def bench_pages(db_path, repeat):
+    """Time full script runs of pl.py per page with Streamlit's AppTest"""
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return None
+    # pl.py runs in this process and reads the path from library.db
+    import library.db
+    library.db.DB_PATH = db_path
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pl.py")
+    results = {}
+    for page in PAGES:
+        def run():
+            app = AppTest.from_file(script, default_timeout=120)
+            app.run()
+            if page != "Home":
+                app.selectbox[0].set_value(page).run()
+        results[f"page.{page}"] = measure(run, repeat)
+    return results
+
+
+def compare(current, baseline):
+    """Print median ratios of the current run against a previous one"""
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if old:
+            ratio = result['median'] / old['median'] if old['median'] else float('inf')
+            print(f"{name:32} {old['median'] * 1000:10.3f} ms -> {result['median'] * 1000:10.3f} ms  x{ratio:.2f}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Personal Library Manager")
+    parser.add_argument("--books", type=int, default=1000, help="library size (e.g. 1000, 100000, 1000000)")
+    parser.add_argument("--files", type=int, default=0, help="books with an attached file")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", help="reuse or create this database instead of a temporary one")
+    parser.add_argument("--pages", action="store_true", help="also time page renders with AppTest")
+    parser.add_argument("--output", "-o", help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="previous JSON results to compare against")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="library-bench-")
+    db_path = args.db or os.path.join(workdir, "bench.db")
+    start = time.perf_counter()
+    if args.db and os.path.exists(args.db):
+        from library import Library
+        library = Library(db_path)
+    else:
+        library = generate_library(db_path, args.books, args.files, seed=args.seed)
+    generate_seconds = time.perf_counter() - start
+
+    results = bench_data_layer(library, args.repeat, args.seed)
+    library.close()
+    if args.pages:
+        results.update(bench_pages(db_path, max(1, args.repeat // 5)) or {})
+
+    report = {
+        'meta': {
+            'books': args.books,
+            'files': args.files,
+            'seed': args.seed,
+            'generate_seconds': generate_seconds,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+"""Core helpers for the Personal Library Manager"""
+
+__all__ = ['Library']
+
+
+def __getattr__(name):
+    # Imported on first use, so "python -m library.trash" and friends don't
+    # import their own module twice through library.core
+    if name == 'Library':
+        from library.core import Library
+        return Library
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,234 @@
+"""Consistent online backups of the library database and uploaded files.
+
+A full backup copies the database with SQLite's online backup API while the
+app keeps running: in WAL mode the copy reads one consistent snapshot and
+never blocks writers. Uploaded files can be copied alongside it.
+
+An incremental backup only holds what changed since the previous backup in
+the same folder: books added, enriched, removed or restored since then (as
+JSON Lines, tombstones included) and uploaded files newer than it. Changed
+books are found by book_changes, which records the library generation of
+every book write, so the manifest only needs the last generation it saw.
+Books that were removed and purged in between are not recorded, so a
+restored chain can still contain them.
+
+Each backup is a timestamped folder with a manifest.json. restore_backup
+rebuilds a database from the newest full backup plus every incremental
+backup taken after it.
+
+Usage:
+    python -m library.backup BACKUP_DIR [--db library.db] [--files] [--incremental]
+    python -m library.backup BACKUP_DIR --restore NEW_DB [--uploads uploads]
+"""
+import os
+import json
+import shutil
+import sqlite3
+import argparse
+from datetime import datetime
+
+from library import dedupe, similar
+from library.models import BOOK_FIELDS
+from library.downloads import UPLOADS_DIR
+from library.trash import TIMESTAMP_FORMAT
+
+MANIFEST = "manifest.json"
+DATABASE_FILE = "library.db"
+CHANGES_FILE = "changes.jsonl"
+UPLOADS_FOLDER = "uploads"
+CHANGE_BATCH = 1000
+
+CHANGE_FIELDS = BOOK_FIELDS + ('enriched_at', 'deleted_at', 'updated_at')
+CHANGED_BOOKS_SQL = f'''
+    SELECT book_changes.change, {", ".join(f"books.{field}" for field in CHANGE_FIELDS)}
+    FROM book_changes JOIN books ON books.id = book_changes.book_id
+    WHERE book_changes.change > ?
+    ORDER BY book_changes.change
+    LIMIT ?
+'''
+UPSERT_BOOK_SQL = f'''
+    INSERT INTO books ({", ".join(CHANGE_FIELDS)}) VALUES ({", ".join("?" * len(CHANGE_FIELDS))})
+    ON CONFLICT (id) DO UPDATE SET {", ".join(f"{field} = excluded.{field}" for field in CHANGE_FIELDS[1:])}
+'''
+
+
+def read_manifests(root):
+    """Return the manifests of the backups in root, oldest first"""
+    manifests = []
+    if os.path.isdir(root):
+        for name in sorted(os.listdir(root)):
+            path = os.path.join(root, name, MANIFEST)
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    manifests.append(dict(json.load(f), path=os.path.join(root, name)))
+    return sorted(manifests, key=lambda manifest: manifest['timestamp'])
+
+
+def snapshot_database(pool, dest_path):
+    """Copy the live database to dest_path with the online backup API"""
+    target = sqlite3.connect(dest_path)
+    try:
+        with pool.connection() as conn:
+            # One step: a single read transaction gives a consistent copy
+            conn.backup(target)
+        # Keep the copy a single self-contained file
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+
+
+def copy_uploads(uploads_dir, dest_dir, since=None):
+    """Copy uploaded files modified after since (a timestamp); return how many were copied"""
+    copied = 0
+    for dirpath, _, filenames in os.walk(uploads_dir):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if name.endswith(".tmp") or (since is not None and os.path.getmtime(path) < since):
+                continue
+            target = os.path.join(dest_dir, os.path.relpath(path, uploads_dir))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(path, target)
+            copied += 1
+    return copied
+
+
+def write_changes(pool, out, last_change):
+    """Write books written after generation last_change as JSON Lines; return the count and last generation written"""
+    count = 0
+    with pool.connection() as conn:
+        while True:
+            rows = conn.execute(CHANGED_BOOKS_SQL, (last_change, CHANGE_BATCH)).fetchall()
+            for row in rows:
+                out.write(json.dumps(dict(zip(CHANGE_FIELDS, row[1:])), ensure_ascii=False) + "\n")
+            count += len(rows)
+            if rows:
+                last_change = rows[-1][0]
+            # A book written meanwhile gets a later generation, so it is in a
+            # later page or the next backup
+            if len(rows) < CHANGE_BATCH:
+                break
+    return count, last_change
+
+
+def backup(library, root, include_files=False, incremental=False):
+    """Back up the library into a new folder under root and return its manifest.
+
+    An incremental backup falls back to a full one when root holds no
+    earlier backup.
+    """
+    started = datetime.now()
+    manifests = read_manifests(root) if incremental else []
+    previous = manifests[-1] if manifests else None
+    folder = os.path.join(root, started.strftime("%Y%m%d-%H%M%S-%f"))
+    os.makedirs(folder)
+
+    manifest = {
+        'created_at': started.strftime(TIMESTAMP_FORMAT),
+        'timestamp': started.timestamp(),
+        'kind': 'incremental' if previous else 'full',
+        'files': include_files,
+    }
+    if previous is None:
+        snapshot_database(library.pool, os.path.join(folder, DATABASE_FILE))
+        conn = sqlite3.connect(os.path.join(folder, DATABASE_FILE))
+        try:
+            manifest['books'] = conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+            manifest['change'] = conn.execute("SELECT COALESCE(MAX(change), 0) FROM book_changes").fetchone()[0]
+        finally:
+            conn.close()
+        since = None
+    else:
+        manifest['since'] = previous['created_at']
+        with open(os.path.join(folder, CHANGES_FILE), "w", encoding="utf-8") as out:
+            # Backups from before book_changes start from scratch once
+            manifest['books'], manifest['change'] = write_changes(library.pool, out, previous.get('change', 0))
+        since = previous['timestamp']
+    if include_files:
+        manifest['uploads'] = copy_uploads(library.blobs.root, os.path.join(folder, UPLOADS_FOLDER), since)
+
+    # The manifest is written last, so a crashed backup is never used as a base
+    with open(os.path.join(folder, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return dict(manifest, path=folder)
+
+
+def _rebuild_blob_refs(conn, blobs):
+    # Reference counts in the snapshot don't include books from later backups
+    conn.execute("DELETE FROM blobs")
+    for file_path, count in conn.execute("SELECT file_path, COUNT(*) FROM books GROUP BY file_path").fetchall():
+        if file_path and os.path.exists(file_path):
+            blobs.add_ref(conn, file_path)
+            conn.execute("UPDATE blobs SET refcount = ? WHERE path = ?", (count, file_path))
+
+
+def restore_backup(root, db_path, uploads_dir=UPLOADS_DIR):
+    """Rebuild a database at db_path from the backups in root; return the manifests applied.
+
+    Book file paths are stored relative to the working directory, so restore
+    the uploads into the same folder the library uses.
+    """
+    from library.core import Library
+
+    if os.path.exists(db_path):
+        raise FileExistsError(db_path)
+    manifests = read_manifests(root)
+    fulls = [i for i, manifest in enumerate(manifests) if manifest['kind'] == 'full']
+    if not fulls:
+        raise FileNotFoundError(f"No full backup in {root}")
+    chain = manifests[fulls[-1]:]
+
+    shutil.copyfile(os.path.join(chain[0]['path'], DATABASE_FILE), db_path)
+    library = Library(db_path, uploads_dir)
+    try:
+        for manifest in chain:
+            changes = os.path.join(manifest['path'], CHANGES_FILE)
+            if os.path.exists(changes):
+                with open(changes, encoding="utf-8") as f, library.pool.transaction() as conn:
+                    books = [json.loads(line) for line in f]
+                    conn.executemany(UPSERT_BOOK_SQL, ([book.get(field) for field in CHANGE_FIELDS] for book in books))
+                    # Restored rows need their duplicate-detection keys and ISBNs
+                    conn.execute(
+                        "UPDATE books SET title_key = NULL WHERE id IN (SELECT value FROM json_each(?))",
+                        (json.dumps([book['id'] for book in books]),)
+                    )
+                    dedupe.backfill(conn)
+                    similar.index_books(conn, (
+                        (book['id'], book['title'], book['author'], book.get('genre'), book.get('description'))
+                        for book in books
+                    ))
+            if manifest['files']:
+                copy_uploads(os.path.join(manifest['path'], UPLOADS_FOLDER), library.blobs.root)
+        with library.pool.transaction() as conn:
+            _rebuild_blob_refs(conn, library.blobs)
+    finally:
+        library.close()
+    return chain
+
+
+def main(argv=None):
+    from library.core import Library
+    from library.db import DB_PATH
+
+    parser = argparse.ArgumentParser(description="Back up or restore the library")
+    parser.add_argument("root", help="folder holding the backups")
+    parser.add_argument("--db", default=DB_PATH, help="library database path")
+    parser.add_argument("--uploads", default=UPLOADS_DIR, help="uploads folder")
+    parser.add_argument("--files", action="store_true", help="also copy uploaded book files")
+    parser.add_argument("--incremental", action="store_true", help="only back up changes since the last backup")
+    parser.add_argument("--restore", metavar="NEW_DB", help="restore the backups into a new database")
+    args = parser.parse_args(argv)
+
+    if args.restore:
+        chain = restore_backup(args.root, args.restore, args.uploads)
+        print(f"Restored {len(chain)} backups into {args.restore}")
+        return
+    library = Library(args.db, args.uploads, pool_size=1)
+    try:
+        manifest = backup(library, args.root, args.files, args.incremental)
+    finally:
+        library.close()
+    print(f"{manifest['kind'].capitalize()} backup of {manifest['books']} books in {manifest['path']}")
+
+
+if __name__ == "__main__":
+    main()
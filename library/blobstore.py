@@ -0,0 +1,128 @@
+"""Content-addressed, deduplicating storage for uploaded book files.
+
+Uploads are streamed to a temporary file in chunks while being hashed, then
+moved to uploads/<aa>/<sha256><ext>. Identical files are stored once; the
+blobs table counts how many books reference each file, and a file is
+deleted when its last book is removed. A file stored for a book that then
+fails to save is discarded at once; sweep_orphans, run by the purger,
+catches any left behind by a crash.
+"""
+import os
+import time
+import hashlib
+import tempfile
+
+from library.downloads import UPLOADS_DIR
+
+CHUNK_SIZE = 1024 * 1024
+# Unreferenced files younger than this may belong to an upload in progress
+ORPHAN_GRACE = 60 * 60
+
+
+class BlobStore:
+    """Store uploaded files once per unique content"""
+
+    def __init__(self, root=UPLOADS_DIR):
+        self.root = root
+
+    def path_for(self, digest, ext):
+        return f"{self.root}/{digest[:2]}/{digest}{ext.lower()}"
+
+    def put(self, fileobj, filename):
+        """Stream fileobj into the store and return its path.
+
+        The file is not referenced yet; add_ref must be called in the same
+        transaction that saves the book.
+        """
+        ext = os.path.splitext(filename)[1]
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    out.write(chunk)
+            path = self.path_for(digest.hexdigest(), ext)
+            if os.path.exists(path):
+                # Same content is already stored
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def _digest(self, path):
+        """Return the digest of a stored path, or None for files outside the store"""
+        if not path or not path.startswith(self.root + "/"):
+            return None
+        name = os.path.splitext(os.path.basename(path))[0]
+        return name if len(name) == 64 else None
+
+    def add_ref(self, conn, path):
+        """Record one more book using path (call inside the book's write transaction)"""
+        digest = self._digest(path)
+        if digest is None:
+            return
+        if not os.path.exists(path):
+            # The last reference was removed and the file reclaimed meanwhile
+            raise FileNotFoundError(path)
+        conn.execute('''
+            INSERT INTO blobs (digest, path, size, refcount) VALUES (?, ?, ?, 1)
+            ON CONFLICT (digest) DO UPDATE SET refcount = refcount + 1
+        ''', (digest, path, os.path.getsize(path)))
+
+    def release(self, conn, path):
+        """Drop one reference to path; return its digest if nothing uses it any more"""
+        digest = self._digest(path)
+        if digest is None:
+            return None
+        conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE digest = ?", (digest,))
+        row = conn.execute("SELECT refcount FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        return digest if row is not None and row[0] <= 0 else None
+
+    def collect(self, pool, digest):
+        """Delete an unreferenced blob and its file; return True if it was removed"""
+        with pool.transaction() as conn:
+            row = conn.execute(
+                "DELETE FROM blobs WHERE digest = ? AND refcount <= 0 RETURNING path", (digest,)
+            ).fetchone()
+            # Unlink while holding the write lock so a concurrent add_ref can't
+            # reference the file between the delete and the unlink
+            if row is not None and os.path.exists(row[0]):
+                os.remove(row[0])
+        return row is not None
+
+    def discard(self, pool, path):
+        """Delete a stored file that no book references, e.g. after its book failed to save"""
+        digest = self._digest(path)
+        if digest is None:
+            return False
+        with pool.transaction() as conn:
+            row = conn.execute("SELECT refcount FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if (row is None or row[0] <= 0) and os.path.exists(path):
+                os.remove(path)
+                return True
+        return False
+
+    def sweep_orphans(self, pool, grace=ORPHAN_GRACE):
+        """Delete stored files that no book references (e.g. failed saves)"""
+        removed = 0
+        cutoff = time.time() - grace
+        with pool.connection() as conn:
+            known = {row[0] for row in conn.execute("SELECT digest FROM blobs WHERE refcount > 0")}
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                stem = os.path.splitext(name)[0]
+                is_orphan = os.path.dirname(dirpath) == self.root.rstrip("/") and len(stem) == 64 and stem not in known
+                if (is_orphan or name.endswith(".tmp")) and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+        with pool.transaction() as conn:
+            conn.execute("DELETE FROM blobs WHERE refcount <= 0")
+        return removed
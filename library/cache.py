@@ -0,0 +1,95 @@
+"""Shared, write-invalidated cache for library read queries.
+
+Results are keyed on the query and its parameters together with a library
+generation counter that every write bumps, so a write makes all older
+entries unreachable at once and a read that raced with a write can never be
+served afterwards. Cached results are frozen (tuples of read-only mappings)
+or immutable records, so every session can share the same objects instead
+of copying them. Changes to the books made by other processes are noticed
+through the library's change feed before every cached read.
+"""
+import threading
+import functools
+from types import MappingProxyType
+from collections import OrderedDict
+
+MAX_ENTRIES = 256
+# Bound on the total number of cached rows, so large result sets can't pin memory
+MAX_ROWS = 50000
+
+
+def freeze(value):
+    """Return a read-only version of a query result"""
+    if isinstance(value, tuple) and hasattr(value, '_fields'):
+        # Named tuples such as Book are already immutable
+        return value
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def row_count(result):
+    """Rows a frozen result holds: its length for a list of results, else 1"""
+    if isinstance(result, tuple) and not hasattr(result, '_fields'):
+        return len(result)
+    return 1
+
+
+class QueryCache:
+    """An LRU cache of frozen query results tied to a generation counter"""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_rows=MAX_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Start a new generation; call after every write to the library"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._rows = 0
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            # Take the generation before reading, so a concurrent write makes
+            # this result unreachable rather than stale
+            key = (self.generation, key)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        result = freeze(compute())
+        rows = row_count(result)
+        if rows > self.max_rows:
+            return result
+
+        with self._lock:
+            if key[0] == self.generation and key not in self._entries:
+                self._entries[key] = result
+                self._rows += rows
+                while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._rows -= row_count(evicted)
+        return result
+
+
+def cached_query(method):
+    """Serve a Library read method from self.cache, keyed on its arguments"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        # Writes by other processes only show up in the change feed
+        if self.changes is not None and self.changes.poll():
+            self._changed()
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        return self.cache.get_or_compute(key, lambda: method(self, *args, **kwargs))
+    return wrapper
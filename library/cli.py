@@ -0,0 +1,252 @@
+"""Command line interface for the library.
+
+Usage:
+    python -m library [--db library.db] add --title T --author A [--file book.pdf] ...
+    python -m library search "author:orwell" [--contents] [--genre G ...]
+    python -m library list [--limit N] [--years FIRST LAST] [--genre G] [--author A] [--decade 1990] [--has-file yes]
+    python -m library facets genre|author|decade|has_file [--limit N]
+    python -m library similar BOOK_ID [--limit N]
+    python -m library remove BOOK_ID [BOOK_ID ...]
+    python -m library restore BOOK_ID [BOOK_ID ...]
+    python -m library purge [--grace SECONDS]
+    python -m library sweep [--grace SECONDS]
+    python -m library import catalog.csv [--format goodreads] [--skip-possible-duplicates]
+    python -m library export [--format csv|jsonl|parquet] [--output books.csv]
+    python -m library backup BACKUP_DIR [--files] [--incremental]
+"""
+import sys
+import json
+import argparse
+
+from library.core import Library
+from library.dedupe import DuplicateBook, PossibleDuplicate
+from library.facets import FACET_LIMIT, FACETS, selection
+from library.backup import backup
+from library.blobstore import ORPHAN_GRACE
+from library.export import EXPORT_FORMATS, export_books
+from library.db import DB_PATH
+from library.importer import FORMATS as IMPORT_FORMATS, report_possible_duplicates, summary
+from library.search import SEARCH_LIMIT
+from library.similar import SIMILAR_LIMIT
+
+
+def print_books(books, as_json):
+    for book in books:
+        if as_json:
+            print(json.dumps(book._asdict(), ensure_ascii=False))
+        else:
+            print(f"{book.id}\t{book.title}\t{book.author}\t{book.published_year or ''}")
+
+
+def cmd_add(library, args):
+    book = {
+        'title': args.title,
+        'author': args.author,
+        'genre': args.genre,
+        'description': args.description,
+        'published_year': args.year,
+        'isbn': args.isbn,
+        'cover_image': args.cover or f"https://via.placeholder.com/150?text={args.title.replace(' ', '+')}",
+    }
+    try:
+        if args.file:
+            with open(args.file, 'rb') as f:
+                print(library.add_book(book, allow_duplicate=args.allow_duplicate, fileobj=f, filename=args.file))
+        else:
+            print(library.add_book(book, allow_duplicate=args.allow_duplicate))
+    except PossibleDuplicate as e:
+        print(f"{e} (id {e.existing.id}); use --allow-duplicate to add it anyway", file=sys.stderr)
+        return 1
+    except DuplicateBook as e:
+        print(f"{e} (id {e.existing.id}, same ISBN)", file=sys.stderr)
+        return 1
+
+
+def cmd_search(library, args):
+    if args.contents:
+        for book in library.search_contents(args.query):
+            print(f"{book['id']}\t{book['title']}\t{book['author']}")
+            for match in book['matches']:
+                print(f"    {match['location']}: {match['snippet']}")
+    else:
+        print_books(library.search(args.query, args.limit, selection=_selection(args)), args.json)
+
+
+def cmd_list(library, args):
+    if args.years:
+        print_books(library.published_between(*args.years, limit=args.limit or SEARCH_LIMIT), args.json)
+        return
+    books = library.iter_books(selection=_selection(args))
+    if args.limit:
+        books = (book for _, book in zip(range(args.limit), books))
+    print_books(books, args.json)
+
+
+def cmd_facets(library, args):
+    for value, count in library.facet_counts(args.facet, args.limit):
+        print(f"{count}\t{value}")
+
+
+def cmd_similar(library, args):
+    if library.get_book(args.id) is None:
+        print(f"No book with id {args.id}", file=sys.stderr)
+        return 1
+    print_books(library.similar_books(args.id, args.limit), args.json)
+
+
+def _add_facet_arguments(parser):
+    group = parser.add_argument_group("facets", "narrow to books with any of the given values (repeatable)")
+    for facet in FACETS:
+        group.add_argument(f"--{facet.replace('_', '-')}", dest=facet, action="append", metavar="VALUE")
+
+
+def _selection(args):
+    return selection({facet: getattr(args, facet) for facet in FACETS})
+
+
+def _report_missing(ids, found):
+    missing = [book_id for book_id in ids if book_id not in set(found)]
+    for book_id in missing:
+        print(f"No book with id {book_id}", file=sys.stderr)
+    return 1 if missing else 0
+
+
+def cmd_remove(library, args):
+    return _report_missing(args.ids, library.remove_books(args.ids))
+
+
+def cmd_restore(library, args):
+    return _report_missing(args.ids, library.restore_books(args.ids))
+
+
+def cmd_purge(library, args):
+    print(f"Purged {library.purge_deleted(args.grace)} books")
+
+
+def cmd_sweep(library, args):
+    print(f"Deleted {library.sweep_orphans(args.grace)} unused files")
+
+
+def cmd_import(library, args):
+    def report(stats):
+        print(f"\r{summary(stats)}", end="", file=sys.stderr)
+
+    with open(args.path, newline='', encoding='utf-8-sig') as f:
+        stats = library.import_file(f, args.path, args.format, progress=report,
+                                    skip_possible_duplicates=args.skip_possible_duplicates)
+    print(file=sys.stderr)
+    report_possible_duplicates(stats)
+
+
+def cmd_export(library, args):
+    if args.format == 'parquet':
+        if not args.output:
+            print("Parquet export needs --output", file=sys.stderr)
+            return 2
+        try:
+            export_books(library, args.output, args.format)
+        except ImportError:
+            print("Parquet export needs the pyarrow package", file=sys.stderr)
+            return 1
+        return 0
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        export_books(library, out, args.format)
+    finally:
+        if args.output:
+            out.close()
+
+
+def cmd_backup(library, args):
+    manifest = backup(library, args.root, args.files, args.incremental)
+    print(f"{manifest['kind'].capitalize()} backup of {manifest['books']} books in {manifest['path']}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="library", description="Manage your personal library")
+    parser.add_argument("--db", default=DB_PATH, help="library database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add a book")
+    add.add_argument("--title", required=True)
+    add.add_argument("--author", required=True)
+    add.add_argument("--genre", default="Other")
+    add.add_argument("--description", default="")
+    add.add_argument("--year", type=int)
+    add.add_argument("--isbn", default="")
+    add.add_argument("--cover", help="cover image URL")
+    add.add_argument("--file", help="book file (PDF, EPUB, TXT) to upload")
+    add.add_argument("--allow-duplicate", action="store_true", help="add the book even if one with the same title and author is already there")
+    add.set_defaults(func=cmd_add)
+
+    search = commands.add_parser("search", help="search the library")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=20)
+    search.add_argument("--contents", action="store_true", help="search inside uploaded book files")
+    search.add_argument("--json", action="store_true", help="print JSON lines")
+    _add_facet_arguments(search)
+    search.set_defaults(func=cmd_search)
+
+    list_ = commands.add_parser("list", help="list books in the order they were added")
+    list_.add_argument("--limit", type=int)
+    list_.add_argument("--years", type=int, nargs=2, metavar=("FIRST", "LAST"),
+                       help="only books first published in these years, oldest first")
+    list_.add_argument("--json", action="store_true", help="print JSON lines")
+    _add_facet_arguments(list_)
+    list_.set_defaults(func=cmd_list)
+
+    facets_ = commands.add_parser("facets", help="count books per genre, author, decade or has-file")
+    facets_.add_argument("facet", choices=FACETS)
+    facets_.add_argument("--limit", type=int, default=FACET_LIMIT)
+    facets_.set_defaults(func=cmd_facets)
+
+    similar = commands.add_parser("similar", help="list the books most like a book")
+    similar.add_argument("id")
+    similar.add_argument("--limit", type=int, default=SIMILAR_LIMIT)
+    similar.add_argument("--json", action="store_true", help="print JSON lines")
+    similar.set_defaults(func=cmd_similar)
+
+    remove = commands.add_parser("remove", help="remove books by id (undo with restore)")
+    remove.add_argument("ids", nargs="+")
+    remove.set_defaults(func=cmd_remove)
+
+    restore = commands.add_parser("restore", help="restore removed books that have not been purged")
+    restore.add_argument("ids", nargs="+")
+    restore.set_defaults(func=cmd_restore)
+
+    purge = commands.add_parser("purge", help="permanently delete removed books and their files")
+    purge.add_argument("--grace", type=int, default=0, help="keep books removed less than this many seconds ago")
+    purge.set_defaults(func=cmd_purge)
+
+    sweep = commands.add_parser("sweep", help="delete uploaded files that no book uses")
+    sweep.add_argument("--grace", type=int, default=ORPHAN_GRACE,
+                       help="keep files stored less than this many seconds ago (an upload may be in progress)")
+    sweep.set_defaults(func=cmd_sweep)
+
+    import_ = commands.add_parser("import", help="bulk import a catalog file")
+    import_.add_argument("path")
+    import_.add_argument("--format", choices=IMPORT_FORMATS)
+    import_.add_argument("--skip-possible-duplicates", action="store_true",
+                         help="skip rows with the title and author of a book already there")
+    import_.set_defaults(func=cmd_import)
+
+    export = commands.add_parser("export", help="export every book")
+    export.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    export.add_argument("--output", "-o", help="output file (default: stdout)")
+    export.set_defaults(func=cmd_export)
+
+    backup_ = commands.add_parser("backup", help="back up the database while the app is running")
+    backup_.add_argument("root", help="folder holding the backups")
+    backup_.add_argument("--files", action="store_true", help="also copy uploaded book files")
+    backup_.add_argument("--incremental", action="store_true", help="only back up changes since the last backup")
+    backup_.set_defaults(func=cmd_backup)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    library = Library(args.db, pool_size=1)
+    try:
+        return args.func(library, args) or 0
+    finally:
+        library.close()
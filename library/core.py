@@ -0,0 +1,322 @@
+"""Headless Python API for the library.
+
+Library wraps the connection pool, migrations, blob store and search so the
+same data access works from the Streamlit app, the command line, cron jobs
+and tests without importing Streamlit or pandas. Read methods return Book
+records from a cache that every write invalidates.
+
+    from library import Library
+
+    library = Library("library.db")
+    library.add_book({'title': 'Dune', 'author': 'Frank Herbert'})
+    for book in library.search("author:herbert"):
+        print(book.title)
+"""
+import uuid
+from datetime import datetime
+
+from library.db import DB_PATH, POOL_SIZE, ConnectionPool
+from library.migrations import migrate
+from library.downloads import UPLOADS_DIR
+from library.blobstore import ORPHAN_GRACE, BlobStore
+from library.search import SEARCH_LIMIT, SEARCH_SQL, build_match_query
+from library.stats import library_stats
+from library.models import BOOK_FIELDS, book_columns, books_from_cursor
+from library.cache import QueryCache, cached_query
+from library.instrument import timed
+from library import dedupe, facets, fulltext, similar, trash, workers
+
+# Fields the book cards actually render
+CARD_FIELDS = ('id', 'title', 'author', 'genre', 'published_year', 'isbn', 'cover_image', 'date_added', 'file_path')
+PAGE_SIZE = 24
+ITER_BATCH = 500
+
+# Every read below is listed in benchmarks/plans.py with the index it must use
+BOOK_BY_ID_SQL = f"SELECT {book_columns()} FROM books WHERE id = ? AND deleted_at IS NULL"
+ALL_BOOKS_SQL = f"SELECT {book_columns()} FROM books WHERE deleted_at IS NULL"
+# {filters} is where facets.facet_filters narrows a page to a facet selection
+FIRST_PAGE_SQL = "SELECT {columns} FROM books WHERE deleted_at IS NULL{filters} ORDER BY date_added, id LIMIT ?"
+NEXT_PAGE_SQL = '''
+    SELECT {columns} FROM books
+    WHERE deleted_at IS NULL{filters} AND (date_added, id) > (?, ?)
+    ORDER BY date_added, id
+    LIMIT ?
+'''
+PUBLISHED_BETWEEN_SQL = f'''
+    SELECT {book_columns(CARD_FIELDS)} FROM books
+    WHERE deleted_at IS NULL AND published_year BETWEEN ? AND ?
+    ORDER BY published_year, title
+    LIMIT ?
+'''
+
+INSERT_BOOK_SQL = '''
+    INSERT INTO books (id, title, author, genre, description, published_year, isbn, cover_image, date_added, file_path,
+                       title_key, author_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+class Library:
+    """The book collection stored in one SQLite database and uploads folder"""
+
+    def __init__(self, db_path=DB_PATH, uploads_dir=UPLOADS_DIR, pool_size=POOL_SIZE, multi_worker=workers.MULTI_WORKER):
+        # Several processes share the database: queue writes across all of
+        # them (see library.workers)
+        self.multi_worker = multi_worker
+        write_lock = workers.FileLock(workers.lock_path(db_path, "write")) if multi_worker else None
+        self.pool = ConnectionPool(db_path, size=pool_size, write_lock=write_lock)
+        # Bring the schema up to date once, when the library is opened
+        with self.pool.connection() as conn:
+            migrate(conn, self.pool.write_lock)
+        self.blobs = BlobStore(uploads_dir)
+        # Optional fulltext.ContentIndexer; without one, files are indexed inline
+        self.indexer = None
+        # Optional jobs.JobQueue running slow work off the caller's thread
+        self.jobs = None
+        self.cache = QueryCache()
+        # Commits by other processes (CLI, imports, jobs) clear the cache too
+        self.changes = workers.ChangeFeed(db_path)
+        # Callables run after every write, e.g. to clear caches
+        self.on_change = []
+
+    def _changed(self):
+        self.cache.invalidate()
+        for callback in self.on_change:
+            callback()
+
+    def _index_file(self, path):
+        """Index a saved book's file; never raises, as the book is already committed"""
+        # As a job, indexing survives a restart and can run in another process
+        if self.jobs is not None and fulltext.indexable(path):
+            try:
+                self.jobs.submit('index_contents', {'path': path})
+                return
+            except Exception:
+                # A busy database; index the file here instead
+                pass
+        if self.indexer is not None:
+            self.indexer.submit(path)
+        else:
+            fulltext.index_file(self.pool, path)
+
+    @timed("library.add_book")
+    def add_book(self, book_data, allow_duplicate=False, fileobj=None, filename=None):
+        """Insert a book and return its id. Missing id and date_added are filled in.
+
+        fileobj, an open binary file named filename, is stored as the book's
+        file, and deleted again if the book can't be saved.
+
+        Raises dedupe.DuplicateBook if a book in the library has the same
+        ISBN, and dedupe.PossibleDuplicate (unless allow_duplicate) if one has
+        the same or a very similar title by the same author.
+        """
+        book_data = dict(book_data)
+        book_data.setdefault('id', str(uuid.uuid4()))
+        book_data.setdefault('date_added', datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        if fileobj is not None:
+            book_data['file_path'] = self.store_file(fileobj, filename)
+        try:
+            self._insert_book(book_data, allow_duplicate)
+        except BaseException:
+            if fileobj is not None:
+                self.blobs.discard(self.pool, book_data['file_path'])
+            raise
+        self._changed()
+        # Index the uploaded file's text
+        self._index_file(book_data.get('file_path'))
+        return book_data['id']
+
+    def _insert_book(self, book_data, allow_duplicate):
+        file_path = book_data.get('file_path') or ''
+        # Store one ISBN-13; every ISBN given goes into the identifiers table
+        isbns = dedupe.parse_isbns(book_data.get('isbn'))
+        with self.pool.transaction() as conn:
+            # Checked under the write lock, so a double click can't add the book twice
+            existing = dedupe.find_isbn_duplicate(conn, book_data.get('isbn'))
+            if existing is not None:
+                raise dedupe.DuplicateBook(existing)
+            existing = None if allow_duplicate else dedupe.find_similar(conn, book_data['title'], book_data['author'])
+            if existing is not None:
+                raise dedupe.PossibleDuplicate(existing)
+            self.blobs.add_ref(conn, file_path)
+            conn.execute(INSERT_BOOK_SQL, (
+                book_data['id'],
+                book_data['title'],
+                book_data['author'],
+                book_data.get('genre', ''),
+                book_data.get('description', ''),
+                book_data.get('published_year'),
+                isbns[0] if isbns else book_data.get('isbn', ''),
+                book_data.get('cover_image', ''),
+                book_data['date_added'],
+                file_path,
+                *dedupe.book_keys(book_data['title'], book_data['author'])
+            ))
+            dedupe.add_identifiers(conn, [(book_data['id'], book_data.get('isbn'))])
+            similar.index_books(conn, [(book_data['id'], book_data['title'], book_data['author'],
+                                        book_data.get('genre', ''), book_data.get('description', ''))])
+
+    @timed("library.store_file")
+    def store_file(self, fileobj, filename):
+        """Stream a book file into the blob store and return the path to save with the book"""
+        return self.blobs.put(fileobj, filename)
+
+    @timed("library.remove_book")
+    def remove_book(self, book_id):
+        """Remove one book (undoable until purged). Returns False if not found."""
+        return bool(self.remove_books([book_id]))
+
+    @timed("library.remove_books")
+    def remove_books(self, book_ids):
+        """Remove books in one transaction and return the removed ids.
+
+        Books are only tombstoned; restore_books undoes the removal until
+        purge_deleted deletes them and reclaims their files.
+        """
+        with self.pool.transaction() as conn:
+            removed = trash.soft_delete(conn, book_ids)
+        if removed:
+            self._changed()
+        return removed
+
+    @timed("library.restore_books")
+    def restore_books(self, book_ids):
+        """Undo the removal of books that have not been purged yet"""
+        with self.pool.transaction() as conn:
+            restored = trash.restore(conn, book_ids)
+        if restored:
+            self._changed()
+        return restored
+
+    @timed("library.purge_deleted")
+    def purge_deleted(self, grace=trash.PURGE_GRACE):
+        """Permanently delete books removed more than grace seconds ago, then compact"""
+        purged = trash.purge(self.pool, self.blobs, grace)
+        if purged:
+            trash.incremental_vacuum(self.pool)
+        return purged
+
+    @timed("library.sweep_orphans")
+    def sweep_orphans(self, grace=ORPHAN_GRACE):
+        """Delete uploaded files no book uses that are older than grace seconds; return how many"""
+        return self.blobs.sweep_orphans(self.pool, grace)
+
+    @timed("library.find_duplicate")
+    def find_duplicate(self, title, author, isbn=None):
+        """Return the book in the library that this one would duplicate, or None"""
+        with self.pool.connection() as conn:
+            return dedupe.find_duplicate(conn, title, author, isbn)
+
+    @timed("library.get_book")
+    @cached_query
+    def get_book(self, book_id):
+        with self.pool.connection() as conn:
+            books = books_from_cursor(conn.execute(BOOK_BY_ID_SQL, (book_id,)))
+        return books[0] if books else None
+
+    @timed("library.all_books")
+    @cached_query
+    def all_books(self):
+        with self.pool.connection() as conn:
+            return books_from_cursor(conn.execute(ALL_BOOKS_SQL))
+
+    def _books_page(self, cursor, limit, fields, selection=()):
+        columns = book_columns(fields)
+        filters, params = facets.facet_filters(selection)
+        with self.pool.connection() as conn:
+            if cursor is None:
+                return books_from_cursor(conn.execute(
+                    FIRST_PAGE_SQL.format(columns=columns, filters=filters), (*params, limit)
+                ))
+            return books_from_cursor(conn.execute(
+                NEXT_PAGE_SQL.format(columns=columns, filters=filters), (*params, cursor[0], cursor[1], limit)
+            ))
+
+    @timed("library.books_page")
+    @cached_query
+    def books_page(self, cursor=None, limit=PAGE_SIZE, fields=CARD_FIELDS, selection=()):
+        """Return one page of books ordered by date added.
+
+        Pages are keyed on the (date_added, id) of the last row shown, so each
+        page is an index range scan no matter how deep into the library it is.
+        Fields not in fields are None. selection (see facets.selection)
+        narrows the pages to books matching the chosen facet values.
+        """
+        return self._books_page(cursor, limit, fields, selection)
+
+    def iter_books(self, fields=BOOK_FIELDS, batch=ITER_BATCH, selection=()):
+        """Stream every book (or those matching selection) in date-added order, one uncached page at a time"""
+        cursor = None
+        while True:
+            page = self._books_page(cursor, batch, fields, selection)
+            yield from page
+            if len(page) < batch:
+                return
+            cursor = (page[-1].date_added, page[-1].id)
+
+    @timed("library.published_between")
+    @cached_query
+    def published_between(self, first_year, last_year, limit=SEARCH_LIMIT):
+        """Books first published in the given years (inclusive), oldest first"""
+        with self.pool.connection() as conn:
+            return books_from_cursor(conn.execute(PUBLISHED_BETWEEN_SQL, (first_year, last_year, limit)))
+
+    @timed("library.search")
+    @cached_query
+    def search(self, query, limit=SEARCH_LIMIT, selection=()):
+        """Ranked search over title, author, genre, description and ISBN"""
+        match = build_match_query(query)
+        if match is None:
+            return []
+        filters, params = facets.facet_filters(selection, table="books")
+        with self.pool.connection() as conn:
+            return books_from_cursor(conn.execute(SEARCH_SQL.format(filters=filters), (match, *params, limit)))
+
+    @timed("library.search_contents")
+    def search_contents(self, query):
+        """Search inside uploaded book files.
+
+        Not cached: files are indexed in the background, after the write that
+        added them.
+        """
+        with self.pool.connection() as conn:
+            return fulltext.search_contents(conn, query)
+
+    @timed("library.facet_counts")
+    @cached_query
+    def facet_counts(self, facet, limit=facets.FACET_LIMIT):
+        """[(value, count)] of live books for one of facets.FACETS"""
+        with self.pool.connection() as conn:
+            return facets.facet_counts(conn, facet, limit)
+
+    @timed("library.similar_books")
+    @cached_query
+    def similar_books(self, book_id, limit=similar.SIMILAR_LIMIT, fields=CARD_FIELDS):
+        """Live books most like book_id by title, author, genre and description"""
+        with self.pool.connection() as conn:
+            return similar.similar_books(conn, book_id, limit, fields)
+
+    @timed("library.stats")
+    @cached_query
+    def stats(self):
+        with self.pool.connection() as conn:
+            return library_stats(conn)
+
+    @timed("library.import_file")
+    def import_file(self, f, filename, fmt=None, progress=None, skip_possible_duplicates=False):
+        """Bulk import an open CSV/JSON Lines/JSON/Goodreads text file"""
+        from library.importer import import_file
+        try:
+            return import_file(self.pool, f, filename, fmt, progress=progress,
+                               skip_possible_duplicates=skip_possible_duplicates)
+        finally:
+            self._changed()
+
+    def leader(self, job):
+        """A workers.Leader deciding which process runs a background job; None with a single process"""
+        return workers.Leader(self.pool.path, job) if self.multi_worker else None
+
+    def close(self):
+        if self.changes is not None:
+            self.changes.close()
+        self.pool.close()
@@ -0,0 +1,96 @@
+"""Shared SQLite connection pool for the library database.
+
+Streamlit re-runs the whole script on every interaction, so opening a fresh
+connection per query adds connect and fsync cost to every click. The pool
+keeps a few long-lived connections configured for concurrent access (WAL
+journaling, relaxed fsync, memory-mapped reads and a busy timeout) and hands
+them out to whichever session thread needs one.
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from library.instrument import trace_statement
+
+DB_PATH = os.getenv("LIBRARY_DB", "library.db")
+
+POOL_SIZE = 4
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE = 256 * 1024 * 1024
+# Statements are compiled once per connection and reused from this cache
+CACHED_STATEMENTS = 256
+
+
+def connect(path=DB_PATH):
+    """Open a connection with the pragmas the library relies on"""
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,  # transactions are managed explicitly
+        check_same_thread=False,  # connections move between session threads
+        cached_statements=CACHED_STATEMENTS,
+    )
+    # Takes effect on new databases only; see trash.full_vacuum for old ones.
+    # Setting it waits for the write lock, so skip it once the file exists.
+    if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    # Count statements for the instrumentation panel and metrics
+    conn.set_trace_callback(trace_statement)
+    return conn
+
+
+class ConnectionPool:
+    """A fixed-size, thread-safe pool of SQLite connections"""
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, write_lock=None):
+        self.path = path
+        # Writers queue here rather than on SQLite's busy timeout; pass a
+        # workers.FileLock to queue the writers of every process together
+        self.write_lock = write_lock or threading.Lock()
+        self._idle = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._idle.put(connect(path))
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for reads; it is returned to the pool afterwards"""
+        conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a connection inside a write transaction.
+
+        BEGIN IMMEDIATE takes the write lock up front, so concurrent writers
+        wait on the busy timeout instead of failing with "database is locked"
+        when a read transaction tries to upgrade. Writers of this pool take
+        turns on write_lock first, before borrowing a connection, so queued
+        writes don't hold connections readers need.
+        """
+        with self.write_lock, self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,204 @@
+"""Duplicate detection for books being added or imported.
+
+Only a shared ISBN makes two books certainly the same. A matching title
+and author is only a likely duplicate, since series volumes and different
+works by one author can look alike; callers warn about those and let the
+user keep the book.
+
+- Every ISBN a book is known by (ISBN-10s converted to ISBN-13) is stored
+  in the indexed book_identifiers table, so an edition ISBN from any lookup
+  finds the book.
+- books.title_key and books.author_key hold the title without case,
+  accents, punctuation or leading article (subtitles and volume numbers
+  are kept), and the first author's surname without suffixes like "Jr.".
+- Near duplicates ("The Hobbit: or, There and Back Again" by "Tolkien, J.R.R.")
+  are found by comparing title trigrams, but only against books by an
+  author with the same key, which the index narrows to a handful of rows.
+  Titles with different volume numbers never match.
+"""
+import re
+import unicodedata
+
+from library.models import BOOK_FIELDS, Book
+
+# Trigram (Jaccard) similarity at which two titles by one author are the same book
+TITLE_SIMILARITY = 0.75
+# Books by one author compared per check; keeps prolific authors fast
+BLOCK_LIMIT = 500
+
+ARTICLES = ('the', 'a', 'an', 'le', 'la', 'les', 'el', 'der', 'die', 'das')
+# Name suffixes skipped when taking an author's surname
+NAME_SUFFIXES = ('jr', 'sr', 'ii', 'iii', 'iv', 'v', 'phd', 'md', 'esq')
+# Title words that number a volume: "Book 2", "Part III"
+ROMAN_NUMERALS = frozenset(
+    'i ii iii iv v vi vii viii ix x xi xii xiii xiv xv xvi xvii xviii xix xx'.split()
+)
+
+DUPLICATE_BY_ISBN_SQL = f'''
+    SELECT {", ".join(f"books.{field}" for field in BOOK_FIELDS)}
+    FROM book_identifiers
+    JOIN books ON books.id = book_identifiers.book_id
+    WHERE book_identifiers.isbn13 = ? AND books.deleted_at IS NULL
+'''
+SAME_AUTHOR_SQL = f'''
+    SELECT title_key, {", ".join(BOOK_FIELDS)} FROM books
+    WHERE author_key = ? AND deleted_at IS NULL
+    LIMIT {BLOCK_LIMIT}
+'''
+
+
+class DuplicateBook(Exception):
+    """Raised when a book being added has the ISBN of a book already in the library"""
+
+    def __init__(self, existing):
+        super().__init__(self.message(existing))
+        self.existing = existing
+
+    def message(self, existing):
+        return f"'{existing.title}' by {existing.author} is already in your library"
+
+
+class PossibleDuplicate(DuplicateBook):
+    """Raised when a book being added has the title and author of one already there; add it with allow_duplicate"""
+
+    def message(self, existing):
+        return f"Your library already has '{existing.title}' by {existing.author}, which looks like the same book"
+
+
+def _isbn13_check_digit(digits):
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits[:12]))
+    return str((10 - total % 10) % 10)
+
+
+def isbn13(value):
+    """Return value as a valid ISBN-13, converting ISBN-10s, or None if it isn't an ISBN"""
+    value = re.sub(r'[^0-9Xx]', '', str(value or '')).upper()
+    if len(value) == 10:
+        if not value[:9].isdigit():
+            return None
+        total = sum((10 - i) * int(d) for i, d in enumerate(value[:9]))
+        check = (11 - total % 11) % 11
+        if value[9] != ('X' if check == 10 else str(check)):
+            return None
+        value = '978' + value[:9]
+        return value + _isbn13_check_digit(value)
+    if len(value) == 13 and value.isdigit() and value[:3] in ('978', '979'):
+        return value if value[12] == _isbn13_check_digit(value) else None
+    return None
+
+
+def parse_isbns(text):
+    """Return the distinct valid ISBN-13s in free text such as "0-261-10221-4, 9780261102217" """
+    isbns = (isbn13(part) for part in re.split(r'[,;/|\s]+(?=[0-9])', str(text or '')))
+    return list(dict.fromkeys(isbn for isbn in isbns if isbn))
+
+
+def normalize(text):
+    """Casefold text and strip accents and punctuation, leaving space-separated words"""
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    return ' '.join(re.sub(r'[^\w]+', ' ', text.replace('&', ' and ')).split())
+
+
+def title_key(title):
+    """Normalize a title for matching: no leading article, case or punctuation"""
+    words = normalize(title).split()
+    if len(words) > 1 and words[0] in ARTICLES:
+        words = words[1:]
+    return ' '.join(words)
+
+
+def author_key(author):
+    """Normalize the first author to their surname, accepting "First Last" and "Last, First" """
+    first = re.split(r'\s*(?:;|&|\band\b|\bwith\b)\s*', str(author or ''), maxsplit=1)[0]
+    # "King, Martin Luther, Jr." and "Martin Luther King, Jr." end in a suffix part
+    parts = [part.strip() for part in first.split(',') if part.strip() and normalize(part) not in NAME_SUFFIXES]
+    if len(parts) == 2 and ' ' not in parts[1].strip('. '):
+        # "Tolkien, J.R.R." lists the surname first
+        first = f"{parts[1]} {parts[0]}"
+    elif parts:
+        first = parts[0]
+    words = normalize(first).split()
+    while len(words) > 1 and words[-1] in NAME_SUFFIXES:
+        words.pop()
+    return words[-1] if words else ''
+
+
+def volume_numbers(key):
+    """The numbers in a title key, e.g. {'2'} for "wheel of time 2" """
+    return {word for word in key.split() if word.isdigit() or word in ROMAN_NUMERALS}
+
+
+def trigrams(text):
+    text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def similarity(a, b):
+    """Jaccard similarity of the trigram sets of two strings"""
+    a, b = trigrams(a), trigrams(b)
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def book_keys(title, author):
+    return title_key(title), author_key(author)
+
+
+def add_identifiers(conn, rows):
+    """Record the ISBNs of books; rows are (book_id, isbn text) pairs"""
+    conn.executemany(
+        "INSERT OR IGNORE INTO book_identifiers (isbn13, book_id) VALUES (?, ?)",
+        [(isbn, book_id) for book_id, text in rows for isbn in parse_isbns(text)]
+    )
+
+
+def find_isbn_duplicate(conn, isbn):
+    """Return the live Book sharing one of the ISBNs in isbn, or None"""
+    for isbn13_value in parse_isbns(isbn):
+        row = conn.execute(DUPLICATE_BY_ISBN_SQL, (isbn13_value,)).fetchone()
+        if row is not None:
+            return Book._make(row)
+    return None
+
+
+def find_similar(conn, title, author):
+    """Return the live Book by the same author with the same or a very similar title, or None"""
+    key_title, key_author = book_keys(title, author)
+    if not key_title:
+        return None
+    numbers = volume_numbers(key_title)
+    best, best_score = None, TITLE_SIMILARITY
+    for row in conn.execute(SAME_AUTHOR_SQL, (key_author,)):
+        if row[0] == key_title:
+            return Book._make(row[1:])
+        # Volume 1 and volume 2 of a series are different books however alike
+        if volume_numbers(row[0] or '') != numbers:
+            continue
+        score = similarity(row[0] or '', key_title)
+        if score >= best_score:
+            best, best_score = Book._make(row[1:]), score
+    return best
+
+
+def find_duplicate(conn, title, author, isbn=None):
+    """Return the live Book that title/author/isbn duplicates (by ISBN first), or None"""
+    return find_isbn_duplicate(conn, isbn) or find_similar(conn, title, author)
+
+
+def backfill(conn, batch_size=5000):
+    """Fill in keys and identifiers for books that have no title_key yet"""
+    last_rowid = 0
+    while True:
+        rows = conn.execute('''
+            SELECT rowid, id, title, author, isbn FROM books
+            WHERE title_key IS NULL AND rowid > ?
+            ORDER BY rowid LIMIT ?
+        ''', (last_rowid, batch_size)).fetchall()
+        if not rows:
+            return
+        conn.executemany(
+            "UPDATE books SET title_key = ?, author_key = ? WHERE rowid = ?",
+            [(*book_keys(title, author), rowid) for rowid, _, title, author, _ in rows]
+        )
+        add_identifiers(conn, [(book_id, isbn) for _, book_id, _, _, isbn in rows])
+        last_rowid = rows[-1][0]
@@ -0,0 +1,185 @@
+"""Streaming download server for uploaded book files.
+
+Book cards used to inline each file as a base64 data: URI, so the cost of a
+page render grew with the total size of the library. Instead, a small HTTP
+server runs next to Streamlit and streams files from the uploads folder with
+sendfile, supporting Range requests so browsers can resume downloads. It also
+serves the content-addressed cover thumbnails, which browsers may cache
+forever.
+
+The server has no authentication, so it listens on the loopback interface
+unless told otherwise, and only to a base URL the links can point at; the
+/metrics page is only answered to local clients.
+"""
+import os
+import re
+import ipaddress
+import threading
+import mimetypes
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit, parse_qs
+
+UPLOADS_DIR = "uploads"
+CHUNK_SIZE = 1024 * 1024
+LOCAL_HOST = "127.0.0.1"
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def is_loopback(host):
+    """True if host only accepts connections from this machine"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        # A hostname, or "" for every interface
+        return False
+
+
+def resolve_upload(root, rel_path):
+    """Return the absolute path of rel_path inside root, or None if it escapes root"""
+    root = os.path.realpath(root)
+    full_path = os.path.realpath(os.path.join(root, rel_path))
+    if os.path.commonpath([root, full_path]) != root or not os.path.isfile(full_path):
+        return None
+    return full_path
+
+
+def parse_range(header, size):
+    """Parse a single-range Range header into (start, end) inclusive.
+
+    Returns None when the header should be ignored (missing or multi-range)
+    and raises ValueError when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+class DownloadHandler(BaseHTTPRequestHandler):
+    """Serve files from the server's root folders in chunks.
+
+    server.roots maps the first path segment to a folder, e.g. /files/... to
+    the uploads folder and /thumbnails/... to the thumbnail cache.
+    """
+
+    server_version = "LibraryDownloads/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def log_message(self, format, *args):
+        # Keep Streamlit's console readable
+        pass
+
+    def _serve(self, send_body):
+        url = urlsplit(self.path)
+        if url.path == "/metrics" and self.server.metrics is not None and is_loopback(self.client_address[0]):
+            self._send_metrics(send_body)
+            return
+        prefix, _, rel_path = url.path.lstrip("/").partition("/")
+        root = self.server.roots.get(prefix)
+        file_path = resolve_upload(root, unquote(rel_path)) if root else None
+        if file_path is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        size = os.path.getsize(file_path)
+        try:
+            byte_range = parse_range(self.headers.get("Range"), size)
+        except ValueError:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if byte_range is None:
+            start, end = 0, size - 1
+            self.send_response(HTTPStatus.OK)
+        else:
+            start, end = byte_range
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        length = max(end - start + 1, 0)
+
+        content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        if prefix == "files":
+            download_name = parse_qs(url.query).get("name", [os.path.basename(file_path)])[0]
+            self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(download_name)}")
+        else:
+            # Thumbnails are named by content hash, so they never change
+            self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        self.end_headers()
+
+        if send_body and length:
+            with open(file_path, "rb") as f:
+                try:
+                    # sendfile keeps the file out of Python memory; it falls back
+                    # to chunked reads where the platform has no sendfile
+                    self.connection.sendfile(f, offset=start, count=length)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client cancelled or paused the download
+                    pass
+
+    def _send_metrics(self, send_body):
+        body = self.server.metrics().encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+
+def start_download_server(roots=None, host=LOCAL_HOST, port=8502, metrics=None, base_url=None):
+    """Start the download server on a daemon thread and return it.
+
+    roots maps URL prefixes to folders; by default only uploads are served.
+    metrics, if given, is a callable returning Prometheus text for /metrics.
+    Listening on any other interface than loopback needs the base_url
+    other machines reach the server at, which the app's links must use.
+    """
+    if not is_loopback(host) and not base_url:
+        raise ValueError(f"Serving downloads on {host or 'every interface'} needs a base URL other machines can reach")
+    server = ThreadingHTTPServer((host, port), DownloadHandler)
+    server.daemon_threads = True
+    server.roots = roots or {"files": UPLOADS_DIR}
+    server.metrics = metrics
+    thread = threading.Thread(target=server.serve_forever, name="download-server", daemon=True)
+    thread.start()
+    return server
+
+
+def download_url(base_url, root, file_path, download_name):
+    """Build the streaming URL for file_path, or None if it isn't served from root"""
+    full_path = resolve_upload(root, os.path.relpath(file_path, root)) if file_path else None
+    if full_path is None:
+        return None
+    rel_path = os.path.relpath(full_path, os.path.realpath(root)).replace(os.sep, "/")
+    return f"{base_url.rstrip('/')}/files/{quote(rel_path)}?name={quote(download_name)}"
@@ -0,0 +1,167 @@
+"""Background metadata enrichment for books with placeholder details.
+
+Books added by hand or from seed data often have no ISBN, a placeholder
+cover or a generic "A book by ..." description. The enrichment job looks
+them up on Open Library concurrently (a bounded thread pool behind a rate
+limiter), fills in only the missing fields and writes each batch back with
+a single executemany. Every processed book gets an enriched_at timestamp,
+so an interrupted run resumes where it stopped. A book whose lookup fails,
+for whatever reason, is logged, counted and left for the next run; the
+rest of its batch is still saved.
+
+Usage:
+    python -m library.enrich [--db library.db] [--workers 8] [--rate 5] [--limit N]
+"""
+import sys
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from library.dedupe import add_identifiers, parse_isbns
+from library.importer import clean_isbn
+from library.lookup import LookupFailed
+from library.similar import index_books
+
+BATCH_SIZE = 200
+WORKERS = 8
+# Requests per second across all workers; Open Library asks clients to be gentle
+RATE = 5.0
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_COVER = 'https://via.placeholder.com/%'
+PENDING_SQL = f'''
+    SELECT rowid, id, title, author, genre, description, published_year, isbn, cover_image
+    FROM books
+    WHERE enriched_at IS NULL AND deleted_at IS NULL
+      AND (isbn IS NULL OR isbn IN ('', 'Unknown')
+           OR cover_image IS NULL OR cover_image = '' OR cover_image LIKE '{PLACEHOLDER_COVER}'
+           OR description IS NULL OR description = '' OR description LIKE 'A book by %')
+      AND rowid > ?
+    ORDER BY rowid
+    LIMIT ?
+'''
+UPDATE_SQL = '''
+    UPDATE books
+    SET isbn = ?, cover_image = ?, genre = ?, description = ?, published_year = ?, enriched_at = ?, updated_at = ?
+    WHERE id = ?
+'''
+
+
+class RateLimiter:
+    """Space calls evenly so that at most rate calls start per second"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(self._next, now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _is_placeholder(value):
+    return not value or value in ('Unknown', 'Unspecified', 'Other') or value.startswith('https://via.placeholder.com/') or value.startswith('A book by ')
+
+
+def merge_metadata(book, found):
+    """Return the book's fields with placeholders replaced by what the lookup found"""
+    # Open Library lists every edition's ISBN; keep the first, as an ISBN-13
+    isbns = parse_isbns(found.get('isbn'))
+    best_isbn = isbns[0] if isbns else ''
+    merged = dict(book)
+    if _is_placeholder(book['isbn']) and best_isbn:
+        merged['isbn'] = best_isbn
+    for field in ('cover_image', 'genre', 'description'):
+        if _is_placeholder(book[field]) and not _is_placeholder(found.get(field)):
+            merged[field] = found[field]
+    if not book['published_year'] and found.get('published_year'):
+        merged['published_year'] = found['published_year']
+    return merged
+
+
+def _lookup(client, limiter, book):
+    isbn = clean_isbn(book['isbn'])
+    query = isbn or f"{book['title']} {book['author']}"
+    limiter.wait()
+    try:
+        results = client.search(query, limit=1)
+        return merge_metadata(book, results[0]) if results else book
+    except LookupFailed as e:
+        logger.warning("Could not look up %r: %s", book['title'], e)
+    except Exception as e:
+        # An unexpected response must not throw away the rest of the batch
+        logger.warning("Could not enrich %r: %s: %s", book['title'], type(e).__name__, e)
+    # Leave the checkpoint unset so the next run retries this book
+    return None
+
+
+def enrich_library(pool, client, workers=WORKERS, rate=RATE, batch_size=BATCH_SIZE, limit=None, progress=None):
+    """Enrich books missing metadata; return {'processed': books looked up, 'failed': lookups that failed}"""
+    columns = ('id', 'title', 'author', 'genre', 'description', 'published_year', 'isbn', 'cover_image')
+    limiter = RateLimiter(rate)
+    processed = failed = 0
+    last_rowid = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while limit is None or processed < limit:
+            size = batch_size if limit is None else min(batch_size, limit - processed)
+            with pool.connection() as conn:
+                rows = conn.execute(PENDING_SQL, (last_rowid, size)).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            books = [dict(zip(columns, row[1:])) for row in rows]
+
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            merged = [b for b in executor.map(lambda book: _lookup(client, limiter, book), books) if b is not None]
+            updates = [
+                (b['isbn'], b['cover_image'], b['genre'], b['description'], b['published_year'], now, now, b['id'])
+                for b in merged
+            ]
+            with pool.transaction() as conn:
+                conn.executemany(UPDATE_SQL, updates)
+                add_identifiers(conn, [(update[-1], update[0]) for update in updates])
+                # A real description and genre make for better "more like this"
+                index_books(conn, [(b['id'], b['title'], b['author'], b['genre'], b['description']) for b in merged])
+            processed += len(books)
+            failed += len(books) - len(merged)
+            if progress:
+                progress(processed)
+    return {'processed': processed, 'failed': failed}
+
+
+def main(argv=None):
+    from library.db import DB_PATH, ConnectionPool
+    from library.lookup import LookupCache, OpenLibraryClient
+    from library.migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Fill in missing book metadata from Open Library")
+    parser.add_argument("--db", default=DB_PATH, help="library database path")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--rate", type=float, default=RATE, help="lookups per second")
+    parser.add_argument("--limit", type=int, help="stop after this many books")
+    args = parser.parse_args(argv)
+
+    pool = ConnectionPool(args.db, size=2)
+    with pool.connection() as conn:
+        migrate(conn)
+    client = OpenLibraryClient(cache=LookupCache())
+    stats = enrich_library(pool, client, args.workers, args.rate, limit=args.limit,
+                           progress=lambda n: print(f"\r{n} books processed", end="", file=sys.stderr))
+    print(file=sys.stderr)
+    print(f"Enriched {stats['processed'] - stats['failed']} books")
+    if stats['failed']:
+        print(f"{stats['failed']} lookups failed; run again to retry them", file=sys.stderr)
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
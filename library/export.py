@@ -0,0 +1,72 @@
+"""Streaming export of the books table to CSV, JSON Lines and Parquet.
+
+Books are read with Library.iter_books, one keyset page at a time, and
+written as they arrive, so exporting a large library needs no more memory
+than a single batch. Parquet needs the optional pyarrow package and is
+written one row group per batch.
+"""
+import csv
+import json
+from itertools import islice
+
+from library.models import BOOK_FIELDS
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+# Books per Parquet row group
+PARQUET_BATCH = 10000
+
+
+def write_csv(books, out):
+    writer = csv.writer(out)
+    writer.writerow(BOOK_FIELDS)
+    writer.writerows(books)
+
+
+def write_jsonl(books, out):
+    for book in books:
+        out.write(json.dumps(book._asdict(), ensure_ascii=False) + "\n")
+
+
+def _parquet_schema():
+    import pyarrow as pa
+    return pa.schema([
+        (field, pa.int64() if field == 'published_year' else pa.string())
+        for field in BOOK_FIELDS
+    ])
+
+
+def write_parquet(books, out, batch=PARQUET_BATCH):
+    """Write books to a Parquet file path or binary file; raises ImportError without pyarrow"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema()
+    books = iter(books)
+    with pq.ParquetWriter(out, schema, compression='zstd') as writer:
+        while True:
+            rows = list(islice(books, batch))
+            if not rows:
+                break
+            # Transpose the batch of records into one array per column
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=schema.field(i).type) for i, column in enumerate(zip(*rows))],
+                schema=schema
+            ))
+
+
+WRITERS = {
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+    'parquet': write_parquet,
+}
+
+
+def export_books(library, out, fmt='csv'):
+    """Stream every live book in date-added order to out.
+
+    out is a text file for CSV and JSON Lines, and a path or binary file for
+    Parquet.
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    WRITERS[fmt](library.iter_books(), out)
@@ -0,0 +1,115 @@
+"""Faceted browsing by genre, author, publication decade and attached file.
+
+Facet counts live in the facet_counts summary table, which triggers on
+books keep up to date (see migrations), so showing them is an index read
+instead of a GROUP BY over the whole library. Only live books are counted.
+
+A selection is a tuple of (facet, values) pairs, e.g.
+
+    (('genre', ('Fantasy', 'Science Fiction')), ('has_file', ('yes',)))
+
+Values within a facet are alternatives (OR); facets narrow each other (AND).
+"""
+FACETS = ('genre', 'author', 'decade', 'has_file')
+FACET_LABELS = {
+    'genre': 'Genre',
+    'author': 'Author',
+    'decade': 'Decade',
+    'has_file': 'Has file',
+}
+FACET_LIMIT = 50
+
+# The facet value of a books row, as SQL over its NEW or OLD alias.
+# NULLs count as '' because facet_counts keys can't be NULL.
+FACET_EXPRESSIONS = {
+    'genre': "COALESCE({row}.genre, '')",
+    'author': "COALESCE({row}.author, '')",
+    'decade': "COALESCE(CAST({row}.published_year / 10 * 10 AS TEXT), '')",
+    'has_file': "CASE WHEN COALESCE({row}.file_path, '') != '' THEN 'yes' ELSE 'no' END",
+}
+
+TOP_VALUES_SQL = '''
+    SELECT value, count FROM facet_counts
+    WHERE facet = ? AND count > 0
+    ORDER BY count DESC, value
+    LIMIT ?
+'''
+# Decades are stored as text, so they are ordered by number ('990' before
+# '1990'); the unknown decade '' and the has-file values cast to 0 and go first
+ALL_VALUES_SQL = '''
+    SELECT value, count FROM facet_counts
+    WHERE facet = ? AND count > 0
+    ORDER BY CAST(value AS INTEGER), value
+    LIMIT ?
+'''
+
+
+def selection(selected):
+    """Turn {facet: [values]} into the hashable, ordered selection the queries take"""
+    return tuple(
+        (facet, tuple(sorted(set(selected[facet]))))
+        for facet in FACETS if selected.get(facet)
+    )
+
+
+def _in(column, values, params):
+    params.extend(values)
+    return f"{column} IN ({', '.join('?' * len(values))})"
+
+
+def _text_filter(prefix, column, values, params):
+    terms = [_in(prefix + column, [v for v in values if v], params)] if any(values) else []
+    if '' in values:
+        # '' stands for "not set", stored as NULL or ''. SQLite won't use an
+        # index for "column IS NULL OR column = ''", so look both up by rowid.
+        terms.append(f'''{prefix}rowid IN (
+            SELECT rowid FROM books WHERE {column} IS NULL AND deleted_at IS NULL
+            UNION ALL
+            SELECT rowid FROM books WHERE {column} = '' AND deleted_at IS NULL)''')
+    return " OR ".join(terms)
+
+
+def _decade_filter(values, params):
+    terms = []
+    for value in values:
+        if value:
+            # Spelled like idx_books_live_decade so the index applies
+            terms.append("published_year / 10 * 10 = ?")
+            params.append(int(value))
+        else:
+            terms.append("published_year / 10 * 10 IS NULL")
+    return " OR ".join(terms)
+
+
+def _file_filter(values):
+    if set(values) >= {'yes', 'no'}:
+        return ""
+    if 'yes' in values:
+        return "file_path IS NOT NULL AND file_path != ''"
+    return "(file_path IS NULL OR file_path = '')"
+
+
+def facet_filters(facets, table=None):
+    """Return (" AND ..." SQL, params) restricting books to a selection"""
+    prefix = f"{table}." if table else ""
+    clauses, params = [], []
+    for facet, values in facets:
+        if facet in ('genre', 'author'):
+            clause = _text_filter(prefix, facet, values, params)
+        elif facet == 'decade':
+            clause = _decade_filter(values, params).replace("published_year", prefix + "published_year")
+        elif facet == 'has_file':
+            clause = _file_filter(values).replace("file_path", prefix + "file_path")
+        else:
+            raise ValueError(f"Unknown facet: {facet}")
+        if clause:
+            clauses.append(f" AND ({clause})")
+    return "".join(clauses), params
+
+
+def facet_counts(conn, facet, limit=FACET_LIMIT):
+    """Return [(value, count)] for a facet: the most common first, decades in order"""
+    if facet not in FACETS:
+        raise ValueError(f"Unknown facet: {facet}")
+    sql = ALL_VALUES_SQL if facet in ('decade', 'has_file') else TOP_VALUES_SQL
+    return conn.execute(sql, (facet, limit)).fetchall()
@@ -0,0 +1,274 @@
+"""Full-text indexing of the contents of uploaded book files.
+
+Text is extracted from PDF (pages), EPUB (chapters) and TXT (paragraph-
+aligned parts) files in a background process pool and stored in the
+book_pages_fts index, one row per page or chapter. Each file is indexed
+once, when it is uploaded; indexed_files records what has been done, so a
+backfill only touches files that are missing from the index.
+
+PDF extraction needs the optional pypdf package; without it PDFs stay
+unindexed until a backfill runs with pypdf installed. Files that can't be
+read are logged and skipped: indexing runs after the book is saved and
+never fails the write.
+
+Usage:
+    python -m library.fulltext [--db library.db]    # index any unindexed files
+"""
+import os
+import re
+import sys
+import html
+import zipfile
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime
+from html.parser import HTMLParser
+from xml.etree import ElementTree
+from concurrent.futures import ProcessPoolExecutor
+
+from library.search import build_match_query
+
+logger = logging.getLogger(__name__)
+
+TXT_PART_SIZE = 4000
+# Chunk rowids are file_id * MAX_CHUNKS + n, so a file's rows form one rowid range
+MAX_CHUNKS = 100000
+WORKERS = 2
+RESULT_LIMIT = 20
+SNIPPET_TOKENS = 16
+
+SEARCH_CONTENTS_SQL = f'''
+    SELECT books.id, books.title, books.author, book_pages_fts.location,
+           snippet(book_pages_fts, 2, char(2), char(3), '…', {SNIPPET_TOKENS})
+    FROM book_pages_fts
+    JOIN books ON books.file_path = book_pages_fts.file_path
+    WHERE book_pages_fts MATCH ? AND books.deleted_at IS NULL
+    ORDER BY rank
+    LIMIT ?
+'''
+
+
+class _TextExtractor(HTMLParser):
+    """Collect the visible text of an XHTML document"""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style', 'head'):
+            self._skip += 1
+        elif tag in ('p', 'div', 'br', 'h1', 'h2', 'h3', 'li'):
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style', 'head') and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+    def text(self):
+        return re.sub(r'[ \t]+', ' ', ''.join(self.parts)).strip()
+
+
+def _extract_txt(path):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        part, size, number = [], 0, 1
+        for paragraph in re.split(r'\n\s*\n', f.read()):
+            part.append(paragraph)
+            size += len(paragraph)
+            if size >= TXT_PART_SIZE:
+                yield f"Part {number}", "\n\n".join(part)
+                part, size, number = [], 0, number + 1
+        if part:
+            yield f"Part {number}", "\n\n".join(part)
+
+
+def _extract_epub(path):
+    with zipfile.ZipFile(path) as epub:
+        # The container points at the OPF package, whose spine gives reading order
+        container = ElementTree.fromstring(epub.read('META-INF/container.xml'))
+        opf_path = container.find('.//{*}rootfile').get('full-path')
+        opf = ElementTree.fromstring(epub.read(opf_path))
+        base = os.path.dirname(opf_path)
+        manifest = {item.get('id'): item.get('href') for item in opf.findall('.//{*}item')}
+        for number, itemref in enumerate(opf.findall('.//{*}itemref'), start=1):
+            href = manifest.get(itemref.get('idref'))
+            if not href:
+                continue
+            parser = _TextExtractor()
+            parser.feed(epub.read(os.path.join(base, href).replace(os.sep, '/')).decode('utf-8', errors='replace'))
+            text = parser.text()
+            if text:
+                yield f"Chapter {number}", text
+
+
+def _extract_pdf(path):
+    # Raises ImportError without pypdf, which leaves the file for a later backfill
+    from pypdf import PdfReader
+    for number, page in enumerate(PdfReader(path).pages, start=1):
+        text = page.extract_text() or ''
+        if text.strip():
+            yield f"Page {number}", text
+
+
+EXTRACTORS = {
+    '.txt': _extract_txt,
+    '.epub': _extract_epub,
+    '.pdf': _extract_pdf,
+}
+
+
+def extract_chunks(path):
+    """Return (location, text) pairs for a book file; runs in a worker process"""
+    extractor = EXTRACTORS.get(os.path.splitext(path)[1].lower())
+    return list(extractor(path)) if extractor else []
+
+
+def indexable(path):
+    """True for an existing file of a type with an extractor"""
+    return bool(path) and os.path.splitext(path)[1].lower() in EXTRACTORS and os.path.exists(path)
+
+
+def index_file(pool, path):
+    """Extract and store one file's contents in this thread; return False if it wasn't indexed"""
+    if not indexable(path):
+        return False
+    try:
+        store_chunks(pool, path, extract_chunks(path))
+    except Exception as e:
+        # Missing pypdf, a corrupt file or a busy database; backfill retries it
+        logger.warning("Could not index %s: %s", path, e)
+        return False
+    return True
+
+
+def _delete_chunks(conn, file_id):
+    conn.execute(
+        "DELETE FROM book_pages_fts WHERE rowid >= ? AND rowid < ?",
+        (file_id * MAX_CHUNKS, (file_id + 1) * MAX_CHUNKS)
+    )
+
+
+def store_chunks(pool, path, chunks):
+    """Replace the indexed contents of one file"""
+    chunks = chunks[:MAX_CHUNKS]
+    with pool.transaction() as conn:
+        conn.execute('''
+            INSERT INTO indexed_files (file_path, indexed_at, chunks) VALUES (?, ?, ?)
+            ON CONFLICT (file_path) DO UPDATE SET indexed_at = excluded.indexed_at, chunks = excluded.chunks
+        ''', (path, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), len(chunks)))
+        file_id = conn.execute("SELECT id FROM indexed_files WHERE file_path = ?", (path,)).fetchone()[0]
+        _delete_chunks(conn, file_id)
+        conn.executemany(
+            "INSERT INTO book_pages_fts (rowid, file_path, location, content) VALUES (?, ?, ?, ?)",
+            [(file_id * MAX_CHUNKS + n, path, location, text) for n, (location, text) in enumerate(chunks)]
+        )
+
+
+def remove_file(conn, path):
+    """Drop a file's contents from the index (call when the file is deleted)"""
+    row = conn.execute("DELETE FROM indexed_files WHERE file_path = ? RETURNING id", (path,)).fetchone()
+    if row is not None:
+        _delete_chunks(conn, row[0])
+
+
+def unindexed_files(conn):
+    return [row[0] for row in conn.execute('''
+        SELECT DISTINCT books.file_path FROM books
+        LEFT JOIN indexed_files ON indexed_files.file_path = books.file_path
+        WHERE books.file_path IS NOT NULL AND books.file_path != ''
+          AND indexed_files.file_path IS NULL
+    ''')]
+
+
+def search_contents(conn, query, limit=RESULT_LIMIT):
+    """Search inside book files; return books with their matching page snippets"""
+    match = build_match_query(query, fields=())
+    if match is None:
+        return []
+    results = {}
+    for book_id, title, author, location, snippet in conn.execute(SEARCH_CONTENTS_SQL, (match, limit)):
+        book = results.setdefault(book_id, {'id': book_id, 'title': title, 'author': author, 'matches': []})
+        # Escape the book text, then turn the snippet markers into highlights
+        snippet = html.escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+        book['matches'].append({'location': location, 'snippet': snippet})
+    return list(results.values())
+
+
+class ContentIndexer:
+    """Index uploaded files in a background process pool, one file at a time"""
+
+    def __init__(self, pool, workers=WORKERS):
+        self.pool = pool
+        # spawn: forking a threaded server process is unsafe
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, path):
+        """Queue one file for extraction and indexing; returns immediately"""
+        if not indexable(path):
+            return None
+        future = self._executor.submit(extract_chunks, path)
+        future.add_done_callback(lambda f: self._store(path, f))
+        return future
+
+    def index(self, path):
+        """Extract one file in the pool and store it in this thread; return False if it wasn't indexed"""
+        if not indexable(path):
+            return False
+        try:
+            store_chunks(self.pool, path, self._executor.submit(extract_chunks, path).result())
+        except Exception as e:
+            logger.warning("Could not index %s: %s", path, e)
+            return False
+        return True
+
+    def _store(self, path, future):
+        # Unreadable files are left unindexed; backfill will retry them
+        if future.exception() is not None:
+            logger.warning("Could not index %s: %s", path, future.exception())
+            return
+        try:
+            store_chunks(self.pool, path, future.result())
+        except Exception as e:
+            logger.warning("Could not index %s: %s", path, e)
+
+    def shutdown(self):
+        """Wait for queued files to be indexed and stop the workers"""
+        self._executor.shutdown(wait=True)
+
+    def backfill(self):
+        """Queue every referenced file that is missing from the index"""
+        with self.pool.connection() as conn:
+            paths = unindexed_files(conn)
+        return [future for future in map(self.submit, paths) if future is not None]
+
+
+def main(argv=None):
+    from library.db import DB_PATH, ConnectionPool
+    from library.migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Index the contents of uploaded book files")
+    parser.add_argument("--db", default=DB_PATH, help="library database path")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args(argv)
+
+    pool = ConnectionPool(args.db, size=2)
+    with pool.connection() as conn:
+        migrate(conn)
+    indexer = ContentIndexer(pool, args.workers)
+    futures = indexer.backfill()
+    for number, future in enumerate(futures, start=1):
+        future.exception()
+        print(f"\r{number}/{len(futures)} files indexed", end="", file=sys.stderr)
+    print(file=sys.stderr)
+    indexer.shutdown()
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
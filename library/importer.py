@@ -0,0 +1,270 @@
+"""Bulk import of books from CSV, JSON Lines and Goodreads exports.
+
+Files are read as a stream and inserted in large batches with executemany,
+one transaction per batch, so memory stays flat and the database is synced
+once per batch rather than once per book. Rows whose ISBN is already in the
+library (or earlier in the same file) are skipped. Rows with the normalized
+title and author of another book are imported and reported as possible
+duplicates, or skipped with skip_possible_duplicates.
+
+Usage:
+    python -m library.importer books.csv [--format csv|jsonl|json|goodreads] [--db library.db] [--skip-possible-duplicates]
+"""
+import os
+import re
+import csv
+import sys
+import json
+import uuid
+import argparse
+from datetime import datetime
+
+from library.dedupe import add_identifiers, book_keys, isbn13
+from library.similar import index_books
+
+CHUNK_SIZE = 5000
+# Titles of possible duplicates listed in the import summary
+POSSIBLE_DUPLICATES_SHOWN = 20
+# SQLite bound-parameter batches for the duplicate lookups
+LOOKUP_BATCH = 500
+
+FORMATS = ('csv', 'jsonl', 'json', 'goodreads')
+BOOK_FIELDS = ('title', 'author', 'genre', 'description', 'published_year', 'isbn', 'cover_image')
+FIELD_ALIASES = {
+    'year': 'published_year',
+    'published': 'published_year',
+    'isbn13': 'isbn',
+    'cover': 'cover_image',
+    'cover_url': 'cover_image',
+}
+
+INSERT_SQL = '''
+    INSERT INTO books (id, title, author, genre, description, published_year, isbn, cover_image, date_added, file_path,
+                       title_key, author_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, '', ?, ?)
+'''
+EXISTING_ISBNS_SQL = '''
+    SELECT isbn13 FROM book_identifiers
+    JOIN books ON books.id = book_identifiers.book_id
+    WHERE isbn13 IN ({placeholders}) AND books.deleted_at IS NULL
+'''
+EXISTING_KEYS_SQL = '''
+    SELECT title_key, author_key FROM books
+    WHERE author_key IN ({placeholders}) AND deleted_at IS NULL
+'''
+
+
+def clean_isbn(value):
+    """Normalize an ISBN-10 or ISBN-13 to ISBN-13, or '' if value isn't a valid ISBN"""
+    return isbn13(value) or ''
+
+
+def detect_format(filename, header_line=''):
+    """Guess the import format from the file name and first line"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if ext == '.json':
+        return 'json'
+    if 'Book Id' in header_line and 'ISBN13' in header_line:
+        return 'goodreads'
+    return 'csv'
+
+
+def read_rows(f, fmt):
+    """Yield raw row dictionaries from a text file object"""
+    if fmt in ('csv', 'goodreads'):
+        yield from csv.DictReader(f)
+    elif fmt == 'jsonl':
+        for line in f:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A malformed line is one invalid row, not a failed import
+                    yield None
+    elif fmt == 'json':
+        # A JSON array has to be parsed whole; use JSON Lines for large files
+        yield from json.load(f)
+    else:
+        raise ValueError(f"Unknown import format: {fmt}")
+
+
+def _year(value):
+    value = str(value or '').strip()
+    return int(value[:4]) if value[:4].isdigit() else None
+
+
+def normalize_row(raw, fmt):
+    """Map a raw row onto the books columns. Raises ValueError for invalid rows."""
+    if not isinstance(raw, dict):
+        raise ValueError("not a JSON object")
+    if fmt == 'goodreads':
+        # Goodreads wraps ISBNs as ="0439554934" to stop spreadsheets mangling them
+        isbn = clean_isbn(raw.get('ISBN13')) or clean_isbn(raw.get('ISBN'))
+        date_added = (raw.get('Date Added') or '').replace('/', '-')
+        book = {
+            'title': raw.get('Title'),
+            'author': raw.get('Author'),
+            'genre': (raw.get('Bookshelves') or '').split(',')[0].strip() or 'Other',
+            'description': raw.get('My Review') or '',
+            'published_year': _year(raw.get('Original Publication Year') or raw.get('Year Published')),
+            'isbn': isbn,
+            'cover_image': '',
+            'date_added': f"{date_added} 00:00:00" if re.fullmatch(r'\d{4}-\d{2}-\d{2}', date_added) else None,
+        }
+    else:
+        book = {}
+        for key, value in raw.items():
+            key = str(key).strip().lower().replace(' ', '_')
+            key = FIELD_ALIASES.get(key, key)
+            if key in BOOK_FIELDS and key not in book:
+                book[key] = value
+        book['published_year'] = _year(book.get('published_year'))
+        book['isbn'] = clean_isbn(book.get('isbn'))
+        book['date_added'] = None
+
+    book['title'] = (book.get('title') or '').strip()
+    book['author'] = (book.get('author') or '').strip()
+    if not book['title'] or not book['author']:
+        raise ValueError("title and author are required")
+    if not book.get('cover_image'):
+        book['cover_image'] = f"https://via.placeholder.com/150?text={book['title'].replace(' ', '+')}"
+    return book
+
+
+def _lookup_batches(conn, sql, values):
+    values = list(values)
+    for i in range(0, len(values), LOOKUP_BATCH):
+        batch = values[i:i + LOOKUP_BATCH]
+        yield from conn.execute(sql.format(placeholders=", ".join("?" * len(batch))), batch)
+
+
+def _existing(conn, chunk):
+    """Return the ISBNs and (title_key, author_key) pairs of chunk that are already in the library"""
+    found = {row[0] for row in _lookup_batches(
+        conn, EXISTING_ISBNS_SQL, {book['isbn'] for book in chunk if book['isbn']}
+    )}
+    found.update(_lookup_batches(conn, EXISTING_KEYS_SQL, {book['keys'][1] for book in chunk}))
+    return found
+
+
+def _write_chunk(pool, chunk, seen, stats, skip_possible_duplicates=False):
+    for book in chunk:
+        book['keys'] = book_keys(book['title'], book['author'])
+    with pool.transaction() as conn:
+        existing = _existing(conn, chunk)
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = []
+        identifiers = []
+        for book in chunk:
+            # Same ISBN in the library or earlier in the file is the same book
+            isbn, keys = book['isbn'], book['keys']
+            if isbn and (isbn in existing or isbn in seen):
+                stats['duplicates'] += 1
+                continue
+            # Same normalized title and author may just be a similar book
+            if keys in existing or keys in seen:
+                stats['possible_duplicates'] += 1
+                if len(stats['possible_duplicate_titles']) < POSSIBLE_DUPLICATES_SHOWN:
+                    stats['possible_duplicate_titles'].append(f"{book['title']} by {book['author']}")
+                if skip_possible_duplicates:
+                    continue
+            seen.update((isbn, keys) if isbn else (keys,))
+            rows.append((
+                str(uuid.uuid4()), book['title'], book['author'], book.get('genre') or 'Other',
+                book.get('description') or '', book['published_year'], isbn or 'Unknown',
+                book['cover_image'], book['date_added'] or now, *keys,
+            ))
+            identifiers.append((rows[-1][0], isbn))
+        conn.executemany(INSERT_SQL, rows)
+        add_identifiers(conn, identifiers)
+        index_books(conn, (row[:5] for row in rows))
+    stats['imported'] += len(rows)
+
+
+def summary(stats):
+    """One line describing import counts, for progress output"""
+    return (f"{stats['rows']} rows: {stats['imported']} imported, {stats['duplicates']} duplicates, "
+            f"{stats['possible_duplicates']} possible duplicates, {stats['invalid']} invalid")
+
+
+def report_possible_duplicates(stats, file=sys.stderr):
+    """Print the possible duplicates an import found, so they can be checked"""
+    titles = stats['possible_duplicate_titles']
+    if not titles:
+        return
+    print("Possible duplicates (same title and author as another book):", file=file)
+    for title in titles:
+        print(f"    {title}", file=file)
+    if stats['possible_duplicates'] > len(titles):
+        print(f"    ... and {stats['possible_duplicates'] - len(titles)} more", file=file)
+
+
+def import_rows(pool, raw_rows, fmt, chunk_size=CHUNK_SIZE, progress=None, skip_possible_duplicates=False):
+    """Validate and insert raw rows in batches; return counts of what happened.
+
+    progress, if given, is called with the running counts after each batch.
+    Possible duplicates (same title and author, different or no ISBN) are
+    imported and counted unless skip_possible_duplicates.
+    """
+    stats = {'rows': 0, 'imported': 0, 'duplicates': 0, 'possible_duplicates': 0, 'invalid': 0,
+             'possible_duplicate_titles': []}
+    seen = set()
+    chunk = []
+    for raw in raw_rows:
+        stats['rows'] += 1
+        try:
+            chunk.append(normalize_row(raw, fmt))
+        except (ValueError, TypeError, AttributeError):
+            stats['invalid'] += 1
+        if len(chunk) >= chunk_size:
+            _write_chunk(pool, chunk, seen, stats, skip_possible_duplicates)
+            chunk = []
+            if progress:
+                progress(dict(stats))
+    if chunk:
+        _write_chunk(pool, chunk, seen, stats, skip_possible_duplicates)
+    if progress:
+        progress(dict(stats))
+    return stats
+
+
+def import_file(pool, f, filename, fmt=None, chunk_size=CHUNK_SIZE, progress=None, skip_possible_duplicates=False):
+    """Import from an open text file object; the format is detected if not given"""
+    if fmt is None:
+        header_line = f.readline()
+        f.seek(0)
+        fmt = detect_format(filename, header_line)
+    return import_rows(pool, read_rows(f, fmt), fmt, chunk_size, progress, skip_possible_duplicates)
+
+
+def main(argv=None):
+    from library.db import DB_PATH, ConnectionPool
+    from library.migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Import books into the library")
+    parser.add_argument("path", help="CSV, JSON Lines, JSON or Goodreads export file")
+    parser.add_argument("--format", choices=FORMATS, help="file format (detected by default)")
+    parser.add_argument("--db", default=DB_PATH, help="library database path")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--skip-possible-duplicates", action="store_true",
+                        help="skip rows with the title and author of a book already there")
+    args = parser.parse_args(argv)
+
+    pool = ConnectionPool(args.db, size=1)
+    with pool.connection() as conn:
+        migrate(conn)
+
+    def report(stats):
+        print(f"\r{summary(stats)}", end="", file=sys.stderr)
+
+    with open(args.path, newline='', encoding='utf-8-sig') as f:
+        stats = import_file(pool, f, args.path, args.format, args.chunk_size, report, args.skip_possible_duplicates)
+    print(file=sys.stderr)
+    report_possible_duplicates(stats)
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Lightweight timing and query instrumentation.
+
+Spans time named sections (data-access functions, page sections) and are
+aggregated process-wide for a Prometheus text export. While a rerun is being
+recorded (start_rerun/finish_rerun on the script thread), spans, SQL
+statements and bytes sent to the browser are also collected per rerun, with
+optional cProfile and tracemalloc capture, for the debug panel.
+"""
+import io
+import time
+import pstats
+import cProfile
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+
+PROFILE_LINES = 25
+MEMORY_LINES = 10
+
+_local = threading.local()
+
+
+class Rerun:
+    """Everything recorded during one script run"""
+
+    def __init__(self, profile=False, trace_memory=False):
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.spans = []
+        self.queries = 0
+        self.bytes_sent = 0
+        self.profile_report = None
+        self.memory_report = None
+        self._profiler = cProfile.Profile() if profile else None
+        self._trace_memory = trace_memory
+        if self._trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self._profiler:
+            self._profiler.enable()
+
+    def _finish(self):
+        self.seconds = time.perf_counter() - self.started
+        if self._profiler:
+            self._profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+            self.profile_report = out.getvalue()
+        if self._trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self.memory_report = "\n".join(str(stat) for stat in snapshot.statistics("lineno")[:MEMORY_LINES])
+
+
+class Registry:
+    """Process-wide counters and timing summaries"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = {}
+        self.queries = 0
+        self.bytes_sent = 0
+        self.reruns = {}
+
+    def record_span(self, name, seconds):
+        with self._lock:
+            stats = self.spans.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    def record_rerun(self, page, rerun):
+        with self._lock:
+            stats = self.reruns.setdefault(page, [0, 0.0])
+            stats[0] += 1
+            stats[1] += rerun.seconds
+            self.queries += rerun.queries
+            self.bytes_sent += rerun.bytes_sent
+
+    def count_query(self):
+        with self._lock:
+            self.queries += 1
+
+    def prometheus_text(self):
+        """Render the counters in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                "# HELP library_span_seconds Time spent in instrumented sections.",
+                "# TYPE library_span_seconds summary",
+            ]
+            for name, (count, total, _) in sorted(self.spans.items()):
+                lines.append(f'library_span_seconds_count{{span="{name}"}} {count}')
+                lines.append(f'library_span_seconds_sum{{span="{name}"}} {total:.6f}')
+            lines += [
+                "# HELP library_span_seconds_max Slowest observed run of each section.",
+                "# TYPE library_span_seconds_max gauge",
+            ]
+            for name, (_, _, longest) in sorted(self.spans.items()):
+                lines.append(f'library_span_seconds_max{{span="{name}"}} {longest:.6f}')
+            lines += [
+                "# HELP library_rerun_seconds Streamlit script run time per page.",
+                "# TYPE library_rerun_seconds summary",
+            ]
+            for page, (count, total) in sorted(self.reruns.items()):
+                lines.append(f'library_rerun_seconds_count{{page="{page}"}} {count}')
+                lines.append(f'library_rerun_seconds_sum{{page="{page}"}} {total:.6f}')
+            lines += [
+                "# HELP library_sql_statements_total SQL statements executed.",
+                "# TYPE library_sql_statements_total counter",
+                f"library_sql_statements_total {self.queries}",
+                "# HELP library_frontend_bytes_total Bytes sent to the browser by recorded reruns.",
+                "# TYPE library_frontend_bytes_total counter",
+                f"library_frontend_bytes_total {self.bytes_sent}",
+            ]
+            return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def current_rerun():
+    """The rerun being recorded on this thread, if any"""
+    return getattr(_local, 'rerun', None)
+
+
+def start_rerun(profile=False, trace_memory=False):
+    _local.rerun = Rerun(profile, trace_memory)
+    return _local.rerun
+
+
+def finish_rerun(page):
+    rerun = current_rerun()
+    if rerun is None:
+        return None
+    _local.rerun = None
+    rerun._finish()
+    REGISTRY.record_rerun(page, rerun)
+    return rerun
+
+
+def record_bytes(count):
+    rerun = current_rerun()
+    if rerun is not None:
+        rerun.bytes_sent += count
+
+
+def trace_statement(statement):
+    """sqlite3 trace callback: count each statement run by the application"""
+    # Statements run by triggers are reported with a leading comment; skip them
+    if statement.startswith("--"):
+        return
+    rerun = current_rerun()
+    if rerun is not None:
+        rerun.queries += 1
+    else:
+        REGISTRY.count_query()
+
+
+@contextmanager
+def span(name):
+    """Time a block under name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        REGISTRY.record_span(name, seconds)
+        rerun = current_rerun()
+        if rerun is not None:
+            rerun.spans.append((name, seconds))
+
+
+def timed(name):
+    """Decorator form of span"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,305 @@
+"""Background jobs for slow work started from the app.
+
+Adding a book, importing a catalog or enriching metadata can take seconds
+to minutes, which would freeze the Streamlit session running them. The app
+submits them here instead: a job is a row in the jobs table, and a small
+pool of worker threads claims queued rows one at a time and runs the
+handler registered for their kind. The UI polls job status by id.
+
+Claiming a job is a single UPDATE ... RETURNING under the write lock, so any
+number of processes (see library.workers) can serve the same queue without
+running a job twice. Idle workers first look for queued rows with a plain
+read, so polling an empty queue never holds up writers. Workers write
+progress at most every PROGRESS_INTERVAL, which doubles as a heartbeat: a
+running job whose worker stopped updating it for STALE_AFTER seconds is
+queued again, checked every RECOVER_INTERVAL.
+
+Usage:
+    python -m library.jobs [--db library.db] [--workers 2]
+
+runs workers in their own process, e.g. next to app processes started with
+LIBRARY_JOB_WORKERS=0 so job work never competes with page reruns.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+from library.trash import TIMESTAMP_FORMAT
+
+JOB_WORKERS = int(os.getenv("LIBRARY_JOB_WORKERS", "2"))
+# Uploaded files waiting for a job; shared by every worker process
+JOB_FILES_DIR = os.getenv("LIBRARY_JOB_FILES", "job_files")
+# Seconds an idle worker waits for jobs submitted by other processes
+POLL_INTERVAL = 1.0
+PROGRESS_INTERVAL = 0.5
+STALE_AFTER = 300
+RECOVER_INTERVAL = 60
+MAX_ATTEMPTS = 3
+# Finished jobs are kept this long for the UI and then deleted
+KEEP_FINISHED = timedelta(days=7)
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+JOB_FIELDS = ('id', 'kind', 'status', 'progress', 'result', 'error', 'created_at', 'started_at', 'finished_at')
+
+HANDLERS = {}
+
+SUBMIT_SQL = "INSERT INTO jobs (kind, payload, status, created_at) VALUES (?, ?, 'queued', ?)"
+QUEUED_SQL = "SELECT 1 FROM jobs WHERE status = 'queued' LIMIT 1"
+CLAIM_SQL = '''
+    UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?, attempts = attempts + 1
+    WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1)
+    RETURNING id, kind, payload
+'''
+PROGRESS_SQL = "UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE id = ?"
+FINISH_SQL = "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?"
+STATUS_SQL = f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id IN ({{placeholders}})"
+RECENT_SQL = f"SELECT {', '.join(JOB_FIELDS)} FROM jobs ORDER BY id DESC LIMIT ?"
+REQUEUE_STALE_SQL = '''
+    UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END,
+                    error = CASE WHEN attempts < ? THEN error ELSE 'worker stopped' END,
+                    finished_at = CASE WHEN attempts < ? THEN NULL ELSE ? END
+    WHERE status = 'running' AND heartbeat_at < ?
+'''
+PRUNE_SQL = "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?"
+
+
+def handler(kind):
+    """Register the function that runs jobs of a kind: func(library, payload, progress) -> result"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def _now():
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+def _job(row):
+    job = dict(zip(JOB_FIELDS, row))
+    for field in ('progress', 'result'):
+        job[field] = json.loads(job[field]) if job[field] else None
+    return job
+
+
+def submit(pool, kind, payload=None):
+    """Queue a job and return its id"""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    with pool.transaction() as conn:
+        return conn.execute(SUBMIT_SQL, (kind, json.dumps(payload or {}), _now())).lastrowid
+
+
+def job_status(pool, job_ids):
+    """Return {id: job dict} for the given job ids"""
+    if not job_ids:
+        return {}
+    with pool.connection() as conn:
+        rows = conn.execute(STATUS_SQL.format(placeholders=", ".join("?" * len(job_ids))), list(job_ids)).fetchall()
+    return {row[0]: _job(row) for row in rows}
+
+
+def recent_jobs(pool, limit=20):
+    with pool.connection() as conn:
+        return [_job(row) for row in conn.execute(RECENT_SQL, (limit,))]
+
+
+def save_job_file(fileobj, filename, root=JOB_FILES_DIR):
+    """Copy an upload to disk for a job to read later; return its path"""
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, f"{time.time_ns()}-{os.path.basename(filename)}")
+    with open(path, "wb") as out:
+        while True:
+            chunk = fileobj.read(1024 * 1024)
+            if not chunk:
+                break
+            out.write(chunk)
+    return path
+
+
+class JobQueue:
+    """Worker threads running queued jobs against one library"""
+
+    def __init__(self, library, workers=JOB_WORKERS):
+        self.library = library
+        self.workers = workers
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._recovered = time.monotonic()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True) for i in range(workers)
+        ]
+
+    def start(self):
+        self.recover()
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+
+    def submit(self, kind, payload=None):
+        """Queue a job, wake an idle worker and return the job id"""
+        job_id = submit(self.library.pool, kind, payload)
+        self._wake.set()
+        return job_id
+
+    def status(self, job_ids):
+        return job_status(self.library.pool, job_ids)
+
+    def recover(self):
+        """Requeue jobs whose worker died and delete old finished jobs"""
+        now = datetime.now()
+        stale = (now - timedelta(seconds=STALE_AFTER)).strftime(TIMESTAMP_FORMAT)
+        with self.library.pool.transaction() as conn:
+            conn.execute(REQUEUE_STALE_SQL, (MAX_ATTEMPTS, MAX_ATTEMPTS, MAX_ATTEMPTS, _now(), stale))
+            conn.execute(PRUNE_SQL, ((now - KEEP_FINISHED).strftime(TIMESTAMP_FORMAT),))
+
+    def _claim(self):
+        # Only take the write lock when there is something to claim
+        with self.library.pool.connection() as conn:
+            if conn.execute(QUEUED_SQL).fetchone() is None:
+                return None
+        now = _now()
+        with self.library.pool.transaction() as conn:
+            return conn.execute(CLAIM_SQL, (now, now)).fetchone()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Cleared before claiming, so a job submitted meanwhile still wakes us
+            self._wake.clear()
+            try:
+                # Jobs of workers that died while this process runs
+                if time.monotonic() - self._recovered >= RECOVER_INTERVAL:
+                    self._recovered = time.monotonic()
+                    self.recover()
+                job = self._claim()
+            except Exception:
+                # A busy database is retried after the poll interval
+                job = None
+            if job is None:
+                self._wake.wait(POLL_INTERVAL)
+                continue
+            self.run_job(*job)
+
+    def run_job(self, job_id, kind, payload):
+        """Run one claimed job and record its result or error"""
+        pool = self.library.pool
+        last_report = [0.0]
+
+        def progress(value):
+            now = time.monotonic()
+            if now - last_report[0] >= PROGRESS_INTERVAL:
+                last_report[0] = now
+                with pool.transaction() as conn:
+                    conn.execute(PROGRESS_SQL, (json.dumps(value), _now(), job_id))
+
+        try:
+            result = HANDLERS[kind](self.library, json.loads(payload), progress)
+            status, error = DONE, None
+        except Exception as e:
+            # Shown to the user; duplicates and bad files are expected failures
+            result, status, error = None, FAILED, str(e) or type(e).__name__
+        with pool.transaction() as conn:
+            conn.execute(FINISH_SQL, (status, json.dumps(result), error, _now(), job_id))
+
+
+@handler('add_book')
+def add_book(library, payload, progress):
+    return {'id': library.add_book(payload['book'], allow_duplicate=payload.get('allow_duplicate', False))}
+
+
+@handler('import')
+def import_catalog(library, payload, progress):
+    """Import a catalog file saved with save_job_file, then delete it"""
+    try:
+        with open(payload['path'], newline='', encoding='utf-8-sig') as f:
+            return library.import_file(f, payload['filename'], payload.get('format'), progress=progress,
+                                       skip_possible_duplicates=payload.get('skip_possible_duplicates', False))
+    finally:
+        os.remove(payload['path'])
+
+
+@handler('enrich')
+def enrich(library, payload, progress):
+    from library.enrich import enrich_library
+    from library.lookup import LookupCache, OpenLibraryClient
+
+    client = OpenLibraryClient(cache=LookupCache())
+    try:
+        return enrich_library(library.pool, client, limit=payload.get('limit'),
+                              progress=lambda n: progress({'processed': n}))
+    finally:
+        library._changed()
+
+
+@handler('index_contents')
+def index_contents(library, payload, progress):
+    """Index one uploaded file (payload 'path'), or every file missing from the content index"""
+    from library import fulltext
+
+    if 'path' in payload:
+        paths = [payload['path']]
+    else:
+        with library.pool.connection() as conn:
+            paths = fulltext.unindexed_files(conn)
+    # The indexer extracts text in its own processes, off this one
+    if library.indexer is not None:
+        index = library.indexer.index
+    else:
+        index = lambda path: fulltext.index_file(library.pool, path)
+    indexed = 0
+    for number, path in enumerate(paths, start=1):
+        indexed += index(path)
+        progress({'indexed': indexed, 'total': len(paths)})
+    return {'indexed': indexed, 'total': len(paths)}
+
+
+@handler('index_similar')
+def index_similar(library, payload, progress):
+    """Index books missing from the "more like this" index, a batch per transaction"""
+    from library import similar
+
+    indexed, last_rowid = 0, 0
+    while True:
+        with library.pool.transaction() as conn:
+            count, last_rowid = similar.index_batch(conn, last_rowid)
+        if not count:
+            break
+        indexed += count
+        progress({'indexed': indexed})
+    library._changed()
+    return {'indexed': indexed}
+
+
+def main(argv=None):
+    from library.core import Library
+    from library.db import DB_PATH
+
+    parser = argparse.ArgumentParser(description="Run background jobs queued by the app")
+    parser.add_argument("--db", default=DB_PATH, help="library database path")
+    parser.add_argument("--workers", type=int, default=max(JOB_WORKERS, 1))
+    args = parser.parse_args(argv)
+
+    library = Library(args.db)
+    queue = JobQueue(library, args.workers).start()
+    print(f"Running jobs with {args.workers} workers; Ctrl+C to stop", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        queue.stop()
+    finally:
+        library.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Open Library lookup client with pooling, retries, caching and coalescing.
+
+- One requests.Session per process keeps connections to Open Library alive,
+  with connect/read timeouts and retry with exponential backoff.
+- Results are cached on disk in a small SQLite database, keyed by the
+  normalized query, with a TTL and least-recently-used eviction.
+- Concurrent lookups for the same query share a single in-flight request.
+
+The base URL can be pointed at a local stub server for testing.
+"""
+import os
+import json
+import time
+import threading
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from library.db import ConnectionPool
+
+OPEN_LIBRARY_URL = os.getenv("OPEN_LIBRARY_URL", "https://openlibrary.org")
+LOOKUP_CACHE_DB = os.getenv("LOOKUP_CACHE_DB", "lookup_cache.db")
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (3.05, 10)
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+CACHE_TTL = 7 * 24 * 60 * 60
+CACHE_MAX_ENTRIES = 10000
+
+
+class LookupFailed(Exception):
+    """Raised when Open Library cannot be reached or returns an error"""
+
+
+def normalize_query(query):
+    """Case-fold and collapse whitespace so equivalent queries share a cache entry"""
+    return " ".join(query.casefold().split())
+
+
+def parse_docs(docs):
+    """Convert Open Library search docs into book dictionaries"""
+    books = []
+    for doc in docs:
+        # Extract cover ID if available
+        cover_id = doc.get('cover_i')
+        cover_url = f"https://covers.openlibrary.org/b/id/{cover_id}-M.jpg" if cover_id else f"https://via.placeholder.com/150?text={doc.get('title', 'Book').replace(' ', '+')}"
+
+        # Extract author names safely
+        author_names = doc.get('author_name', ['Unknown Author'])
+        author_text = ", ".join(author_names) if author_names else 'Unknown Author'
+
+        # Extract subjects/genres safely
+        subjects = doc.get('subject', [])
+        genre_text = ", ".join(subjects[:2]) if subjects else 'Unspecified'
+
+        # Open Library only returns a first sentence, if anything, as a blurb
+        first_sentence = doc.get('first_sentence') or []
+
+        books.append({
+            "title": doc.get('title', 'Unknown Title'),
+            "author": author_text,
+            "genre": genre_text,
+            "description": first_sentence[0] if first_sentence else f"A book by {author_text}. Published by {', '.join(doc.get('publisher', ['Unknown Publisher'])[:1])}.",
+            "published_year": doc.get('first_publish_year', 2000),
+            "isbn": ", ".join(doc.get('isbn', ['Unknown'])) if 'isbn' in doc else 'Unknown',
+            "cover_image": cover_url,
+            "file_path": ""  # No file available for API results initially
+        })
+    return books
+
+
+class LookupCache:
+    """SQLite-backed cache with a time-to-live and LRU eviction"""
+
+    def __init__(self, path=LOOKUP_CACHE_DB, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.pool = ConnectionPool(path, size=2)
+        with self.pool.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS lookup_cache
+                (key TEXT PRIMARY KEY,
+                 value TEXT NOT NULL,
+                 created_at REAL NOT NULL,
+                 accessed_at REAL NOT NULL)
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lookup_cache_accessed ON lookup_cache (accessed_at)")
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        now = time.time()
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT value FROM lookup_cache WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl)
+            ).fetchone()
+        if row is None:
+            return None
+        # Like every write, the LRU bookkeeping takes the write lock
+        with self.pool.transaction() as conn:
+            conn.execute("UPDATE lookup_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        now = time.time()
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO lookup_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            # Evict expired entries, then the least recently used beyond the limit
+            conn.execute("DELETE FROM lookup_cache WHERE created_at <= ?", (now - self.ttl,))
+            conn.execute('''
+                DELETE FROM lookup_cache WHERE key IN (
+                    SELECT key FROM lookup_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+
+
+class OpenLibraryClient:
+    """Search Open Library through a shared session, cache and in-flight table"""
+
+    def __init__(self, base_url=OPEN_LIBRARY_URL, cache=None, timeout=TIMEOUT, retries=RETRIES,
+                 backoff_factor=BACKOFF_FACTOR):
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=16)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def search(self, query, limit=3):
+        """Return up to limit book dictionaries for query"""
+        key = f"search:{limit}:{normalize_query(query)}"
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        # Coalesce: the first caller fetches, later callers wait on its result
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            books = self._fetch(query, limit)
+            if self.cache is not None:
+                self.cache.put(key, books)
+            future.set_result(books)
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result()
+
+    def _fetch(self, query, limit):
+        try:
+            response = self.session.get(
+                f"{self.base_url}/search.json",
+                params={"q": query, "limit": limit},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            raise LookupFailed(f"Error connecting to API: {e}") from e
+        if response.status_code != 200:
+            raise LookupFailed(f"API Error: {response.status_code}")
+        return parse_docs(response.json().get('docs', [])[:limit])
@@ -0,0 +1,537 @@
+"""Versioned schema migrations for the library database.
+
+The schema version is tracked in PRAGMA user_version. Each migration runs
+exactly once, in order, inside the same write transaction that bumps the
+version, so startup only has to read a single pragma once the database is
+current.
+"""
+import uuid
+import contextlib
+from datetime import datetime
+
+MIGRATIONS = []
+
+SEED_BOOKS = [
+    {
+        'title': 'Harry Potter and the Philosopher\'s Stone',
+        'author': 'J.K. Rowling',
+        'genre': 'Fantasy',
+        'description': 'The first book in the Harry Potter series.',
+        'published_year': 1997,
+        'isbn': '9780590353427',
+        'cover_image': 'https://via.placeholder.com/150?text=Harry+Potter',
+    },
+    {
+        'title': 'To Kill a Mockingbird',
+        'author': 'Harper Lee',
+        'genre': 'Fiction',
+        'description': 'A story about racial injustice and loss of innocence in the American South.',
+        'published_year': 1960,
+        'isbn': '9780061120084',
+        'cover_image': 'https://via.placeholder.com/150?text=To+Kill+a+Mockingbird',
+    },
+    {
+        'title': '1984',
+        'author': 'George Orwell',
+        'genre': 'Science Fiction',
+        'description': 'A dystopian novel about totalitarianism and mass surveillance.',
+        'published_year': 1949,
+        'isbn': '9780451524935',
+        'cover_image': 'https://via.placeholder.com/150?text=1984',
+    },
+]
+
+
+def migration(version):
+    """Register a migration function for the given schema version"""
+    def register(func):
+        MIGRATIONS.append((version, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+
+def table_exists(conn, name):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row is not None
+
+
+def column_names(conn, table):
+    return [column[1] for column in conn.execute(f"PRAGMA table_info({table})")]
+
+
+@migration(1)
+def create_books_table(conn):
+    """Create the books table and seed it with sample books on first creation"""
+    # Databases created before migrations existed already have the table
+    # (and the user's books); only a brand new database gets the samples
+    is_new = not table_exists(conn, 'books')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS books
+        (id TEXT PRIMARY KEY,
+         title TEXT NOT NULL,
+         author TEXT NOT NULL,
+         genre TEXT,
+         description TEXT,
+         published_year INTEGER,
+         isbn TEXT,
+         cover_image TEXT,
+         date_added TEXT)
+    ''')
+    if is_new:
+        date_added = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn.executemany('''
+            INSERT INTO books (id, title, author, genre, description, published_year, isbn, cover_image, date_added)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (str(uuid.uuid4()), book['title'], book['author'], book['genre'], book['description'],
+             book['published_year'], book['isbn'], book['cover_image'], date_added)
+            for book in SEED_BOOKS
+        ])
+
+
+@migration(2)
+def add_file_path_column(conn):
+    """Add the file_path column used for uploaded book files"""
+    if 'file_path' not in column_names(conn, 'books'):
+        conn.execute("ALTER TABLE books ADD COLUMN file_path TEXT")
+
+
+@migration(3)
+def create_books_fts(conn):
+    """Create the FTS5 index used by search and keep it in sync with triggers"""
+    # External-content table: the text lives only in books, the index is
+    # keyed by books.rowid. Use incremental vacuum or rebuild the index after
+    # a full VACUUM, since that may renumber rowids.
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+            title, author, description, genre, isbn,
+            content='books', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, title, author, description, genre, isbn)
+            VALUES (new.rowid, new.title, new.author, new.description, new.genre, new.isbn);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author, description, genre, isbn)
+            VALUES ('delete', old.rowid, old.title, old.author, old.description, old.genre, old.isbn);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author, description, genre, isbn)
+            VALUES ('delete', old.rowid, old.title, old.author, old.description, old.genre, old.isbn);
+            INSERT INTO books_fts (rowid, title, author, description, genre, isbn)
+            VALUES (new.rowid, new.title, new.author, new.description, new.genre, new.isbn);
+        END
+    ''')
+    # Index the books that already exist
+    conn.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+
+
+@migration(4)
+def add_date_added_index(conn):
+    """Index the (date_added, id) order used to page through the library"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_date_added ON books (date_added, id)")
+
+
+@migration(5)
+def add_facet_indexes(conn):
+    """Index author and genre so the dashboard aggregates don't scan the table"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_author ON books (author)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_genre ON books (genre)")
+
+
+@migration(6)
+def add_isbn_index(conn):
+    """Index ISBNs so imports can skip books that are already in the library"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_isbn ON books (isbn)")
+
+
+@migration(7)
+def add_enrichment_checkpoint(conn):
+    """Track which books the metadata enrichment job has already looked up"""
+    if 'enriched_at' not in column_names(conn, 'books'):
+        conn.execute("ALTER TABLE books ADD COLUMN enriched_at TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_unenriched ON books (enriched_at) WHERE enriched_at IS NULL")
+
+
+@migration(8)
+def create_cover_thumbnails(conn):
+    """Map cover URLs to the digest of their locally cached thumbnails"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cover_thumbnails
+        (url TEXT PRIMARY KEY,
+         digest TEXT NOT NULL,
+         fetched_at TEXT)
+    ''')
+
+
+@migration(9)
+def create_blobs_table(conn):
+    """Reference counts for content-addressed uploaded files"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS blobs
+        (digest TEXT PRIMARY KEY,
+         path TEXT NOT NULL,
+         size INTEGER NOT NULL,
+         refcount INTEGER NOT NULL DEFAULT 0)
+    ''')
+
+
+@migration(10)
+def create_book_pages_fts(conn):
+    """Full-text index over the pages and chapters of uploaded book files"""
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS book_pages_fts USING fts5(
+            file_path UNINDEXED, location UNINDEXED, content,
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS indexed_files
+        (id INTEGER PRIMARY KEY,
+         file_path TEXT NOT NULL UNIQUE,
+         indexed_at TEXT NOT NULL,
+         chunks INTEGER NOT NULL)
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_file_path ON books (file_path)")
+
+
+@migration(11)
+def add_deleted_at(conn):
+    """Tombstone for soft-deleted books; live-book reads filter on it"""
+    if 'deleted_at' not in column_names(conn, 'books'):
+        conn.execute("ALTER TABLE books ADD COLUMN deleted_at TEXT")
+    # Paging, counts and recent additions only ever look at live books
+    conn.execute("DROP INDEX IF EXISTS idx_books_date_added")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_live ON books (date_added, id) WHERE deleted_at IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_deleted ON books (deleted_at) WHERE deleted_at IS NOT NULL")
+
+
+@migration(12)
+def add_duplicate_keys(conn):
+    """ISBN identifiers and normalized title/author keys for duplicate detection"""
+    from library.dedupe import backfill
+    columns = column_names(conn, 'books')
+    for column in ('title_key', 'author_key'):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE books ADD COLUMN {column} TEXT")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS book_identifiers
+        (isbn13 TEXT NOT NULL,
+         book_id TEXT NOT NULL,
+         PRIMARY KEY (isbn13, book_id)) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_book_identifiers_book ON book_identifiers (book_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_author_key ON books (author_key, title_key) WHERE deleted_at IS NULL")
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_identifiers_ad AFTER DELETE ON books BEGIN
+            DELETE FROM book_identifiers WHERE book_id = old.id;
+        END
+    ''')
+    backfill(conn)
+
+
+def _iso_timestamp(value, default):
+    try:
+        return datetime.fromisoformat(str(value).strip().replace('/', '-')).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return default
+
+
+@migration(13)
+def add_access_pattern_indexes(conn):
+    """Partial, covering indexes for live-book facets and year ranges; ISO date_added everywhere"""
+    # Keyset paging compares (date_added, id), which a NULL or mixed-format
+    # date breaks; every value becomes 'YYYY-MM-DD HH:MM:SS'
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.executemany("UPDATE books SET date_added = ? WHERE rowid = ?", [
+        (_iso_timestamp(date_added, now), rowid)
+        for rowid, date_added in conn.execute('''
+            SELECT rowid, date_added FROM books
+            WHERE date_added IS NULL
+               OR date_added NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]'
+        ''').fetchall()
+    ])
+    # Aggregates only count live books, so the indexes only hold live books.
+    # SQLite only reads an index without the table (a covering index) when
+    # the index has every column the query mentions, deleted_at included,
+    # so it is stored as a trailing column even though it is always NULL.
+    for name, columns in (
+        ('idx_books_live', 'date_added, id'),
+        ('idx_books_live_author', 'author'),
+        ('idx_books_live_genre', 'genre'),
+        ('idx_books_live_year', 'published_year, title'),
+        ('idx_books_author_key', 'author_key, title_key'),
+    ):
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.execute(f"CREATE INDEX {name} ON books ({columns}, deleted_at) WHERE deleted_at IS NULL")
+    conn.execute("DROP INDEX IF EXISTS idx_books_author")
+    conn.execute("DROP INDEX IF EXISTS idx_books_genre")
+    # ISBN lookups go through book_identifiers now
+    conn.execute("DROP INDEX IF EXISTS idx_books_isbn")
+
+
+def _facet_upserts(row, delta, condition):
+    from library.facets import FACET_EXPRESSIONS
+    return "\n".join(f'''
+            INSERT INTO facet_counts (facet, value, count)
+            SELECT '{facet}', {expression.format(row=row)}, {delta} WHERE {condition}
+            ON CONFLICT (facet, value) DO UPDATE SET count = count + {delta};'''
+        for facet, expression in FACET_EXPRESSIONS.items())
+
+
+@migration(14)
+def create_facet_counts(conn):
+    """Live-book counts per genre, author, decade and has-file, kept current by triggers"""
+    from library.facets import FACET_EXPRESSIONS
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS facet_counts
+        (facet TEXT NOT NULL,
+         value TEXT NOT NULL,
+         count INTEGER NOT NULL,
+         PRIMARY KEY (facet, value)) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_facet_counts_top ON facet_counts (facet, count DESC, value)")
+    # A one-value filter walks its index already in (date_added, id) order,
+    # so the first page of even the most common genre reads a page worth of
+    # index entries instead of sorting every match. Dashboard aggregates
+    # still read the genre and author indexes without the table.
+    for name, columns in (
+        ('idx_books_live_author', 'author'),
+        ('idx_books_live_genre', 'genre'),
+        ('idx_books_live_decade', 'published_year / 10 * 10'),
+    ):
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.execute(f"CREATE INDEX {name} ON books ({columns}, date_added, id, deleted_at) WHERE deleted_at IS NULL")
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_books_live_files ON books (date_added, id, deleted_at)
+        WHERE deleted_at IS NULL AND file_path IS NOT NULL AND file_path != ''
+    ''')
+    # Tombstoning, restoring or editing a book moves it between values;
+    # rows whose count drops to 0 stay and are skipped when reading
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS facet_counts_insert AFTER INSERT ON books BEGIN
+            {_facet_upserts('new', 1, 'new.deleted_at IS NULL')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS facet_counts_delete AFTER DELETE ON books BEGIN
+            {_facet_upserts('old', -1, 'old.deleted_at IS NULL')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS facet_counts_update
+        AFTER UPDATE OF genre, author, published_year, file_path, deleted_at ON books BEGIN
+            {_facet_upserts('old', -1, 'old.deleted_at IS NULL')}
+            {_facet_upserts('new', 1, 'new.deleted_at IS NULL')}
+        END
+    ''')
+    conn.execute("DELETE FROM facet_counts")
+    for facet, expression in FACET_EXPRESSIONS.items():
+        conn.execute(f'''
+            INSERT INTO facet_counts (facet, value, count)
+            SELECT '{facet}', {expression.format(row='books')}, COUNT(*) FROM books
+            WHERE deleted_at IS NULL
+            GROUP BY 2
+        ''')
+
+
+@migration(15)
+def create_jobs_table(conn):
+    """Queue of background jobs submitted by the app"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs
+        (id INTEGER PRIMARY KEY,
+         kind TEXT NOT NULL,
+         payload TEXT NOT NULL,
+         status TEXT NOT NULL,
+         progress TEXT,
+         result TEXT,
+         error TEXT,
+         attempts INTEGER NOT NULL DEFAULT 0,
+         created_at TEXT NOT NULL,
+         started_at TEXT,
+         heartbeat_at TEXT,
+         finished_at TEXT)
+    ''')
+    # Workers look for the oldest queued job; recovery for stale running ones
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs (id) WHERE status = 'queued'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (heartbeat_at) WHERE status = 'running'")
+
+
+@migration(16)
+def create_similar_index(conn):
+    """Term vectors and their inverted index for "more like this" (see library.similar)"""
+    from library.similar import INLINE_BACKFILL, backfill
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS book_vectors
+        (book_id TEXT PRIMARY KEY,
+         terms TEXT NOT NULL) WITHOUT ROWID
+    ''')
+    # Postings sorted by weight within a term, so a query reads the heaviest first
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS book_terms
+        (term TEXT NOT NULL,
+         weight INTEGER NOT NULL,
+         book_id TEXT NOT NULL,
+         PRIMARY KEY (term, weight, book_id)) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS term_df
+        (term TEXT PRIMARY KEY,
+         df INTEGER NOT NULL) WITHOUT ROWID
+    ''')
+    # Vectors are only ever inserted and deleted; the triggers keep the
+    # postings and document frequencies in step with them
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS book_vectors_insert AFTER INSERT ON book_vectors BEGIN
+            INSERT INTO book_terms (term, weight, book_id)
+            SELECT key, value, new.book_id FROM json_each(new.terms);
+            INSERT INTO term_df (term, df)
+            SELECT key, 1 FROM json_each(new.terms) WHERE true
+            ON CONFLICT (term) DO UPDATE SET df = df + 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS book_vectors_delete AFTER DELETE ON book_vectors BEGIN
+            DELETE FROM book_terms
+            WHERE (term, weight, book_id) IN (SELECT key, value, old.book_id FROM json_each(old.terms));
+            UPDATE term_df SET df = df - 1 WHERE term IN (SELECT key FROM json_each(old.terms));
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_vectors_ad AFTER DELETE ON books BEGIN
+            DELETE FROM book_vectors WHERE book_id = old.id;
+        END
+    ''')
+    # Indexing takes minutes per million books; past INLINE_BACKFILL the
+    # rest is left to a background job so opening the library stays quick
+    if backfill(conn, limit=INLINE_BACKFILL) == INLINE_BACKFILL:
+        conn.execute(
+            "INSERT INTO jobs (kind, payload, status, created_at) VALUES ('index_similar', '{}', 'queued', ?)",
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),)
+        )
+
+
+@migration(17)
+def rekey_duplicates(conn):
+    """Title keys keep subtitles and volume numbers; author keys skip suffixes like "Jr." """
+    from library.dedupe import book_keys
+    last_rowid = 0
+    while True:
+        rows = conn.execute(
+            "SELECT rowid, title, author, title_key, author_key FROM books WHERE rowid > ? ORDER BY rowid LIMIT 5000",
+            (last_rowid,)
+        ).fetchall()
+        if not rows:
+            break
+        # Only changed rows are written; every update also reindexes books_fts
+        conn.executemany("UPDATE books SET title_key = ?, author_key = ? WHERE rowid = ?", [
+            (*keys, rowid)
+            for rowid, title, author, *old_keys in rows
+            for keys in (book_keys(title, author),) if list(keys) != old_keys
+        ])
+        last_rowid = rows[-1][0]
+
+
+@migration(18)
+def add_updated_at(conn):
+    """Record when a book was last changed, so incremental backups also see restored books"""
+    if 'updated_at' not in column_names(conn, 'books'):
+        conn.execute("ALTER TABLE books ADD COLUMN updated_at TEXT")
+    # Only books changed since they were added need a value
+    conn.execute('''
+        UPDATE books SET updated_at = MAX(COALESCE(enriched_at, ''), COALESCE(deleted_at, ''))
+        WHERE updated_at IS NULL AND (enriched_at IS NOT NULL OR deleted_at IS NOT NULL)
+    ''')
+
+
+@migration(19)
+def create_library_generation(conn):
+    """A counter bumped by every change to the books, which other processes' caches watch"""
+    # Jobs, thumbnails and lookup caching also commit to the database, so
+    # data_version alone would clear caches on writes that change no book
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS library_generation
+        (id INTEGER PRIMARY KEY CHECK (id = 1),
+         generation INTEGER NOT NULL)
+    ''')
+    conn.execute("INSERT OR IGNORE INTO library_generation (id, generation) VALUES (1, 0)")
+    for table, event in (('books', 'INSERT'), ('books', 'UPDATE'), ('books', 'DELETE'),
+                         ('book_vectors', 'INSERT'), ('book_vectors', 'DELETE')):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_generation_{event.lower()} AFTER {event} ON {table} BEGIN
+                UPDATE library_generation SET generation = generation + 1 WHERE id = 1;
+            END
+        ''')
+
+
+@migration(20)
+def create_book_changes(conn):
+    """The generation of each book's latest write, which incremental backups select by"""
+    # Rowids are reused after a purge and dates are set by whoever writes
+    # the book, so neither finds every change; the generation only grows
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS book_changes
+        (change INTEGER PRIMARY KEY,
+         book_id TEXT NOT NULL UNIQUE)
+    ''')
+    conn.execute("INSERT OR IGNORE INTO book_changes (change, book_id) SELECT rowid, id FROM books")
+    conn.execute('''
+        UPDATE library_generation
+        SET generation = MAX(generation, (SELECT COALESCE(MAX(change), 0) FROM book_changes))
+        WHERE id = 1
+    ''')
+    # Recorded by the generation triggers themselves, right after the bump
+    record = '''
+        INSERT INTO book_changes (change, book_id)
+        VALUES ((SELECT generation FROM library_generation WHERE id = 1), new.id)
+        ON CONFLICT (book_id) DO UPDATE SET change = excluded.change;
+    '''
+    for event, statement in (('INSERT', record), ('UPDATE', record),
+                             ('DELETE', "DELETE FROM book_changes WHERE book_id = old.id;")):
+        conn.execute(f"DROP TRIGGER IF EXISTS books_generation_{event.lower()}")
+        conn.execute(f'''
+            CREATE TRIGGER books_generation_{event.lower()} AFTER {event} ON books BEGIN
+                UPDATE library_generation SET generation = generation + 1 WHERE id = 1;
+                {statement}
+            END
+        ''')
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, lock=None):
+    """Apply all pending migrations and return the resulting schema version.
+
+    lock (e.g. the pool's write lock) is held while migrating, so other
+    processes sharing it wait for a long migration instead of timing out.
+    """
+    if schema_version(conn) >= MIGRATIONS[-1][0]:
+        return schema_version(conn)
+
+    with lock or contextlib.nullcontext():
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-read under the write lock in case another process migrated first
+            version = schema_version(conn)
+            for target, func in MIGRATIONS:
+                if target > version:
+                    func(conn)
+                    conn.execute(f"PRAGMA user_version = {target}")
+                    version = target
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    return version
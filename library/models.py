@@ -0,0 +1,35 @@
+"""Compact record type for book rows.
+
+Book is a NamedTuple: immutable, cheap to build straight from a SQLite row
+with Book._make, and shareable between sessions through the query cache.
+Queries that only need some columns select NULL for the rest, so every row
+still maps positionally onto Book.
+"""
+from typing import NamedTuple, Optional
+
+
+class Book(NamedTuple):
+    id: str
+    title: str
+    author: str
+    genre: Optional[str] = None
+    description: Optional[str] = None
+    published_year: Optional[int] = None
+    isbn: Optional[str] = None
+    cover_image: Optional[str] = None
+    date_added: Optional[str] = None
+    file_path: Optional[str] = None
+
+
+BOOK_FIELDS = Book._fields
+
+
+def book_columns(fields=BOOK_FIELDS, table=None):
+    """SELECT list for Book rows: the wanted fields in Book order, NULL elsewhere"""
+    prefix = f"{table}." if table else ""
+    return ", ".join(f"{prefix}{field}" if field in fields else f"NULL AS {field}" for field in BOOK_FIELDS)
+
+
+def books_from_cursor(cursor):
+    """Build Book records from a cursor selecting book_columns()"""
+    return [Book._make(row) for row in cursor]
@@ -0,0 +1,57 @@
+"""Full-text search over the books table.
+
+Searches go through the books_fts FTS5 index (kept in sync by triggers, see
+migrations) instead of LIKE scans, so results are BM25-ranked and lookups
+stay fast as the library grows. Queries support:
+
+- plain words, matched as prefixes:      harry pot
+- quoted phrases:                         "mockingbird"
+- field filters:                          author:rowling genre:fantasy
+"""
+import re
+
+from library.models import book_columns
+
+SEARCH_FIELDS = ('title', 'author', 'description', 'genre', 'isbn')
+# BM25 column weights, in SEARCH_FIELDS order: title and author matter most
+FIELD_WEIGHTS = (10.0, 5.0, 1.0, 2.0, 3.0)
+SEARCH_LIMIT = 100
+
+_TERM_RE = re.compile(r'(?:(\w+):)?("[^"]*"?|[^\s"]+)')
+
+SEARCH_SQL = f'''
+    SELECT {book_columns(table="books")}
+    FROM books_fts
+    JOIN books ON books.rowid = books_fts.rowid
+    WHERE books_fts MATCH ? AND books.deleted_at IS NULL{{filters}}
+    ORDER BY bm25(books_fts, {", ".join(str(w) for w in FIELD_WEIGHTS)})
+    LIMIT ?
+'''
+
+
+def _phrase(text):
+    """Quote text as an FTS5 phrase so punctuation can't break the query"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def build_match_query(text, fields=SEARCH_FIELDS):
+    """Translate a user search string into an FTS5 MATCH expression.
+
+    Only the given fields may be used as field filters. Returns None when the
+    string contains nothing searchable.
+    """
+    terms = []
+    for field, value in _TERM_RE.findall(text or ''):
+        quoted = value.startswith('"')
+        value = value.strip('"').strip()
+        if not re.search(r'\w', value):
+            continue
+        # Exact phrases stay exact; bare words match as prefixes
+        term = _phrase(value) if quoted else _phrase(value) + '*'
+        if field and field.lower() in fields:
+            term = f"{field.lower()} : {term}"
+        elif field:
+            # Not a known field (e.g. "re:"), so search the whole token
+            term = _phrase(f"{field}:{value}") + ('' if quoted else '*')
+        terms.append(term)
+    return " AND ".join(terms) if terms else None
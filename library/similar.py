@@ -0,0 +1,189 @@
+""""More like this": similar books from a precomputed term index.
+
+Every book is a sparse vector of weighted terms from its title, author,
+genre and description. The vectors are computed once, when a book is
+added, imported or enriched, and stored in book_vectors as JSON
+{term: weight}; triggers (see migrations) expand them into the inverted
+index book_terms and keep per-term document counts in term_df. Purging a
+book deletes its vector and postings.
+
+Finding neighbours never looks at the whole library:
+
+- the book's own vector is one primary key read;
+- its terms are weighted by TF-IDF (the idf from term_df) and only the
+  QUERY_TERMS most telling ones are kept;
+- for each of those, book_terms yields the POSTINGS books where the term
+  weighs most, an index range read in weight order;
+- scores (the dot product of the idf-weighted vectors) are summed over
+  those candidates and the best live ones returned.
+
+Weights are L2-normalized per book and stored as integers, so the index
+compares exactly and short, focused books aren't outscored by long ones.
+
+Existing books are indexed when the schema is upgraded, by a background
+job (see library.jobs) for large libraries.
+
+Usage:
+    python -m library.similar BOOK_ID [--db library.db] [--limit 6]
+    python -m library.similar --rebuild [--db library.db]
+"""
+import sys
+import json
+import math
+import argparse
+
+from library.dedupe import author_key, normalize
+from library.models import BOOK_FIELDS, book_columns, books_from_cursor
+
+SIMILAR_LIMIT = 6
+# Terms kept per book, heaviest first
+MAX_TERMS = 48
+# Terms of the book looked up per query, and candidates read per term
+QUERY_TERMS = 16
+POSTINGS = 500
+# Stored weights are fractions of WEIGHT_SCALE
+WEIGHT_SCALE = 10000
+# Books the migration indexes itself; a job indexes the rest of bigger libraries
+INLINE_BACKFILL = 50000
+# Books indexed per transaction by that job, short enough not to hold up writes
+BACKFILL_BATCH = 250
+
+FIELD_WEIGHTS = {'title': 2.0, 'author': 3.0, 'genre': 1.5, 'description': 1.0}
+STOPWORDS = frozenset('''
+    a an and are as at be but by for from has have he her his in into is it its of on or
+    she that the their them they this to was were which who will with about after all also
+    book novel story new one two more most other over than up
+'''.split())
+
+VECTOR_SQL = "SELECT terms FROM book_vectors WHERE book_id = ?"
+TERM_DF_SQL = "SELECT term, df FROM term_df WHERE term IN (SELECT value FROM json_each(?))"
+# Facet counts already hold the number of live books
+BOOK_COUNT_SQL = "SELECT SUM(count) FROM facet_counts WHERE facet = 'has_file'"
+POSTINGS_SQL = "SELECT book_id, weight FROM book_terms WHERE term = ? ORDER BY weight DESC LIMIT ?"
+CANDIDATES_SQL = "SELECT {columns} FROM books WHERE id IN (SELECT value FROM json_each(?)) AND deleted_at IS NULL"
+DELETE_VECTORS_SQL = "DELETE FROM book_vectors WHERE book_id IN (SELECT value FROM json_each(?))"
+INSERT_VECTOR_SQL = "INSERT INTO book_vectors (book_id, terms) VALUES (?, ?)"
+UNINDEXED_SQL = '''
+    SELECT rowid, id, title, author, genre, description FROM books
+    WHERE rowid > ? AND id NOT IN (SELECT book_id FROM book_vectors)
+    ORDER BY rowid LIMIT ?
+'''
+
+
+def _words(text):
+    return [word for word in normalize(text).split() if len(word) > 1 and word not in STOPWORDS and not word.isdigit()]
+
+
+def book_vector(title, author, genre, description):
+    """Return {term: integer weight} for a book; empty if it has no usable text"""
+    weights = {}
+
+    def add(term, weight):
+        weights[term] = weights.get(term, 0.0) + weight
+
+    for word in _words(title):
+        add(word, FIELD_WEIGHTS['title'])
+    for word in _words(description):
+        add(word, FIELD_WEIGHTS['description'])
+    # Authors and genres are terms of their own, so "King" the author isn't "king" the word
+    key = author_key(author)
+    if key:
+        add(f"author:{key}", FIELD_WEIGHTS['author'])
+    genre = normalize(genre)
+    if genre and genre not in ('other', 'unknown'):
+        add(f"genre:{genre}", FIELD_WEIGHTS['genre'])
+
+    top = sorted(weights.items(), key=lambda item: (-item[1], item[0]))[:MAX_TERMS]
+    norm = math.sqrt(sum(weight * weight for _, weight in top))
+    return {term: max(1, round(weight / norm * WEIGHT_SCALE)) for term, weight in top}
+
+
+def index_books(conn, books):
+    """(Re)index books given as (id, title, author, genre, description) rows"""
+    books = list(books)
+    if not books:
+        return
+    conn.execute(DELETE_VECTORS_SQL, (json.dumps([book[0] for book in books]),))
+    conn.executemany(INSERT_VECTOR_SQL, (
+        (book_id, json.dumps(vector))
+        for book_id, *fields in books
+        for vector in (book_vector(*fields),) if vector
+    ))
+
+
+def index_batch(conn, after_rowid=0, size=BACKFILL_BATCH):
+    """Index up to size unindexed books past after_rowid; return (books indexed, last rowid)"""
+    rows = conn.execute(UNINDEXED_SQL, (after_rowid, size)).fetchall()
+    index_books(conn, (row[1:] for row in rows))
+    return len(rows), rows[-1][0] if rows else after_rowid
+
+
+def backfill(conn, batch_size=5000, limit=None):
+    """Index books that have no vector yet, up to limit of them; return how many were indexed"""
+    last_rowid = 0
+    indexed = 0
+    while limit is None or indexed < limit:
+        count, last_rowid = index_batch(conn, last_rowid, batch_size if limit is None else min(batch_size, limit - indexed))
+        if not count:
+            break
+        indexed += count
+    return indexed
+
+
+def similar_books(conn, book_id, limit=SIMILAR_LIMIT, fields=BOOK_FIELDS):
+    """Return up to limit live Books most like book_id, best first"""
+    row = conn.execute(VECTOR_SQL, (book_id,)).fetchone()
+    if row is None:
+        return []
+    vector = json.loads(row[0])
+    df = dict(conn.execute(TERM_DF_SQL, (json.dumps(list(vector)),)).fetchall())
+    total = max([conn.execute(BOOK_COUNT_SQL).fetchone()[0] or 0, *df.values()])
+
+    # Terms no other book has can't find anything
+    idf = {term: math.log(1 + total / df[term]) for term in vector if df.get(term, 0) > 1}
+    terms = sorted(idf, key=lambda term: vector[term] * idf[term] ** 2, reverse=True)[:QUERY_TERMS]
+    scores = {}
+    for term in terms:
+        query_weight = vector[term] * idf[term] ** 2
+        for other_id, weight in conn.execute(POSTINGS_SQL, (term, POSTINGS)):
+            scores[other_id] = scores.get(other_id, 0.0) + query_weight * weight
+    scores.pop(book_id, None)
+
+    # A few spares, in case some of the best are removed books
+    best = sorted(scores, key=scores.get, reverse=True)[:limit * 2]
+    books = books_from_cursor(conn.execute(
+        CANDIDATES_SQL.format(columns=book_columns(fields)), (json.dumps(best),)
+    ))
+    books.sort(key=lambda book: scores[book.id], reverse=True)
+    return books[:limit]
+
+
+def main(argv=None):
+    from library.core import Library
+    from library.db import DB_PATH
+
+    parser = argparse.ArgumentParser(description="Find books similar to a book")
+    parser.add_argument("book_id", nargs="?")
+    parser.add_argument("--db", default=DB_PATH, help="library database path")
+    parser.add_argument("--limit", type=int, default=SIMILAR_LIMIT)
+    parser.add_argument("--rebuild", action="store_true", help="reindex every book")
+    args = parser.parse_args(argv)
+    if not args.rebuild and not args.book_id:
+        parser.error("give a BOOK_ID or --rebuild")
+
+    library = Library(args.db, pool_size=1)
+    try:
+        if args.rebuild:
+            with library.pool.transaction() as conn:
+                conn.execute("DELETE FROM book_vectors")
+                print(f"Indexed {backfill(conn)} books", file=sys.stderr)
+            library._changed()
+        if args.book_id:
+            for book in library.similar_books(args.book_id, args.limit):
+                print(f"{book.id}\t{book.title}\t{book.author}")
+    finally:
+        library.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Summary statistics for the Home page dashboard.
+
+Each figure is a single SQL aggregate answered from an index, rather than
+loading the whole books table into pandas.
+"""
+from datetime import datetime
+
+RECENT_LIMIT = 3
+
+TOTAL_BOOKS_SQL = "SELECT COUNT(*) FROM books WHERE deleted_at IS NULL"
+TOTAL_AUTHORS_SQL = "SELECT COUNT(DISTINCT author) FROM books WHERE deleted_at IS NULL"
+TOP_GENRE_SQL = '''
+    SELECT genre FROM books
+    WHERE genre IS NOT NULL AND deleted_at IS NULL
+    GROUP BY genre
+    ORDER BY COUNT(*) DESC
+    LIMIT 1
+'''
+RECENT_SQL = '''
+    SELECT title, author, date_added FROM books
+    WHERE deleted_at IS NULL
+    ORDER BY date_added DESC, id DESC
+    LIMIT ?
+'''
+
+
+def library_stats(conn, recent_limit=RECENT_LIMIT):
+    """Return total books, distinct authors, most common genre and recent additions"""
+    total_books = conn.execute(TOTAL_BOOKS_SQL).fetchone()[0]
+    total_authors = conn.execute(TOTAL_AUTHORS_SQL).fetchone()[0]
+    top_genre = conn.execute(TOP_GENRE_SQL).fetchone()
+    recent = conn.execute(RECENT_SQL, (recent_limit,)).fetchall()
+
+    return {
+        'total_books': total_books,
+        'total_authors': total_authors,
+        'top_genre': top_genre[0] if top_genre else None,
+        'recent': [
+            {'title': title, 'author': author, 'date_added': datetime.fromisoformat(date_added)}
+            for title, author, date_added in recent
+        ],
+    }
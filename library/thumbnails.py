@@ -0,0 +1,146 @@
+"""Local, content-addressed cache of book cover thumbnails.
+
+Each cover URL is fetched once, resized with Pillow to a few fixed sizes and
+stored under the SHA-256 of the original image, so the same cover shared by
+several books (or re-fetched from another URL) is stored once. Placeholder
+covers (via.placeholder.com) are drawn locally instead of being fetched.
+Pages only ever link to the local files; a cover that is not cached yet is
+fetched in the background and shows up on a later rerun.
+"""
+import io
+import os
+import time
+import hashlib
+import textwrap
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+from PIL import Image, ImageDraw
+
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "thumbnails")
+# Bounding boxes (width, height) for each stored size
+SIZES = {
+    'small': (96, 144),
+    'medium': (200, 300),
+    'large': (400, 600),
+}
+MAX_COVER_BYTES = 10 * 1024 * 1024
+TIMEOUT = (3.05, 10)
+WORKERS = 4
+# How long to wait before retrying a cover that failed to download
+RETRY_AFTER = 60 * 60
+
+
+def is_placeholder(url):
+    return urlsplit(url).netloc == 'via.placeholder.com'
+
+
+def render_placeholder(url):
+    """Draw a plain cover with the placeholder's text, as PNG bytes"""
+    text = parse_qs(urlsplit(url).query).get('text', ['Book'])[0]
+    width, height = SIZES['large']
+    image = Image.new('RGB', (width, height), (204, 213, 230))
+    draw = ImageDraw.Draw(image)
+    draw.multiline_text((24, height // 3), textwrap.fill(text, 28), fill=(30, 58, 138), spacing=8)
+    out = io.BytesIO()
+    image.save(out, format='PNG')
+    return out.getvalue()
+
+
+class ThumbnailStore:
+    """Fetch, resize and serve cover thumbnails from local disk"""
+
+    def __init__(self, pool, root=THUMBNAIL_DIR, workers=WORKERS):
+        self.pool = pool
+        self.root = root
+        self.session = requests.Session()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnails")
+        self._digests = {}
+        self._pending = set()
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    def relative_path(self, digest, size):
+        """Path of a thumbnail relative to the store root"""
+        return f"{digest[:2]}/{digest}-{size}.jpg"
+
+    def digest_for(self, url):
+        """Return the content digest for a cover URL, or None if it isn't cached"""
+        with self._lock:
+            if url in self._digests:
+                return self._digests[url]
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT digest FROM cover_thumbnails WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self._digests[url] = row[0]
+        return row[0]
+
+    def thumbnail(self, url, size='medium'):
+        """Return the relative path of a cached thumbnail.
+
+        If the cover isn't cached yet, a background fetch is scheduled and None
+        is returned, so rendering never waits on the network.
+        """
+        if not url:
+            return None
+        digest = self.digest_for(url)
+        if digest is not None:
+            return self.relative_path(digest, size)
+        with self._lock:
+            failed_at = self._failed.get(url)
+            if url in self._pending or (failed_at and time.time() - failed_at < RETRY_AFTER):
+                return None
+            self._pending.add(url)
+        self._executor.submit(self._fetch_in_background, url)
+        return None
+
+    def _fetch_in_background(self, url):
+        try:
+            self.fetch(url)
+        except Exception:
+            with self._lock:
+                self._failed[url] = time.time()
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+    def _download(self, url):
+        with self.session.get(url, timeout=TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            data = io.BytesIO()
+            for chunk in response.iter_content(64 * 1024):
+                data.write(chunk)
+                if data.tell() > MAX_COVER_BYTES:
+                    raise ValueError(f"Cover image too large: {url}")
+        return data.getvalue()
+
+    def fetch(self, url):
+        """Download (or draw) a cover, store every thumbnail size and return its digest"""
+        data = render_placeholder(url) if is_placeholder(url) else self._download(url)
+        digest = hashlib.sha256(data).hexdigest()
+
+        if not os.path.exists(os.path.join(self.root, self.relative_path(digest, 'small'))):
+            image = Image.open(io.BytesIO(data)).convert('RGB')
+            for size, box in SIZES.items():
+                path = os.path.join(self.root, self.relative_path(digest, size))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                thumb = image.copy()
+                thumb.thumbnail(box)
+                # Write then rename, so readers never see a half-written file
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                thumb.save(tmp_path, format='JPEG', quality=85, optimize=True)
+                os.replace(tmp_path, path)
+
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cover_thumbnails (url, digest, fetched_at) VALUES (?, ?, ?)",
+                (url, digest, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+        with self._lock:
+            self._digests[url] = digest
+        return digest
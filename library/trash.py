@@ -0,0 +1,184 @@
+"""Soft delete, undo and background purging of removed books.
+
+Removing books only sets their deleted_at tombstone, in one transaction for
+any number of books, so a removal can be undone and never has to wait for
+file deletion. A background purger later deletes tombstoned rows older than
+a grace period, reclaims their files and index entries, and returns freed
+pages to the filesystem with an incremental VACUUM.
+
+Usage:
+    python -m library.trash [--db library.db] [--grace SECONDS] [--vacuum]
+"""
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+from library import fulltext
+
+# Removed books can be restored for this long before they are purged
+PURGE_GRACE = 10 * 60
+PURGE_INTERVAL = 60
+# Seconds between sweeps of the uploads folder for files no book uses
+SWEEP_INTERVAL = 60 * 60
+PURGE_BATCH = 500
+# Free pages returned to the filesystem per purge
+VACUUM_PAGES = 2000
+# SQLite limits the number of ? parameters per statement
+ID_BATCH = 500
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+PURGE_SQL = '''
+    DELETE FROM books WHERE rowid IN (
+        SELECT rowid FROM books WHERE deleted_at IS NOT NULL AND deleted_at <= ? LIMIT ?
+    )
+    RETURNING file_path
+'''
+
+
+def _batches(ids):
+    ids = list(dict.fromkeys(ids))
+    for i in range(0, len(ids), ID_BATCH):
+        yield ids[i:i + ID_BATCH]
+
+
+def soft_delete(conn, book_ids, now=None):
+    """Tombstone books; return the ids that were actually removed"""
+    now = now or datetime.now().strftime(TIMESTAMP_FORMAT)
+    removed = []
+    for batch in _batches(book_ids):
+        placeholders = ", ".join("?" * len(batch))
+        removed.extend(row[0] for row in conn.execute(
+            f"UPDATE books SET deleted_at = ?, updated_at = ? WHERE id IN ({placeholders}) AND deleted_at IS NULL RETURNING id",
+            [now, now, *batch]
+        ))
+    return removed
+
+
+def restore(conn, book_ids, now=None):
+    """Clear the tombstone of books that have not been purged yet; return their ids"""
+    now = now or datetime.now().strftime(TIMESTAMP_FORMAT)
+    restored = []
+    for batch in _batches(book_ids):
+        placeholders = ", ".join("?" * len(batch))
+        restored.extend(row[0] for row in conn.execute(
+            f"UPDATE books SET deleted_at = NULL, updated_at = ? WHERE id IN ({placeholders}) AND deleted_at IS NOT NULL RETURNING id",
+            [now, *batch]
+        ))
+    return restored
+
+
+def purge(pool, blobs, grace=PURGE_GRACE, batch_size=PURGE_BATCH):
+    """Permanently delete books tombstoned more than grace seconds ago.
+
+    Returns the number of books deleted. Files no other book uses are
+    removed from the blob store and the content index.
+    """
+    cutoff = (datetime.now() - timedelta(seconds=grace)).strftime(TIMESTAMP_FORMAT)
+    purged = 0
+    while True:
+        with pool.transaction() as conn:
+            rows = conn.execute(PURGE_SQL, (cutoff, batch_size)).fetchall()
+            orphans = {}
+            for (file_path,) in rows:
+                digest = blobs.release(conn, file_path)
+                if digest:
+                    orphans[digest] = file_path
+        for digest, file_path in orphans.items():
+            if blobs.collect(pool, digest):
+                with pool.transaction() as conn:
+                    fulltext.remove_file(conn, file_path)
+        purged += len(rows)
+        if len(rows) < batch_size:
+            return purged
+
+
+def incremental_vacuum(pool, pages=VACUUM_PAGES):
+    """Return up to pages free pages to the filesystem; no-op unless auto_vacuum is incremental"""
+    with pool.connection() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # execute() steps the pragma once, freeing a single page; executescript
+        # runs it to completion
+        conn.executescript(f"PRAGMA incremental_vacuum({pages})")
+        return free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def full_vacuum(pool):
+    """Rebuild the database file, switching it to incremental auto_vacuum.
+
+    Databases created before soft delete have auto_vacuum off, which only a
+    full VACUUM can change. VACUUM may renumber the books rowids the search
+    index points at, so the index is rebuilt afterwards. Run this offline:
+    it locks the database for as long as it takes to copy it.
+    """
+    with pool.connection() as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    with pool.transaction() as conn:
+        conn.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+
+
+class Purger:
+    """Purge tombstoned books on a daemon thread every interval seconds"""
+
+    def __init__(self, library, interval=PURGE_INTERVAL, grace=PURGE_GRACE):
+        self.library = library
+        self.interval = interval
+        self.grace = grace
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="purger", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        # With several worker processes only one of them purges
+        leader = self.library.leader("purger")
+        last_sweep = time.monotonic()
+        while not self._stop.wait(self.interval):
+            if leader is not None and not leader.elect():
+                continue
+            try:
+                self.library.purge_deleted(self.grace)
+                # Walking the uploads folder is slow, so it's done less often
+                if time.monotonic() - last_sweep >= SWEEP_INTERVAL:
+                    self.library.sweep_orphans()
+                    last_sweep = time.monotonic()
+            except Exception:
+                # A locked or busy database is retried on the next run
+                pass
+
+
+def main(argv=None):
+    from library.core import Library
+    from library.db import DB_PATH
+
+    parser = argparse.ArgumentParser(description="Permanently delete removed books and compact the database")
+    parser.add_argument("--db", default=DB_PATH, help="library database path")
+    parser.add_argument("--grace", type=int, default=PURGE_GRACE,
+                        help="only purge books removed at least this many seconds ago")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="rebuild the whole database file (needed once for databases with auto_vacuum off)")
+    args = parser.parse_args(argv)
+
+    library = Library(args.db, pool_size=1)
+    try:
+        started = time.perf_counter()
+        purged = library.purge_deleted(args.grace)
+        if args.vacuum:
+            full_vacuum(library.pool)
+        print(f"Purged {purged} books in {time.perf_counter() - started:.1f}s")
+    finally:
+        library.close()
+
+
+if __name__ == "__main__":
+    main()
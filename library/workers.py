@@ -0,0 +1,135 @@
+"""Coordination between several app processes sharing one library.
+
+Every Library watches the library generation (see ChangeFeed), a counter
+that triggers bump on every change to the books, and drops its query cache
+when it moves, so writes by the CLI, an import, a cron job or another app
+process show up on the next read. Commits that change no book, such as job
+progress or cached thumbnails, leave the cache alone.
+
+Behind a load balancer several Streamlit servers open the same database and
+uploads folder. Set LIBRARY_MULTI_WORKER=1 (or pass multi_worker=True to
+Library) and each process also:
+
+- queues its writes behind a lock file, so one transaction at a time asks
+  SQLite for the write lock instead of every waiting writer retrying it on
+  the busy timeout;
+- runs pending migrations under the same lock, so the other workers wait
+  for them however long they take;
+- elects one process to run background jobs such as the purger.
+
+Locks are flock(2) locks, released by the OS when a process dies. Where
+fcntl is unavailable only threads within a process are serialized, and
+SQLite's own locking keeps processes correct.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MULTI_WORKER = os.getenv("LIBRARY_MULTI_WORKER", "") not in ("", "0")
+# Seconds between checks for changes; 0 checks on every cached read
+POLL_INTERVAL = 0
+GENERATION_SQL = "SELECT generation FROM library_generation WHERE id = 1"
+
+
+def lock_path(db_path, name):
+    """The lock file for name next to the database"""
+    return f"{db_path}-{name}.lock"
+
+
+class FileLock:
+    """An exclusive lock shared by the threads of this process and by other processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def acquire(self, blocking=True):
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        try:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._thread_lock.release()
+            if blocking:
+                raise
+            return False
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            # Closing the descriptor drops the flock
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ChangeFeed:
+    """Notices changes to the books committed by other connections, in this process or another"""
+
+    def __init__(self, db_path, interval=POLL_INTERVAL):
+        self.interval = interval
+        # A connection of its own: data_version only reports other connections' commits
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._version = self._data_version()
+        self._generation = self._read_generation()
+        self._checked = time.monotonic()
+
+    def _data_version(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _read_generation(self):
+        return self._conn.execute(GENERATION_SQL).fetchone()[0]
+
+    def poll(self):
+        """Return True if the books changed since the last poll"""
+        now = time.monotonic()
+        if self.interval and now - self._checked < self.interval:
+            return False
+        with self._lock:
+            self._checked = now
+            # The pragma is free; the generation is only read after some commit
+            version = self._data_version()
+            if version == self._version:
+                return False
+            self._version = version
+            generation = self._read_generation()
+            changed, self._generation = generation != self._generation, generation
+            return changed
+
+    def close(self):
+        self._conn.close()
+
+
+class Leader:
+    """Holds a lock file for the life of the process, so one worker runs a background job"""
+
+    def __init__(self, db_path, name):
+        self._lock = FileLock(lock_path(db_path, name))
+        self.is_leader = False
+
+    def elect(self):
+        """Return True if this process runs the job; retried each time, so a dead leader is replaced"""
+        if not self.is_leader:
+            self.is_leader = self._lock.acquire(blocking=False)
+        return self.is_leader
@@ -1,15 +1,26 @@
 import streamlit as st
-import pandas as pd
 import json
 import os
 import sqlite3
-import requests
-from PIL import Image
 import io
 import base64
 import uuid
 from datetime import datetime
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from library import Library
+from library.core import PAGE_SIZE
+from library.db import DB_PATH
+from library.dedupe import DuplicateBook, PossibleDuplicate
+from library.facets import FACET_LABELS, FACETS, selection
+from library.downloads import LOCAL_HOST, UPLOADS_DIR, start_download_server, download_url
+from library.fulltext import ContentIndexer
+from library.lookup import LookupCache, LookupFailed, OpenLibraryClient
+from library.jobs import DONE, FAILED, JobQueue, save_job_file
+from library.instrument import REGISTRY, finish_rerun, record_bytes, start_rerun, timed
+from library.search import SEARCH_LIMIT
+from library.thumbnails import THUMBNAIL_DIR, ThumbnailStore
+from library.trash import Purger
 
 # Configure the Streamlit page
 st.set_page_config(
@@ -22,8 +33,73 @@ st.set_page_config(
 
 load_dotenv()
 
+# The debug panel is hidden unless LIBRARY_DEBUG=1 or the URL has ?debug=1
+DEBUG = os.getenv("LIBRARY_DEBUG") == "1" or st.query_params.get("debug") == "1"
 
 
+# Count the bytes of every message this script run sends to the browser
+def count_frontend_bytes():
+    ctx = get_script_run_ctx()
+    enqueue = getattr(ctx, "_enqueue", None)
+    if enqueue is None or getattr(enqueue, "counts_bytes", False):
+        return
+    def counting_enqueue(msg):
+        record_bytes(msg.ByteSize())
+        enqueue(msg)
+    counting_enqueue.counts_bytes = True
+    ctx._enqueue = counting_enqueue
+
+if DEBUG:
+    count_frontend_bytes()
+    start_rerun(
+        profile=st.session_state.get("debug_profile", False),
+        trace_memory=st.session_state.get("debug_tracemalloc", False)
+    )
+
+# Book files and cover thumbnails are served by a separate download server,
+# without authentication, so by default it only listens on this machine and
+# download links and covers only work in a browser running here. To use the
+# app from other machines, set both:
+#   DOWNLOAD_HOST=0.0.0.0 (or the interface to listen on)
+#   DOWNLOAD_BASE_URL=http://<server name>:8502, the address browsers reach it at
+DOWNLOAD_PORT = int(os.getenv("DOWNLOAD_PORT", "8502"))
+DOWNLOAD_HOST = os.getenv("DOWNLOAD_HOST", LOCAL_HOST)
+DOWNLOAD_BASE_URL = os.getenv("DOWNLOAD_BASE_URL", f"http://localhost:{DOWNLOAD_PORT}")
+
+
+# Start the file download server once per process, shared by all sessions
+@st.cache_resource
+def get_download_server():
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+    try:
+        return start_download_server(
+            {"files": UPLOADS_DIR, "thumbnails": THUMBNAIL_DIR},
+            host=DOWNLOAD_HOST,
+            port=DOWNLOAD_PORT,
+            metrics=REGISTRY.prometheus_text,
+            base_url=os.getenv("DOWNLOAD_BASE_URL")
+        )
+    except OSError:
+        # Running as one of several workers (LIBRARY_MULTI_WORKER): another
+        # process already serves the shared folders on this port
+        return None
+
+get_download_server()
+
+
+# Open the library once per process and share it across reruns and sessions
+@st.cache_resource
+def get_library():
+    library = Library(DB_PATH, UPLOADS_DIR)
+    # Index uploaded files in a background process pool
+    library.indexer = ContentIndexer(library.pool)
+    # Permanently delete removed books once they can no longer be undone
+    Purger(library).start()
+    # Run slow work (adds from Open Library, imports, enrichment) off the script thread
+    library.jobs = JobQueue(library).start()
+    return library
+
 # Add custom CSS for modern UI
 st.markdown("""
 <style>
@@ -71,185 +147,92 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Initialize database
-# Modify the init_db function to ensure it adds exactly 3 sample books
-def init_db():
-    """Initialize SQLite database for book storage"""
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS books
-        (id TEXT PRIMARY KEY,
-         title TEXT NOT NULL,
-         author TEXT NOT NULL,
-         genre TEXT,
-         description TEXT,
-         published_year INTEGER,
-         isbn TEXT,
-         cover_image TEXT,
-         date_added TEXT)
-    ''')
-    
-    # Check if we have at least 3 books
-    c.execute("SELECT COUNT(*) FROM books")
-    count = c.fetchone()[0]
-    
-    # If we have fewer than 3 books, delete all and add exactly 3 sample books
-    if count < 3:
-        # Clear existing books to avoid duplicates
-        c.execute("DELETE FROM books")
-        
-        # Add 3 sample books
-        sample_books = [
-            {
-                'id': str(uuid.uuid4()),
-                'title': 'Harry Potter and the Philosopher\'s Stone',
-                'author': 'J.K. Rowling',
-                'genre': 'Fantasy',
-                'description': 'The first book in the Harry Potter series.',
-                'published_year': 1997,
-                'isbn': '9780590353427',
-                'cover_image': 'https://via.placeholder.com/150?text=Harry+Potter',
-                'date_added': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            },
-            {
-                'id': str(uuid.uuid4()),
-                'title': 'To Kill a Mockingbird',
-                'author': 'Harper Lee',
-                'genre': 'Fiction',
-                'description': 'A story about racial injustice and loss of innocence in the American South.',
-                'published_year': 1960,
-                'isbn': '9780061120084',
-                'cover_image': 'https://via.placeholder.com/150?text=To+Kill+a+Mockingbird',
-                'date_added': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            },
-            {
-                'id': str(uuid.uuid4()),
-                'title': '1984',
-                'author': 'George Orwell',
-                'genre': 'Science Fiction',
-                'description': 'A dystopian novel about totalitarianism and mass surveillance.',
-                'published_year': 1949,
-                'isbn': '9780451524935',
-                'cover_image': 'https://via.placeholder.com/150?text=1984',
-                'date_added': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-        ]
-        
-        for book in sample_books:
-            c.execute('''
-                INSERT INTO books (id, title, author, genre, description, published_year, isbn, cover_image, date_added)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                book['id'],
-                book['title'],
-                book['author'],
-                book['genre'],
-                book['description'],
-                book['published_year'],
-                book['isbn'],
-                book['cover_image'],
-                book['date_added']
-            ))
-    
-    conn.commit()
-    conn.close()
-
-
-# Add this function to your code
-def update_db_schema():
-    """Update the database schema to include the file_path column if it doesn't exist"""
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    
-    # Check if file_path column exists
-    c.execute("PRAGMA table_info(books)")
-    columns = [column[1] for column in c.fetchall()]
-    
-    # Add file_path column if it doesn't exist
-    if 'file_path' not in columns:
-        c.execute("ALTER TABLE books ADD COLUMN file_path TEXT")
-        conn.commit()
-        print("Added file_path column to database")
-    
-    conn.close()
-
-# Call this function right after init_db()
-init_db()
-update_db_schema()
-
 # Function to add a book to the database
-def add_book_to_db(book_data):
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
+@timed("ui.add_book_to_db")
+def add_book_to_db(book_data, allow_duplicate=False, uploaded_file=None):
     try:
-        c.execute('''
-            INSERT INTO books (id, title, author, genre, description, published_year, isbn, cover_image, date_added, file_path)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            book_data['id'],
-            book_data['title'],
-            book_data['author'],
-            book_data['genre'],
-            book_data['description'],
-            book_data['published_year'],
-            book_data['isbn'],
-            book_data['cover_image'],
-            book_data['date_added'],
-            book_data.get('file_path', '')
-        ))
-        conn.commit()
+        # The upload is stored with the book, and deleted again if the book isn't saved
+        get_library().add_book(book_data, allow_duplicate=allow_duplicate, fileobj=uploaded_file,
+                               filename=uploaded_file.name if uploaded_file is not None else None)
         return True
-    except sqlite3.Error as e:
+    except PossibleDuplicate as e:
+        st.warning(f"{e}. Tick \"Add even if it looks like a book I have\" to add it anyway.")
+        return False
+    except DuplicateBook as e:
+        st.warning(f"{e} (same ISBN).")
+        return False
+    except (sqlite3.Error, FileNotFoundError) as e:
         st.error(f"Database error: {e}")
         return False
-    finally:
-        conn.close()
 
 # Function to get all books from the database
+@timed("ui.get_all_books")
 def get_all_books():
-    conn = sqlite3.connect('library.db')
-    books = pd.read_sql_query("SELECT * FROM books", conn)
-    conn.close()
-    return books
-
-# Function to remove a book from the database
-def remove_book(book_id):
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
+    return get_library().all_books()
+
+# Function to get the Home page statistics. Results are cached until a write clears them.
+def get_library_stats():
+    return get_library().stats()
+
+# Function to get one page of books, ordered by date added
+@timed("ui.get_books_page")
+def get_books_page(cursor=None, limit=PAGE_SIZE, facet_selection=()):
+    return get_library().books_page(cursor, limit, selection=facet_selection)
+
+# Function to get the live-book counts of one facet, most common values first
+@timed("ui.get_facet_counts")
+def get_facet_counts(facet):
+    return get_library().facet_counts(facet)
+
+# Function to get the books most like a book, from the precomputed similarity index
+@timed("ui.get_similar_books")
+def get_similar_books(book_id):
+    return get_library().similar_books(book_id)
+
+# Function to remove books from the database in one transaction.
+# The removed ids are kept so the removal can be undone.
+@timed("ui.remove_books")
+def remove_books(book_ids):
     try:
-        c.execute("DELETE FROM books WHERE id = ?", (book_id,))
-        conn.commit()
-        return True
+        removed = get_library().remove_books(book_ids)
+        st.session_state.removed_books = removed
+        return removed
+    except sqlite3.Error as e:
+        st.error(f"Database error: {e}")
+        return []
+
+# Function to undo the last removal
+@timed("ui.restore_books")
+def restore_books():
+    try:
+        get_library().restore_books(st.session_state.pop("removed_books", []))
     except sqlite3.Error as e:
         st.error(f"Database error: {e}")
-        return False
-    finally:
-        conn.close()
-
-# Function to search books by title or author
-def search_books(query):
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    query = f"%{query}%"
-    result = pd.read_sql_query(
-        "SELECT * FROM books WHERE title LIKE ? OR author LIKE ?", 
-        conn, 
-        params=(query, query)
-    )
-    conn.close()
-    return result
+
+# Function to remove the books ticked on the Remove Book page
+def remove_selected(book_ids, remove_all=False):
+    selected = [book_id for book_id in book_ids if remove_all or st.session_state.get(f"select_{book_id}")]
+    for book_id in book_ids:
+        st.session_state.pop(f"select_{book_id}", None)
+    remove_books(selected)
+
+# Function to search inside uploaded book files
+@timed("ui.search_book_contents")
+def search_book_contents(query):
+    return get_library().search_contents(query)
+
+# Function to search books by title, author, genre, description or ISBN
+@timed("ui.search_books")
+def search_books(query, limit=SEARCH_LIMIT, facet_selection=()):
+    return get_library().search(query, limit, selection=facet_selection)
 
 # Function to generate a download link for a book
+@timed("ui.get_download_link")
 def get_download_link(file_path, title):
-    # Check if file exists
-    if file_path and os.path.exists(file_path):
-        # For a real file, read and encode it
-        with open(file_path, "rb") as file:
-            contents = file.read()
-            b64 = base64.b64encode(contents).decode()
-            ext = os.path.splitext(file_path)[1]
-            return f'<a href="data:application/octet-stream;base64,{b64}" download="{title}{ext}">Download</a>'
+    # Real files are streamed by the download server, so the card only carries a link
+    url = download_url(DOWNLOAD_BASE_URL, UPLOADS_DIR, file_path, title + os.path.splitext(file_path or "")[1])
+    if url:
+        return f'<a href="{url}" target="_blank">Download</a>'
     else:
         # Create sample content for demonstration
         if title == "Harry Potter and the Philosopher's Stone":
@@ -304,68 +287,223 @@ def get_download_link(file_path, title):
     
 
 
+# Share one Open Library client (HTTP session, on-disk cache) across sessions
+@st.cache_resource
+def get_lookup_client():
+    return OpenLibraryClient(cache=LookupCache())
+
+# Share one thumbnail store (and its background fetchers) across sessions
+@st.cache_resource
+def get_thumbnail_store():
+    return ThumbnailStore(get_library().pool)
+
+# Function to build the cover image tag for a book card.
+# Only locally cached thumbnails are linked; missing ones are fetched in the background.
+@timed("ui.get_cover_html")
+def get_cover_html(cover_url, size="medium"):
+    thumbnail = get_thumbnail_store().thumbnail(cover_url, size)
+    if not thumbnail:
+        return ""
+    return f'<img src="{DOWNLOAD_BASE_URL}/thumbnails/{thumbnail}" alt="" style="max-width: 100%; border-radius: 5px; margin-bottom: 10px;">'
+
+# Load static images once per process instead of on every rerun
+@st.cache_resource
+def load_image(path):
+    with open(path, "rb") as f:
+        return f.read()
+
 # Function to search for book information using Open Library API
+@timed("ui.search_books_api")
 def search_books_api(query):
     """Search for books using the Open Library API"""
-    encoded_query = requests.utils.quote(query)
-    url = f"https://openlibrary.org/search.json?q={encoded_query}&limit=3"
-    
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            books = []
-            
-            for doc in data.get('docs', [])[:3]:
-                # Extract cover ID if available
-                cover_id = doc.get('cover_i')
-                cover_url = f"https://covers.openlibrary.org/b/id/{cover_id}-M.jpg" if cover_id else f"https://via.placeholder.com/150?text={doc.get('title', 'Book').replace(' ', '+')}"
-                
-                # Extract author names safely
-                author_names = doc.get('author_name', ['Unknown Author'])
-                author_text = ", ".join(author_names) if author_names else 'Unknown Author'
-                
-                # Extract subjects/genres safely
-                subjects = doc.get('subject', [])
-                genre_text = ", ".join(subjects[:2]) if subjects else 'Unspecified'
-                
-                # Create book entry
-                book = {
-                    "title": doc.get('title', 'Unknown Title'),
-                    "author": author_text,
-                    "genre": genre_text,
-                    "description": f"A book by {author_text}. Published by {', '.join(doc.get('publisher', ['Unknown Publisher'])[:1])}.",
-                    "published_year": doc.get('first_publish_year', 2000),
-                    "isbn": ", ".join(doc.get('isbn', ['Unknown'])) if 'isbn' in doc else 'Unknown',
-                    "cover_image": cover_url,
-                    "file_path": ""  # No file available for API results initially
-                }
-                books.append(book)
-            
-            return books
-        else:
-            st.error(f"API Error: {response.status_code}")
-            return []
-    except Exception as e:
-        st.error(f"Error connecting to API: {str(e)}")
+        return get_lookup_client().search(query, limit=3)
+    except LookupFailed as e:
+        st.error(str(e))
         return []
    
-# Initialize the app
-init_db()
+# Background jobs submitted by this session, newest last
+JOBS_SHOWN = 5
+JOB_REFRESH_SECONDS = 1
+
+# Function to queue slow work; the sidebar shows its progress
+@timed("ui.submit_job")
+def submit_job(kind, payload, label):
+    try:
+        job_id = get_library().jobs.submit(kind, payload)
+    except sqlite3.Error as e:
+        st.error(f"Database error: {e}")
+        return None
+    jobs = st.session_state.setdefault("jobs", [])
+    jobs.append({'id': job_id, 'kind': kind, 'label': label, 'status': 'queued'})
+    del jobs[:-JOBS_SHOWN]
+    return job_id
+
+def _job_summary(job):
+    if job['status'] == FAILED:
+        return f"failed: {job.get('error')}"
+    result = job.get('result') or job.get('progress') or {}
+    if job['kind'] == 'import' and result:
+        summary = f"{job['status']}: {result['imported']} of {result['rows']} rows imported"
+        if result.get('possible_duplicates'):
+            titles = "; ".join(result['possible_duplicate_titles'])
+            summary += f", {result['possible_duplicates']} possible duplicates ({titles})"
+        return summary
+    if job['kind'] == 'enrich' and result:
+        summary = f"{job['status']}: {result['processed']} books looked up"
+        if result.get('failed'):
+            summary += f", {result['failed']} failed (retried next time)"
+        return summary
+    return job['status']
+
+# Function to refresh the status of this session's jobs. Runs as a fragment,
+# so polling reruns only the job list; a finished job reruns the whole page
+# once so it shows the new books.
+def _render_jobs():
+    jobs = st.session_state.get("jobs", [])
+    pending = [job['id'] for job in jobs if job['status'] not in (DONE, FAILED)]
+    if pending:
+        statuses = get_library().jobs.status(pending)
+        finished = False
+        for job in jobs:
+            status = statuses.get(job['id'])
+            if status is not None:
+                finished = finished or status['status'] in (DONE, FAILED)
+                job.update(status=status['status'], progress=status['progress'],
+                           result=status['result'], error=status['error'])
+        if finished:
+            # The job may have run in another process
+            get_library().cache.invalidate()
+            st.rerun()
+    st.markdown("**Background jobs**")
+    for job in reversed(jobs):
+        icon = {DONE: "✅", FAILED: "❌"}.get(job['status'], "⏳")
+        st.caption(f"{icon} {job['label']} — {_job_summary(job)}")
+
+def job_panel():
+    jobs = st.session_state.get("jobs", [])
+    if not jobs:
+        return
+    # Only poll while something is still running
+    running = any(job['status'] not in (DONE, FAILED) for job in jobs)
+    st.fragment(run_every=JOB_REFRESH_SECONDS if running else None)(_render_jobs)()
+
+# Keyset pagination state: a stack of cursors, one per page visited
+def _page_cursors(key):
+    return st.session_state.setdefault(f"{key}_cursors", [None])
+
+def _next_page(key, cursor):
+    _page_cursors(key).append(cursor)
+
+def _previous_page(key):
+    cursors = _page_cursors(key)
+    if len(cursors) > 1:
+        cursors.pop()
+
+def _reset_pages(key):
+    st.session_state[f"{key}_cursors"] = [None]
+
+# Function to load the current page of books for a paginated view.
+# One extra row is fetched to know whether there is a next page.
+def load_page(key, page_size=PAGE_SIZE, facet_selection=()):
+    books = get_books_page(_page_cursors(key)[-1], page_size + 1, facet_selection)
+    return books[:page_size], len(books) > page_size
+
+def _facet_value_label(facet, value):
+    if facet == 'has_file':
+        return "Yes" if value == 'yes' else "No"
+    if facet == 'decade':
+        return f"{value}s" if value else "Unknown"
+    return value or "Unknown"
+
+# Function to render the facet filters of a view and return the selection.
+# Counts come from the precomputed facet_counts table; changing a filter
+# starts the view over at its first page.
+def facet_controls(key):
+    selected = {}
+    with st.expander("Filter", expanded=False):
+        columns = st.columns(len(FACETS))
+        for column, facet in zip(columns, FACETS):
+            counts = dict(get_facet_counts(facet))
+            widget_key = f"{key}_facet_{facet}"
+            # Keep chosen values selectable even once they drop out of the top values
+            options = list(counts) + [v for v in st.session_state.get(widget_key, []) if v not in counts]
+            with column:
+                selected[facet] = st.multiselect(
+                    FACET_LABELS[facet], options, key=widget_key,
+                    format_func=lambda v, facet=facet, counts=counts: f"{_facet_value_label(facet, v)} ({counts.get(v, 0)})",
+                    on_change=_reset_pages, args=(key,),
+                )
+    return selection(selected)
+
+# "More like this": a card's button picks the book whose neighbours a view shows
+def _show_similar(key, book):
+    st.session_state[f"{key}_similar"] = book
+
+def _hide_similar(key):
+    st.session_state.pop(f"{key}_similar", None)
+
+# where tells apart the buttons on the cards and in the panel of one view
+def more_like_this_button(key, book, where="card"):
+    st.button("More like this", key=f"{key}_{where}_similar_{book.id}", on_click=_show_similar, args=(key, book))
+
+# Function to render the books like the one picked in a view, if any
+def similar_books_panel(key):
+    book = st.session_state.get(f"{key}_similar")
+    if book is None:
+        return
+    col_title, col_close = st.columns([4, 1])
+    with col_title:
+        st.subheader(f"Books like '{book.title}'")
+    with col_close:
+        st.button("Close", key=f"{key}_similar_close", on_click=_hide_similar, args=(key,))
+    similar = get_similar_books(book.id)
+    if not similar:
+        st.info("No similar books in your library yet.")
+        return
+    cols = st.columns(3)
+    for i, other in enumerate(similar):
+        with cols[i % 3]:
+            st.markdown(f"""
+            <div class="book-card">
+                {get_cover_html(other.cover_image, "small")}
+                <h3>{other.title}</h3>
+                <p><strong>Author:</strong> {other.author}</p>
+                <p><strong>Genre:</strong> {other.genre}</p>
+            </div>
+            """, unsafe_allow_html=True)
+            more_like_this_button(key, other, where="panel")
+
+# Function to render Previous/Next controls for a paginated view
+def page_controls(key, books, has_next):
+    cursors = _page_cursors(key)
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        st.button("← Previous", key=f"{key}_prev", disabled=len(cursors) == 1,
+                  on_click=_previous_page, args=(key,))
+    with col_page:
+        st.markdown(f"<p style='text-align: center;'>Page {len(cursors)}</p>", unsafe_allow_html=True)
+    with col_next:
+        last = books[-1] if books else None
+        st.button("Next →", key=f"{key}_next", disabled=not has_next,
+                  on_click=_next_page,
+                  args=(key, None if last is None else (last.date_added, last.id)))
 
 # Create sidebar for navigation
 with st.sidebar:
     st.markdown("<div class='sidebar-content'>", unsafe_allow_html=True)
-    image = Image.open("Images/best-style-book-personal-libarary.png")
+    image = load_image("Images/best-style-book-personal-libarary.png")
     st.image(image, width=None)
     st.title("Library Manager")
     
     # Navigation dropdown with new option
     page = st.selectbox(
         "Navigation",
-        ["Home", "List of Available Books", "Search Book", "Add Book", "Remove Book"]
+        ["Home", "List of Available Books", "Search Book", "Add Book", "Import Books", "Remove Book"]
     )
     
+    job_panel()
+    
     st.markdown("<hr class='section-divider'>", unsafe_allow_html=True)
     st.markdown("""
     <div style="font-size: 0.8rem; color: #888;">
@@ -381,7 +519,7 @@ if page == "Home":
 
 
 # Open Image
-    image = Image.open("Images/Library-Image.png")  # PNG format use karo
+    image = load_image("Images/Library-Image.png")  # PNG format use karo
     st.image(image, use_container_width=True) 
 
     col1, col2 = st.columns([2, 1])
@@ -395,29 +533,20 @@ if page == "Home":
         """, unsafe_allow_html=True)
         
         # Display summary statistics
-        books_df = get_all_books()
-        if not books_df.empty:
-            total_books = len(books_df)
-            total_authors = books_df['author'].nunique()
-            genres = books_df['genre'].value_counts()
-            
+        stats = get_library_stats()
+        if stats['total_books']:
             col_stats1, col_stats2, col_stats3 = st.columns(3)
             with col_stats1:
-                st.metric("Total Books", total_books)
+                st.metric("Total Books", stats['total_books'])
             with col_stats2:
-                st.metric("Total Authors", total_authors)
+                st.metric("Total Authors", stats['total_authors'])
             with col_stats3:
-                if not genres.empty:
-                    st.metric("Most Common Genre", genres.index[0])
-                else:
-                    st.metric("Most Common Genre", "N/A")
+                st.metric("Most Common Genre", stats['top_genre'] or "N/A")
             
             # Display recent additions
             st.markdown("### Recent Additions")
-            books_df['date_added'] = pd.to_datetime(books_df['date_added'])
-            recent_books = books_df.sort_values('date_added', ascending=False).head(3)
             
-            for i, book in recent_books.iterrows():
+            for book in stats['recent']:
                 st.markdown(f"""
                 <div class="book-card">
                     <h4>{book['title']}</h4>
@@ -434,7 +563,7 @@ if page == "Home":
             <h3>Quick Tips</h3>
             <ul>
                 <li>Use the sidebar to navigate between features</li>
-                <li>Search for books by title or author</li>
+                <li>Search for books by title, author, genre or description</li>
                 <li>Add new books to your collection</li>
                 <li>Remove books you no longer own</li>
                 <li>Download available books to read offline</li>
@@ -445,7 +574,7 @@ if page == "Home":
         st.markdown("""
         <div class="book-card">
             <h3>Features</h3>
-            <p>✅ Smart search with AI-powered recommendations</p>
+            <p>✅ Smart search and "more like this" recommendations</p>
             <p>✅ Beautiful book display</p>
             <p>✅ Easy organization</p>
             <p>✅ Track your collection</p>
@@ -456,10 +585,15 @@ if page == "Home":
 elif page == "List of Available Books":
     st.title("Available Books for Download")
     
-    books_df = get_all_books()
+    list_selection = facet_controls("list")
+    similar_books_panel("list")
+    books, has_next = load_page("list", facet_selection=list_selection)
     
-    if books_df.empty:
-        st.info("Your library is empty. There are no books available for download.")
+    if not books and len(_page_cursors("list")) == 1:
+        if list_selection:
+            st.info("No books match these filters.")
+        else:
+            st.info("Your library is empty. There are no books available for download.")
     else:
         st.markdown("""
         <div class="book-card">
@@ -470,60 +604,93 @@ elif page == "List of Available Books":
         
         # Display all books with download buttons
         books_columns = st.columns(3)
-        for i, (_, book) in enumerate(books_df.iterrows()):
+        for i, book in enumerate(books):
             with books_columns[i % 3]:
                 # Generate download link - handle the case when file_path doesn't exist
-                download_link = get_download_link(book.get('file_path', ''), book['title'])
+                download_link = get_download_link(book.file_path, book.title)
                 
                 st.markdown(f"""
                 <div class="book-card">
-                    <h3>{book['title']}</h3>
-                    <p><strong>Author:</strong> {book['author']}</p>
-                    <p><strong>Genre:</strong> {book['genre']}</p>
-                    <p><strong>Year:</strong> {book['published_year']}</p>
-                    <p><strong>ISBN:</strong> {book['isbn']}</p>
+                    {get_cover_html(book.cover_image)}
+                    <h3>{book.title}</h3>
+                    <p><strong>Author:</strong> {book.author}</p>
+                    <p><strong>Genre:</strong> {book.genre}</p>
+                    <p><strong>Year:</strong> {book.published_year}</p>
+                    <p><strong>ISBN:</strong> {book.isbn}</p>
                     <div style="text-align: center; margin-top: 15px;">
                         <button class="stButton download-btn">{download_link}</button>
                     </div>
                 </div>
                 """, unsafe_allow_html=True)
+                more_like_this_button("list", book)
+        
+        page_controls("list", books, has_next)
 
 
 elif page == "Search Book":
     st.title("Search Books")
     
     # Search tabs
-    search_tab1, search_tab2 = st.tabs(["Search Your Library", "Find New Books"])
+    search_tab1, search_tab3, search_tab2 = st.tabs(["Search Your Library", "Search Inside Books", "Find New Books"])
     
     with search_tab1:
-        local_query = st.text_input("Search your library by title or author")
+        local_query = st.text_input(
+            "Search your library",
+            help='Words match as prefixes. Use "quotes" for exact phrases and author:, genre:, title: or isbn: to search one field.'
+        )
+        search_selection = facet_controls("search")
+        similar_books_panel("search")
         if local_query:
-            results = search_books(local_query)
+            results = search_books(local_query, facet_selection=search_selection)
             
-            if not results.empty:
+            if results:
                 st.success(f"Found {len(results)} books in your library")
                 
                 # Display results in a card layout with download buttons
                 cols = st.columns(3)
-                for i, (_, book) in enumerate(results.iterrows()):
+                for i, book in enumerate(results):
                     with cols[i % 3]:
                         # Generate download link
-                        download_link = get_download_link(book['file_path'], book['title'])
+                        download_link = get_download_link(book.file_path, book.title)
                         
                         st.markdown(f"""
                         <div class="book-card">
-                            <h3>{book['title']}</h3>
-                            <p><strong>Author:</strong> {book['author']}</p>
-                            <p><strong>Genre:</strong> {book['genre']}</p>
-                            <p>{book['description'][:100]}...</p>
+                            {get_cover_html(book.cover_image)}
+                            <h3>{book.title}</h3>
+                            <p><strong>Author:</strong> {book.author}</p>
+                            <p><strong>Genre:</strong> {book.genre}</p>
+                            <p>{(book.description or '')[:100]}...</p>
                             <div style="text-align: center; margin-top: 15px;">
                                 <button class="stButton download-btn">{download_link}</button>
                             </div>
                         </div>
                         """, unsafe_allow_html=True)
+                        more_like_this_button("search", book)
             else:
                 st.info("No matches found in your library.")
     
+    with search_tab3:
+        content_query = st.text_input("Search the text of your uploaded books")
+        if content_query:
+            content_results = search_book_contents(content_query)
+            
+            if content_results:
+                st.success(f"Found matches in {len(content_results)} books")
+                for book in content_results:
+                    matches = "".join(
+                        f"<p><strong>{match['location']}:</strong> {match['snippet']}</p>"
+                        for match in book['matches']
+                    )
+                    st.markdown(f"""
+                    <div class="book-card">
+                        <h3>{book['title']}</h3>
+                        <p><strong>Author:</strong> {book['author']}</p>
+                        {matches}
+                    </div>
+                    """, unsafe_allow_html=True)
+            else:
+                st.info("No matches found inside your uploaded books.")
+    
     with search_tab2:
         api_query = st.text_input("Search for new books using AI")
         if api_query:
@@ -564,10 +731,9 @@ elif page == "Search Book":
                                     'file_path': f"downloads/{book['title'].replace(' ', '_').lower()}.pdf"
                                 }
                                 
-                                if add_book_to_db(book_data):
-                                    st.success(f"Added '{book['title']}' to your library!")
-                                else:
-                                    st.error("Failed to add book to library.")
+                                # Added in the background; duplicates show up as a failed job
+                                if submit_job('add_book', {'book': book_data}, f"Add '{book['title']}'"):
+                                    st.info(f"Adding '{book['title']}' to your library...")
                         
                         with col_btn2:
                             # Generate a temporary download link for this search result
@@ -610,6 +776,7 @@ elif page == "Add Book":
             # Add file upload option
             uploaded_file = st.file_uploader("Upload Book File (PDF, EPUB, etc.)", type=["pdf", "epub", "txt"])
             cover_image = st.text_input("Cover Image URL (optional)")
+            allow_duplicate = st.checkbox("Add even if it looks like a book I have")
             
             submit_button = st.form_submit_button("Add to Library")
             
@@ -617,18 +784,6 @@ elif page == "Add Book":
                 if not title or not author:
                     st.error("Title and author are required fields.")
                 else:
-                    # Handle file upload if provided
-                    file_path = ""
-                    if uploaded_file is not None:
-                        # Create directory if it doesn't exist
-                        if not os.path.exists("uploads"):
-                            os.makedirs("uploads")
-                        
-                        # Save the file
-                        file_path = f"uploads/{uploaded_file.name}"
-                        with open(file_path, "wb") as f:
-                            f.write(uploaded_file.getbuffer())
-                    
                     # Create book data dictionary
                     book_data = {
                         'id': str(uuid.uuid4()),
@@ -640,15 +795,14 @@ elif page == "Add Book":
                         'isbn': isbn,
                         'cover_image': cover_image or f"https://via.placeholder.com/150?text={title.replace(' ', '+')}",
                         'date_added': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        'file_path': file_path
+                        'file_path': ""
                     }
                     
-                    if add_book_to_db(book_data):
+                    # The upload, if any, is streamed into the store; identical files are kept once
+                    if add_book_to_db(book_data, allow_duplicate, uploaded_file):
                         st.success(f"Added '{title}' to your library!")
                         # Clear the form
                         st.experimental_rerun()
-                    else:
-                        st.error("Failed to add book to library.")
     
     with col2:
         st.markdown("""
@@ -673,12 +827,57 @@ elif page == "Add Book":
         </div>
         """, unsafe_allow_html=True)
 
+elif page == "Import Books":
+    st.title("Import Books")
+    
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        st.markdown("""
+        <div class="book-card">
+            <h3>Import a Catalog</h3>
+            <p>Upload a CSV, JSON Lines or Goodreads export to add many books at once. Books whose ISBN is already in your library are skipped; books with the same title and author as one you have are listed as possible duplicates.</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        import_file = st.file_uploader("Catalog file", type=["csv", "jsonl", "ndjson", "json"])
+        import_format = st.selectbox("Format", ["Detect automatically", "csv", "jsonl", "json", "goodreads"])
+        skip_possible_duplicates = st.checkbox("Skip books with the same title and author as one I have")
+        
+        if import_file is not None and st.button("Import"):
+            fmt = None if import_format == "Detect automatically" else import_format
+            # The job reads its own copy of the upload; progress shows in the sidebar
+            path = save_job_file(import_file, import_file.name)
+            if submit_job('import', {'path': path, 'filename': import_file.name, 'format': fmt,
+                                     'skip_possible_duplicates': skip_possible_duplicates},
+                          f"Import {import_file.name}"):
+                st.info("Importing in the background. You can keep using the library meanwhile.")
+        
+        st.markdown("""
+        <div class="book-card">
+            <h3>Fill In Missing Details</h3>
+            <p>Look up books with no ISBN, cover or description on Open Library.</p>
+        </div>
+        """, unsafe_allow_html=True)
+        if st.button("Enrich my library"):
+            if submit_job('enrich', {}, "Enrich from Open Library"):
+                st.info("Looking up missing details in the background.")
+    
+    with col2:
+        st.markdown("""
+        <div class="book-card">
+            <h3>Supported Columns</h3>
+            <p>CSV and JSON files need <strong>title</strong> and <strong>author</strong>, and may include genre, description, published_year (or year), isbn and cover_image.</p>
+            <p>Goodreads exports (Library → Export) are recognised automatically.</p>
+        </div>
+        """, unsafe_allow_html=True)
+
 elif page == "Remove Book":
     st.title("Remove Books from Your Library")
     
-    books_df = get_all_books()
+    books, has_next = load_page("remove")
     
-    if books_df.empty:
+    if not books and len(_page_cursors("remove")) == 1:
         st.info("Your library is empty. There are no books to remove.")
     else:
         st.markdown("""
@@ -688,29 +887,68 @@ elif page == "Remove Book":
         </div>
         """, unsafe_allow_html=True)
         
-        # Display all books with remove buttons
-        for i, (_, book) in enumerate(books_df.iterrows()):
-            col1, col2 = st.columns([3, 1])
-            
-            with col1:
-                st.markdown(f"""
-                <div class="book-card">
-                    <h3>{book['title']}</h3>
-                    <p><strong>Author:</strong> {book['author']}</p>
-                    <p><strong>Genre:</strong> {book['genre']}</p>
-                    <p><strong>Added on:</strong> {book['date_added']}</p>
-                </div>
-                """, unsafe_allow_html=True)
+        # Undo for the last removal, until the background purge deletes the books
+        removed = st.session_state.get("removed_books")
+        if removed:
+            col_msg, col_undo = st.columns([3, 1])
+            with col_msg:
+                st.success(f"Removed {len(removed)} book{'s' if len(removed) != 1 else ''} from your library.")
+            with col_undo:
+                st.button("Undo", key="undo_remove", on_click=restore_books)
+        
+        # Tick books and remove them together; the form submits once for the whole batch
+        page_ids = [book.id for book in books]
+        with st.form("remove_books"):
+            for book in books:
+                col1, col2 = st.columns([3, 1])
+                
+                with col1:
+                    st.markdown(f"""
+                    <div class="book-card">
+                        <h3>{book.title}</h3>
+                        <p><strong>Author:</strong> {book.author}</p>
+                        <p><strong>Genre:</strong> {book.genre}</p>
+                        <p><strong>Added on:</strong> {book.date_added}</p>
+                    </div>
+                    """, unsafe_allow_html=True)
+                
+                with col2:
+                    st.markdown("<br><br>", unsafe_allow_html=True)
+                    st.checkbox("Remove", key=f"select_{book.id}")
             
-            with col2:
-                st.markdown("<br><br>", unsafe_allow_html=True)
-                if st.button(f"Remove", key=f"remove_{i}"):
-                    if remove_book(book['id']):
-                        st.success(f"Removed '{book['title']}' from your library!")
-                        # Refresh the page to show updated library
-                        st.experimental_rerun()
-                    else:
-                        st.error("Failed to remove book from library.")
+            col_selected, col_all = st.columns(2)
+            with col_selected:
+                st.form_submit_button("Remove selected", on_click=remove_selected, args=(page_ids,))
+            with col_all:
+                st.form_submit_button("Remove all on this page", on_click=remove_selected, args=(page_ids, True))
+        
+        page_controls("remove", books, has_next)
+
+# Show this rerun's timings in the hidden debug panel
+rerun = finish_rerun(page)
+if DEBUG and rerun is not None:
+    with st.sidebar.expander("Debug: performance", expanded=False):
+        st.metric("Script run", f"{rerun.seconds * 1000:.1f} ms")
+        st.text(f"SQL statements: {rerun.queries}\nBytes sent to browser: {rerun.bytes_sent:,}")
+        span_rows = {}
+        for name, seconds in rerun.spans:
+            count, total = span_rows.get(name, (0, 0.0))
+            span_rows[name] = (count + 1, total + seconds)
+        st.dataframe(
+            sorted(
+                ({"span": name, "calls": count, "total ms": total * 1000} for name, (count, total) in span_rows.items()),
+                key=lambda row: row["total ms"], reverse=True
+            ),
+            hide_index=True
+        )
+        st.checkbox("cProfile next rerun", key="debug_profile")
+        st.checkbox("tracemalloc next rerun", key="debug_tracemalloc")
+        if rerun.profile_report:
+            st.code(rerun.profile_report)
+        if rerun.memory_report:
+            st.code(rerun.memory_report)
+        st.download_button("Prometheus metrics", REGISTRY.prometheus_text(), file_name="metrics.txt")
+        st.caption(f"Also served at {DOWNLOAD_BASE_URL}/metrics")
 
 # Add a footer
 st.markdown("""
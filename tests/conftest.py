@@ -0,0 +1,15 @@
+import pytest
+
+from library import Library
+
+
+@pytest.fixture
+def library(tmp_path):
+    """An empty library in a temporary folder"""
+    library = Library(str(tmp_path / "library.db"), str(tmp_path / "uploads"), pool_size=2)
+    yield library
+    library.close()
+
+
+def book(title, author, **fields):
+    return {'title': title, 'author': author, 'genre': 'Fiction', 'description': '', **fields}
@@ -0,0 +1,51 @@
+from conftest import book
+from library import Library
+from library.backup import backup, restore_backup
+
+
+def live_titles(library):
+    return sorted(found.title for found in library.iter_books())
+
+
+def test_incremental_chain_restores_every_change(library, tmp_path):
+    root = str(tmp_path / "backups")
+    # Added long before the backups, so only their changes can select them
+    kept = library.add_book(book("Kept", "Ann Author", date_added="2020-01-01 00:00:00"))
+    removed = library.add_book(book("Removed", "Ann Author", date_added="2020-01-01 00:00:00"))
+    backup(library, root)
+
+    library.remove_books([kept, removed])
+    assert backup(library, root, incremental=True)['kind'] == 'incremental'
+    # Undoing the removal clears deleted_at; the next backup must still see it
+    library.restore_books([kept])
+    library.add_book(book("Added", "Bob Author"))
+    backup(library, root, incremental=True)
+
+    chain = restore_backup(root, str(tmp_path / "restored.db"), str(tmp_path / "restored_uploads"))
+    assert [manifest['kind'] for manifest in chain] == ['full', 'incremental', 'incremental']
+    restored = Library(str(tmp_path / "restored.db"), str(tmp_path / "restored_uploads"), pool_size=1)
+    try:
+        assert live_titles(restored) == live_titles(library)
+        assert "Kept" in live_titles(restored) and "Removed" not in live_titles(restored)
+    finally:
+        restored.close()
+
+
+def test_incremental_backup_sees_a_book_reusing_a_purged_rowid(library, tmp_path):
+    root = str(tmp_path / "backups")
+    purged = library.add_book(book("Purged", "Ann Author"))
+    backup(library, root)
+    library.remove_book(purged)
+    library.purge_deleted(0)
+    backup(library, root, incremental=True)
+
+    # Takes the purged book's rowid, and its date_added is older than any backup
+    library.add_book(book("Imported", "Bob Author", date_added="2020-01-01 00:00:00"))
+    assert backup(library, root, incremental=True)['books'] == 1
+
+    restore_backup(root, str(tmp_path / "restored.db"), str(tmp_path / "restored_uploads"))
+    restored = Library(str(tmp_path / "restored.db"), str(tmp_path / "restored_uploads"), pool_size=1)
+    try:
+        assert "Imported" in live_titles(restored)
+    finally:
+        restored.close()
@@ -0,0 +1,48 @@
+import io
+import os
+
+import pytest
+
+from conftest import book
+from library.dedupe import DuplicateBook
+
+
+def blob_files(library):
+    return sorted(
+        os.path.join(folder, name)
+        for folder, _, names in os.walk(library.blobs.root) for name in names
+    )
+
+
+def test_identical_uploads_are_stored_once(library):
+    library.add_book(book("Dune", "Frank Herbert"), fileobj=io.BytesIO(b"spice"), filename="dune.txt")
+    library.add_book(book("Dune Messiah", "Frank Herbert"), fileobj=io.BytesIO(b"spice"), filename="copy.txt")
+    assert len(blob_files(library)) == 1
+
+
+def test_failed_add_deletes_its_upload(library):
+    library.add_book(book("Dune", "Frank Herbert", isbn="9780441172719"))
+    with pytest.raises(DuplicateBook):
+        library.add_book(book("Dune", "Frank Herbert", isbn="9780441172719"),
+                         fileobj=io.BytesIO(b"spice"), filename="dune.txt")
+    assert blob_files(library) == []
+
+
+def test_failed_add_keeps_a_file_another_book_uses(library):
+    library.add_book(book("Dune", "Frank Herbert", isbn="9780441172719"),
+                     fileobj=io.BytesIO(b"spice"), filename="dune.txt")
+    with pytest.raises(DuplicateBook):
+        library.add_book(book("Dune", "Frank Herbert", isbn="9780441172719"),
+                         fileobj=io.BytesIO(b"spice"), filename="dune.txt")
+    assert len(blob_files(library)) == 1
+
+
+def test_sweep_deletes_unused_files_past_the_grace(library):
+    library.add_book(book("Dune", "Frank Herbert"), fileobj=io.BytesIO(b"spice"), filename="dune.txt")
+    kept = blob_files(library)
+    # A file stored by an add that never finished
+    orphan = library.store_file(io.BytesIO(b"sand"), "orphan.txt")
+    assert library.sweep_orphans() == 0
+    assert library.sweep_orphans(grace=0) == 1
+    assert not os.path.exists(orphan)
+    assert blob_files(library) == kept
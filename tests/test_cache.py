@@ -0,0 +1,38 @@
+import sqlite3
+
+from library import Library
+
+from conftest import book
+
+
+def test_reads_are_cached_until_a_write(library):
+    first = library.stats()
+    assert library.stats() is first
+    library.add_book(book("Dune", "Frank Herbert"))
+    assert library.stats()['total_books'] == first['total_books'] + 1
+
+
+def test_writes_by_another_process_clear_the_cache(library, tmp_path):
+    before = library.stats()['total_books']
+    other = Library(library.pool.path, str(tmp_path / "uploads"), pool_size=1, multi_worker=False)
+    try:
+        other.add_book(book("Dune", "Frank Herbert"))
+    finally:
+        other.close()
+    assert library.stats()['total_books'] == before + 1
+
+
+def test_bookkeeping_writes_keep_the_cache(library):
+    first = library.stats()
+    # A job queued by another process changes no book
+    conn = sqlite3.connect(library.pool.path)
+    with conn:
+        conn.execute("INSERT INTO jobs (kind, payload, status, created_at) VALUES ('enrich', '{}', 'queued', '')")
+    conn.close()
+    assert library.stats() is first
+
+
+def test_a_single_book_counts_as_one_row(library):
+    book_id = library.add_book(book("Dune", "Frank Herbert"))
+    library.get_book(book_id)
+    assert library.cache._rows == 1
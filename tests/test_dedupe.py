@@ -0,0 +1,86 @@
+import io
+
+import pytest
+
+from library.dedupe import DuplicateBook, PossibleDuplicate, author_key, isbn13, parse_isbns, title_key
+
+from conftest import book
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("978-0-261-10221-7", "9780261102217"),
+    ("0261102214", "9780261102217"),
+    ("0-8044-2957-X", "9780804429573"),
+    ("9780261102218", None),
+    ("not an isbn", None),
+    ("", None),
+])
+def test_isbn13(value, expected):
+    assert isbn13(value) == expected
+
+
+def test_parse_isbns_reads_lists():
+    assert parse_isbns("0-261-10221-4, 9780261102217; 9780547928227") == ["9780261102217", "9780547928227"]
+
+
+@pytest.mark.parametrize("title, expected", [
+    ("The Hobbit", "hobbit"),
+    ("The Lord of the Rings: The Two Towers", "lord of the rings the two towers"),
+    ("The Hunger Games: Catching Fire", "hunger games catching fire"),
+    ("The Wheel of Time 2", "wheel of time 2"),
+    ("Les Misérables", "miserables"),
+])
+def test_title_key_keeps_subtitles_and_numbers(title, expected):
+    assert title_key(title) == expected
+
+
+@pytest.mark.parametrize("author, expected", [
+    ("J.R.R. Tolkien", "tolkien"),
+    ("Tolkien, J.R.R.", "tolkien"),
+    ("Martin Luther King Jr.", "king"),
+    ("King, Martin Luther, Jr.", "king"),
+    ("Harry Connick III", "connick"),
+    ("Neil Gaiman & Terry Pratchett", "gaiman"),
+])
+def test_author_key(author, expected):
+    assert author_key(author) == expected
+
+
+def test_same_isbn_is_a_hard_duplicate(library):
+    library.add_book(book("The Hobbit", "J.R.R. Tolkien", isbn="9780261102217"))
+    with pytest.raises(DuplicateBook) as raised:
+        library.add_book(book("Hobbit", "Someone Else", isbn="0261102214"), allow_duplicate=True)
+    assert not isinstance(raised.value, PossibleDuplicate)
+
+
+def test_same_title_is_a_possible_duplicate(library):
+    library.add_book(book("The Hobbit", "J.R.R. Tolkien"))
+    with pytest.raises(PossibleDuplicate):
+        library.add_book(book("Hobbit", "Tolkien, J.R.R."))
+    library.add_book(book("Hobbit", "Tolkien, J.R.R."), allow_duplicate=True)
+
+
+def test_series_volumes_are_not_duplicates(library):
+    for title in ("The Wheel of Time 1", "The Wheel of Time 2", "The Wheel of Time III"):
+        library.add_book(book(title, "Robert Jordan"))
+    library.add_book(book("The Lord of the Rings: The Fellowship of the Ring", "J.R.R. Tolkien"))
+    library.add_book(book("The Lord of the Rings: The Two Towers", "J.R.R. Tolkien"))
+
+
+def test_import_reports_possible_duplicates(library):
+    catalog = (
+        "title,author,isbn\n"
+        "The Lord of the Rings: The Fellowship of the Ring,J.R.R. Tolkien,\n"
+        "The Lord of the Rings: The Two Towers,J.R.R. Tolkien,\n"
+        "The Lord of the Rings: The Return of the King,J.R.R. Tolkien,\n"
+        "The Hunger Games,Suzanne Collins,9780439023481\n"
+        "The Hunger Games: Catching Fire,Suzanne Collins,\n"
+        "The Hunger Games,Suzanne Collins,\n"
+        "Hunger Games,Collins,9780439023481\n"
+    )
+    stats = library.import_file(io.StringIO(catalog), "catalog.csv")
+    assert (stats['imported'], stats['duplicates'], stats['possible_duplicates']) == (6, 1, 1)
+    assert stats['possible_duplicate_titles'] == ["The Hunger Games by Suzanne Collins"]
+
+    again = library.import_file(io.StringIO(catalog), "catalog.csv", skip_possible_duplicates=True)
+    assert (again['imported'], again['duplicates'], again['possible_duplicates']) == (0, 2, 5)
@@ -0,0 +1,94 @@
+import http.client
+
+import pytest
+
+from library.downloads import download_url, is_loopback, parse_range, resolve_upload, start_download_server
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    # Larger than the file: the whole file
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    # Multiple ranges and other units are served as the whole file
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=-", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5-4", "bytes=-0"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_resolve_upload_stays_inside_root(tmp_path):
+    (tmp_path / "book.txt").write_text("text")
+    (tmp_path.parent / "secret.txt").write_text("secret")
+    assert resolve_upload(str(tmp_path), "book.txt") == str((tmp_path / "book.txt").resolve())
+    assert resolve_upload(str(tmp_path), "../secret.txt") is None
+    assert resolve_upload(str(tmp_path), "missing.txt") is None
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / "book.txt").write_bytes(bytes(range(100)))
+    server = start_download_server({"files": str(tmp_path)}, port=0, metrics=lambda: "up 1\n")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path, headers=None):
+    conn = http.client.HTTPConnection(*server.server_address)
+    try:
+        conn.request("GET", path, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def test_serves_ranges(server, tmp_path):
+    url = download_url("", str(tmp_path), str(tmp_path / "book.txt"), "My Book.txt")
+    status, headers, body = get(server, url)
+    assert status == 200 and body == bytes(range(100))
+    assert headers["Content-Disposition"] == "attachment; filename*=UTF-8''My%20Book.txt"
+
+    status, headers, body = get(server, url, {"Range": "bytes=10-19"})
+    assert status == 206 and body == bytes(range(10, 20))
+    assert headers["Content-Range"] == "bytes 10-19/100"
+
+    status, headers, _ = get(server, url, {"Range": "bytes=100-"})
+    assert status == 416 and headers["Content-Range"] == "bytes */100"
+
+
+def test_only_serves_files_inside_its_roots(server):
+    assert get(server, "/files/..%2F..%2Fetc%2Fpasswd")[0] == 404
+    assert get(server, "/other/book.txt")[0] == 404
+
+
+def test_listens_on_loopback_by_default(server):
+    assert server.server_address[0] == "127.0.0.1"
+    assert get(server, "/metrics")[2] == b"up 1\n"
+
+
+@pytest.mark.parametrize("host, expected", [
+    ("127.0.0.1", True), ("::1", True), ("localhost", True),
+    ("0.0.0.0", False), ("", False), ("192.168.1.20", False), ("library.example.com", False),
+])
+def test_is_loopback(host, expected):
+    assert is_loopback(host) == expected
+
+
+@pytest.mark.parametrize("host", ["0.0.0.0", ""])
+def test_other_interfaces_need_a_base_url(tmp_path, host):
+    with pytest.raises(ValueError):
+        start_download_server({"files": str(tmp_path)}, host=host, port=0)
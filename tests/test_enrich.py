@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import book
+
+# library.enrich looks books up with requests
+pytest.importorskip("requests")
+
+from library.enrich import enrich_library
+from library.lookup import LookupFailed
+
+
+class FakeClient:
+    """Answers lookups from a dict of query -> result or exception"""
+
+    def __init__(self, answers):
+        self.answers = answers
+
+    def search(self, query, limit=10):
+        answer = self.answers.get(query, [])
+        if isinstance(answer, Exception):
+            raise answer
+        return [answer] if answer else []
+
+
+def test_one_failing_book_does_not_lose_the_batch(library):
+    library.add_book(book("Good", "Ann Author", description="A book by Ann Author"))
+    library.add_book(book("Broken", "Bob Author", description="A book by Bob Author"))
+    library.add_book(book("Offline", "Cy Author", description="A book by Cy Author"))
+    client = FakeClient({
+        "Good Ann Author": {'description': "A fine story."},
+        # A malformed response breaks merging
+        "Broken Bob Author": {'description': 42},
+        "Offline Cy Author": LookupFailed("timed out"),
+    })
+    stats = enrich_library(library.pool, client, workers=2, rate=1000)
+    library._changed()
+    assert stats['failed'] == 2
+    descriptions = {found.title: found.description for found in library.iter_books()}
+    assert descriptions["Good"] == "A fine story."
+
+    # Failed books are retried by the next run
+    client.answers = {"Broken Bob Author": {}, "Offline Cy Author": {}}
+    assert enrich_library(library.pool, client, rate=1000) == {'processed': 2, 'failed': 0}
@@ -0,0 +1,16 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module", ["library.trash", "library.similar", "library.fulltext", "library.jobs", "library.backup"])
+def test_module_runs_without_warnings(module):
+    # runpy warns when the package already imported the module being run
+    result = subprocess.run([sys.executable, "-W", "error", "-m", module, "--help"],
+                            cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stderr == ""
@@ -0,0 +1,41 @@
+from conftest import book
+
+
+def counts(library, facet):
+    return dict(library.facet_counts(facet))
+
+
+def test_counts_follow_add_remove_and_restore(library):
+    genres = counts(library, 'genre')
+    decades = counts(library, 'decade')
+    first = library.add_book(book("One", "Ann Author", genre="Poetry", published_year=1994))
+    library.add_book(book("Two", "Ann Author", genre="Poetry", published_year=1999))
+    assert counts(library, 'genre')['Poetry'] == 2
+    assert counts(library, 'author')['Ann Author'] == 2
+    assert counts(library, 'decade')['1990'] == decades.get('1990', 0) + 2
+
+    library.remove_book(first)
+    assert counts(library, 'genre')['Poetry'] == 1
+    library.restore_books([first])
+    assert counts(library, 'genre')['Poetry'] == 2
+
+    library.remove_book(first)
+    library.purge_deleted(0)
+    assert counts(library, 'genre')['Poetry'] == 1
+    assert {genre: count for genre, count in counts(library, 'genre').items() if genre != 'Poetry'} == genres
+
+
+def test_has_file_counts(library):
+    before = counts(library, 'has_file')
+    library.add_book(book("With File", "Ann Author", file_path="uploads/x.txt"))
+    assert counts(library, 'has_file') == {**before, 'yes': before.get('yes', 0) + 1}
+
+
+def test_decades_in_numeric_order(library):
+    library.add_book(book("Beowulf", "Anonymous", published_year=995))
+    library.add_book(book("Undated", "Ann Author"))
+    library.add_book(book("Later", "Ann Author", published_year=1994))
+    decades = [value for value, _ in library.facet_counts('decade')]
+    assert decades[0] == ''
+    assert decades.index('990') < decades.index('1990')
+    assert decades[1:] == sorted(decades[1:], key=int)
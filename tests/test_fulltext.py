@@ -0,0 +1,20 @@
+import io
+
+from conftest import book
+
+
+def test_add_book_indexes_text_files(library):
+    path = library.store_file(io.BytesIO(b"The dragon slept under the Lonely Mountain."), "hobbit.txt")
+    library.add_book(book("The Hobbit", "J.R.R. Tolkien", file_path=path))
+    [found] = library.search_contents("lonely mountain")
+    assert found['title'] == "The Hobbit"
+
+
+def test_unreadable_file_does_not_fail_add(library):
+    before = library.stats()['total_books']
+    # Find New Books saves a path that may not exist
+    library.add_book(book("Missing", "Nobody", file_path="downloads/missing.pdf"))
+    path = library.store_file(io.BytesIO(b"%PDF-1.4 not really a pdf"), "broken.pdf")
+    library.add_book(book("Broken", "Nobody Else", file_path=path))
+    assert library.stats()['total_books'] == before + 2
+    assert library.search_contents("pdf") == []
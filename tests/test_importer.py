@@ -0,0 +1,37 @@
+import io
+import json
+
+import pytest
+
+from library.importer import detect_format, import_file, normalize_row
+
+
+@pytest.mark.parametrize("filename, header, expected", [
+    ("books.jsonl", "", "jsonl"),
+    ("books.json", "", "json"),
+    ("goodreads_library_export.csv", "Book Id,Title,Author,ISBN,ISBN13", "goodreads"),
+    ("books.csv", "title,author", "csv"),
+])
+def test_detect_format(filename, header, expected):
+    assert detect_format(filename, header) == expected
+
+
+def test_goodreads_row():
+    book = normalize_row({
+        'Title': 'Dune', 'Author': 'Frank Herbert', 'ISBN': '="0441172717"', 'ISBN13': '=""',
+        'Bookshelves': 'science-fiction, to-read', 'Original Publication Year': '1965', 'Date Added': '2021/03/04',
+    }, 'goodreads')
+    assert (book['isbn'], book['genre'], book['published_year'], book['date_added']) == \
+        ('9780441172719', 'science-fiction', 1965, '2021-03-04 00:00:00')
+
+
+def test_bad_lines_are_counted_and_the_rest_imported(library):
+    before = library.stats()['total_books']
+    lines = [json.dumps({'title': f"Book {n}", 'author': "Ann Author", 'year': 2000 + n}) for n in range(4)]
+    lines[1:1] = ['{"title": "Cut off", "auth', '[1, 2]']
+    lines.append(json.dumps({'title': "No author"}))
+    # Small chunks, so the bad line falls in the middle of one
+    stats = import_file(library.pool, io.StringIO("\n".join(lines) + "\n"), "books.jsonl", chunk_size=2)
+    library._changed()
+    assert (stats['rows'], stats['imported'], stats['invalid']) == (7, 4, 3)
+    assert library.stats()['total_books'] == before + 4
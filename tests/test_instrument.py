@@ -0,0 +1,98 @@
+import re
+
+import pytest
+
+from library import instrument
+
+SAMPLE_RE = re.compile(r'^([a-z_]+)(\{[a-z]+="[^"]*"\})? (\d+(\.\d+)?)$')
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = instrument.Registry()
+    monkeypatch.setattr(instrument, "REGISTRY", registry)
+    return registry
+
+
+def test_timed_records_count_total_and_slowest(registry, monkeypatch):
+    clock = iter([0.0, 0.5, 1.0, 1.25, 2.0, 2.1])
+    monkeypatch.setattr(instrument.time, "perf_counter", lambda: next(clock))
+
+    @instrument.timed("library.get_book")
+    def get_book(fail=False):
+        if fail:
+            raise KeyError("missing")
+        return "book"
+
+    assert get_book() == "book"
+    assert get_book() == "book"
+    # Failed calls are timed too
+    with pytest.raises(KeyError):
+        get_book(fail=True)
+    count, total, longest = registry.spans["library.get_book"]
+    assert (count, round(total, 6), longest) == (3, 0.85, 0.5)
+
+
+def test_reruns_collect_their_own_spans_queries_and_bytes(registry):
+    instrument.trace_statement("SELECT 1")
+    rerun = instrument.start_rerun()
+    with instrument.span("ui.page"):
+        instrument.trace_statement("SELECT * FROM books")
+        # Statements run by triggers are not the application's
+        instrument.trace_statement("-- TRIGGER books_fts_insert")
+        instrument.record_bytes(1200)
+    assert instrument.finish_rerun("Home") is rerun
+    assert [name for name, _ in rerun.spans] == ["ui.page"]
+    assert (rerun.queries, rerun.bytes_sent) == (1, 1200)
+    assert registry.reruns["Home"][0] == 1
+    assert (registry.queries, registry.bytes_sent) == (2, 1200)
+    assert instrument.finish_rerun("Home") is None
+
+
+def test_prometheus_text(registry):
+    registry.record_span("library.search", 0.25)
+    registry.record_span("library.search", 0.5)
+    registry.record_span("ui.home", 1.0)
+    instrument.start_rerun()
+    instrument.finish_rerun("Home")
+    registry.count_query()
+    text = registry.prometheus_text()
+    assert text.endswith("\n")
+
+    samples, declared = {}, {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            kind, name, rest = line[2:].split(" ", 2)
+            declared.setdefault(name, {})[kind] = rest
+            continue
+        name, labels, value = SAMPLE_RE.match(line).group(1, 2, 3)
+        # Every sample belongs to a family declared before it
+        family = re.sub(r"_(count|sum)$", "", name)
+        assert declared[family]["TYPE"] in ("summary", "gauge", "counter") and declared[family]["HELP"]
+        samples[name + (labels or "")] = float(value)
+
+    assert samples['library_span_seconds_count{span="library.search"}'] == 2
+    assert samples['library_span_seconds_sum{span="library.search"}'] == 0.75
+    assert samples['library_span_seconds_max{span="library.search"}'] == 0.5
+    assert samples['library_rerun_seconds_count{page="Home"}'] == 1
+    assert samples['library_sql_statements_total'] == 1
+    assert samples['library_frontend_bytes_total'] == 0
+
+
+def test_metrics_page_serves_the_registry(registry, tmp_path):
+    import http.client
+    from library.downloads import start_download_server
+
+    registry.record_span("library.search", 0.25)
+    server = start_download_server({"files": str(tmp_path)}, port=0, metrics=registry.prometheus_text)
+    try:
+        conn = http.client.HTTPConnection(*server.server_address)
+        conn.request("GET", "/metrics")
+        response = conn.getresponse()
+        assert response.status == 200
+        assert response.getheader("Content-Type").startswith("text/plain")
+        assert response.read().decode() == registry.prometheus_text()
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,62 @@
+import io
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import book
+from library import jobs
+from library.trash import TIMESTAMP_FORMAT
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def queue(library):
+    library.jobs = jobs.JobQueue(library, workers=1).start()
+    yield library.jobs
+    library.jobs.stop()
+    library.jobs = None
+
+
+def test_added_file_is_indexed_by_a_job(library, queue):
+    library.add_book(book("The Hobbit", "J.R.R. Tolkien"),
+                     fileobj=io.BytesIO(b"The dragon slept under the Lonely Mountain."), filename="hobbit.txt")
+    [job] = jobs.recent_jobs(library.pool)
+    assert job['kind'] == 'index_contents'
+    wait_for(lambda: queue.status([job['id']])[job['id']]['status'] == jobs.DONE)
+    assert [found['title'] for found in library.search_contents("lonely mountain")] == ["The Hobbit"]
+
+
+def test_idle_worker_does_not_take_the_write_lock(library, monkeypatch):
+    queue = jobs.JobQueue(library, workers=0)
+
+    def transaction():
+        raise AssertionError("took the write lock")
+    monkeypatch.setattr(library.pool, "transaction", transaction)
+    assert queue._claim() is None
+
+
+def test_stale_job_is_requeued_while_running(library, monkeypatch):
+    monkeypatch.setattr(jobs, "RECOVER_INTERVAL", 0)
+    monkeypatch.setitem(jobs.HANDLERS, 'echo', lambda library, payload, progress: payload)
+    long_ago = (datetime.now() - timedelta(seconds=jobs.STALE_AFTER + 1)).strftime(TIMESTAMP_FORMAT)
+    with library.pool.transaction() as conn:
+        job_id = conn.execute(
+            "INSERT INTO jobs (kind, payload, status, created_at, heartbeat_at, attempts) "
+            "VALUES ('echo', '{\"n\": 1}', 'running', ?, ?, 1)", (long_ago, long_ago)
+        ).lastrowid
+    queue = jobs.JobQueue(library, workers=1)
+    # Started without the startup recovery, as if the worker died later
+    for thread in queue._threads:
+        thread.start()
+    try:
+        wait_for(lambda: queue.status([job_id])[job_id]['status'] == jobs.DONE)
+    finally:
+        queue.stop()
+    assert queue.status([job_id])[job_id]['result'] == {'n': 1}
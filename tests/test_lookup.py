@@ -0,0 +1,134 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+pytest.importorskip("requests")
+
+from library.lookup import LookupCache, LookupFailed, OpenLibraryClient
+
+DUNE = {'title': 'Dune', 'author_name': ['Frank Herbert'], 'isbn': ['9780441172719'], 'first_publish_year': 1965}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers /search.json from server.statuses (in order), then with server.docs"""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.queries.append(parse_qs(urlsplit(self.path).query)['q'][0])
+            status = server.statuses.pop(0) if server.statuses else 200
+        server.release.wait(5)
+        body = json.dumps({'docs': server.docs if status == 200 else []}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.queries, server.statuses, server.docs = [], [], [DUNE]
+    server.release = threading.Event()
+    server.release.set()
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = LookupCache(str(tmp_path / "lookup_cache.db"))
+    yield cache
+    cache.pool.close()
+
+
+def test_results_are_parsed(stub):
+    [found] = OpenLibraryClient(stub.url).search("dune")
+    assert (found['title'], found['author'], found['isbn'], found['published_year']) == \
+        ('Dune', 'Frank Herbert', '9780441172719', 1965)
+
+
+def test_cache_hits_and_misses(stub, cache):
+    client = OpenLibraryClient(stub.url, cache=cache)
+    first = client.search("Dune")
+    # Case and spacing don't make a new query
+    assert client.search("  dune ") == first
+    assert stub.queries == ["Dune"]
+    client.search("dune messiah")
+    assert stub.queries == ["Dune", "dune messiah"]
+
+
+def test_expired_entries_are_fetched_again(stub, tmp_path):
+    cache = LookupCache(str(tmp_path / "lookup_cache.db"), ttl=0)
+    client = OpenLibraryClient(stub.url, cache=cache)
+    client.search("dune")
+    client.search("dune")
+    assert len(stub.queries) == 2
+    cache.pool.close()
+
+
+def test_no_results_are_cached_too(stub, cache):
+    stub.docs = []
+    client = OpenLibraryClient(stub.url, cache=cache)
+    assert client.search("no such book") == []
+    assert client.search("no such book") == []
+    assert len(stub.queries) == 1
+
+
+def test_failures_are_not_cached(stub, cache):
+    stub.statuses = [404]
+    client = OpenLibraryClient(stub.url, cache=cache)
+    with pytest.raises(LookupFailed):
+        client.search("dune")
+    assert client.search("dune")[0]['title'] == 'Dune'
+
+
+def test_concurrent_identical_lookups_share_one_request(stub):
+    client = OpenLibraryClient(stub.url)
+    stub.release.clear()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.search("dune"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    # Hold the first request until every caller has asked
+    deadline = time.monotonic() + 5
+    while not stub.queries and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    stub.release.set()
+    for thread in threads:
+        thread.join()
+    assert stub.queries == ["dune"]
+    assert len(results) == 5 and all(result == results[0] for result in results)
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_retries_with_backoff(stub, status):
+    stub.statuses = [status, status]
+    client = OpenLibraryClient(stub.url, backoff_factor=0.1)
+    started = time.monotonic()
+    assert client.search("dune")[0]['title'] == 'Dune'
+    assert len(stub.queries) == 3
+    # Waits 0.0s, then 0.2s between the attempts
+    assert time.monotonic() - started >= 0.2
+
+
+def test_gives_up_after_the_retries(stub):
+    stub.statuses = [503] * 5
+    client = OpenLibraryClient(stub.url, retries=2, backoff_factor=0)
+    with pytest.raises(LookupFailed):
+        client.search("dune")
+    assert len(stub.queries) == 3
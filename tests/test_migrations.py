@@ -0,0 +1,44 @@
+import sqlite3
+
+from library import Library
+from library.migrations import MIGRATIONS, SEED_BOOKS, migrate, schema_version
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def test_versions_are_unique_and_sequential():
+    assert [version for version, _ in MIGRATIONS] == list(range(1, LATEST + 1))
+
+
+def test_new_library_is_current_and_seeded(library):
+    with library.pool.connection() as conn:
+        assert schema_version(conn) == LATEST
+        assert migrate(conn) == LATEST
+    assert library.stats()['total_books'] == len(SEED_BOOKS)
+
+
+def test_database_from_before_migrations_keeps_its_books(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    # The table the app created before migrations existed
+    conn.execute('''
+        CREATE TABLE books
+        (id TEXT PRIMARY KEY, title TEXT NOT NULL, author TEXT NOT NULL, genre TEXT, description TEXT,
+         published_year INTEGER, isbn TEXT, cover_image TEXT, date_added TEXT)
+    ''')
+    conn.execute("INSERT INTO books VALUES ('old-1', 'Dune', 'Frank Herbert', 'Science Fiction', '', 1965, "
+                 "'0441172717', '', '2020-01-01 00:00:00')")
+    conn.commit()
+    conn.close()
+
+    library = Library(path, str(tmp_path / "uploads"), pool_size=1)
+    try:
+        with library.pool.connection() as conn:
+            assert schema_version(conn) == LATEST
+        # No sample books are added to an existing library
+        assert [found.id for found in library.iter_books()] == ['old-1']
+        assert library.search("dune")[0].id == 'old-1'
+        # The ISBN-10 was indexed as its ISBN-13
+        assert library.find_duplicate("Other", "Someone", isbn="9780441172719").id == 'old-1'
+    finally:
+        library.close()
@@ -0,0 +1,40 @@
+from conftest import book
+from library.facets import selection
+
+
+def all_pages(library, limit, selected=()):
+    pages, cursor = [], None
+    while True:
+        page = library.books_page(cursor, limit=limit, selection=selected)
+        if not page:
+            return pages
+        pages.append(page)
+        cursor = (page[-1].date_added, page[-1].id)
+
+
+def test_pages_cover_every_book_once_in_order(library):
+    # Several books share a date_added, so the id breaks ties
+    for n in range(23):
+        library.add_book(book(f"Book {n}", f"Author {n % 4}", date_added=f"2024-01-{n // 3 + 1:02d} 00:00:00"))
+    pages = all_pages(library, limit=5)
+    books = [found for page in pages for found in page]
+    assert len(books) == library.stats()['total_books']
+    assert len({found.id for found in books}) == len(books)
+    keys = [(found.date_added, found.id) for found in books]
+    assert keys == sorted(keys)
+    assert all(len(page) == 5 for page in pages[:-1])
+
+
+def test_pages_skip_removed_books_and_follow_the_selection(library):
+    ids = [library.add_book(book(f"Book {n}", "Ann Author" if n % 2 else "Bob Author")) for n in range(9)]
+    library.remove_book(ids[1])
+    pages = all_pages(library, limit=2, selected=selection({'author': ['Ann Author']}))
+    titles = sorted(found.title for page in pages for found in page)
+    assert titles == ["Book 3", "Book 5", "Book 7"]
+
+
+def test_iter_books_matches_paging(library):
+    for n in range(7):
+        library.add_book(book(f"Book {n}", "Author"))
+    assert [found.id for found in library.iter_books(batch=3)] == \
+        [found.id for page in all_pages(library, limit=3) for found in page]
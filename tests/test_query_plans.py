@@ -0,0 +1,25 @@
+"""The checks of benchmarks.plans, run against a small generated library"""
+import pytest
+
+# library.enrich, whose query is checked, looks books up with requests
+pytest.importorskip("requests")
+
+from benchmarks.generate import generate_library
+from benchmarks.plans import CHECKS, check_plans, query_plan
+
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    library = generate_library(str(tmp_path_factory.mktemp("plans") / "plans.db"), 2000)
+    with library.pool.connection() as conn:
+        # Plans depend on statistics, as they would on a real library
+        conn.execute("ANALYZE")
+        yield conn
+    library.close()
+
+
+@pytest.mark.parametrize("name", CHECKS)
+def test_query_plan(conn, name):
+    failures = check_plans(conn, {name: CHECKS[name]})
+    problems = failures.get(name, ([], []))[1]
+    assert not problems, "\n".join(query_plan(conn, *CHECKS[name][:2]) + problems)
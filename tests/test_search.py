@@ -0,0 +1,37 @@
+import pytest
+
+from conftest import book
+from library.search import build_match_query
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("harry pot", '"harry"* AND "pot"*'),
+    ('"mockingbird"', '"mockingbird"'),
+    ("author:rowling genre:fantasy", 'author : "rowling"* AND genre : "fantasy"*'),
+    ('title:"the hobbit"', 'title : "the hobbit"'),
+    # Not a field, so the whole token is searched
+    ("re:zero", '"re:zero"*'),
+    ('say "hi', '"say"* AND "hi"'),
+    ("it's", '"it\'s"*'),
+])
+def test_build_match_query(text, expected):
+    assert build_match_query(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", None, "  ", "***", '""'])
+def test_nothing_searchable(text):
+    assert build_match_query(text) is None
+
+
+def test_fields_can_be_restricted():
+    assert build_match_query("isbn:978", fields=('title',)) == '"isbn:978"*'
+
+
+def test_search(library):
+    dune = library.add_book(book("Dune", "Frank Herbert", genre="Science Fiction", description="Spice and sand"))
+    library.add_book(book("Dune Road", "Someone Else", description="A road trip"))
+    assert library.search("author:herbert")[0].id == dune
+    assert [found.id for found in library.search("spice")] == [dune]
+    assert {found.title for found in library.search("dun")} == {"Dune", "Dune Road"}
+    library.remove_book(dune)
+    assert [found.title for found in library.search("dune")] == ["Dune Road"]
@@ -0,0 +1,66 @@
+import pytest
+
+from conftest import book
+
+SPICE = "Desert planet Arrakis, spice melange, sandworms and the Fremen of the deep desert."
+
+
+def titles(books):
+    return [found.title for found in books]
+
+
+@pytest.fixture
+def shelf(library):
+    ids = {
+        "Dune": library.add_book(book("Dune", "Frank Herbert", genre="Science Fiction", description=SPICE)),
+        "Dune Messiah": library.add_book(book("Dune Messiah", "Frank Herbert", genre="Science Fiction",
+                                              description="Paul rules Arrakis; the spice and the Fremen jihad.")),
+        "Foundation": library.add_book(book("Foundation", "Isaac Asimov", genre="Science Fiction",
+                                            description="A galactic empire falls and psychohistory plans its return.")),
+        "Emma": library.add_book(book("Emma", "Jane Austen", genre="Romance",
+                                      description="A young woman in a country village plays matchmaker.")),
+    }
+    return ids
+
+
+def test_closest_book_comes_first(library, shelf):
+    similar = titles(library.similar_books(shelf["Dune"]))
+    assert similar[0] == "Dune Messiah"
+    assert "Dune" not in similar
+    assert "Emma" not in similar
+
+
+def test_added_books_are_indexed(library, shelf):
+    library.add_book(book("Children of Dune", "Frank Herbert", genre="Science Fiction", description=SPICE))
+    assert titles(library.similar_books(shelf["Dune"]))[0] == "Children of Dune"
+
+
+def test_removed_books_are_not_suggested(library, shelf):
+    library.remove_book(shelf["Dune Messiah"])
+    assert "Dune Messiah" not in titles(library.similar_books(shelf["Dune"]))
+    library.restore_books([shelf["Dune Messiah"]])
+    assert titles(library.similar_books(shelf["Dune"]))[0] == "Dune Messiah"
+    library.remove_book(shelf["Dune Messiah"])
+    library.purge_deleted(0)
+    with library.pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM book_vectors WHERE book_id = ?", (shelf["Dune Messiah"],)).fetchone()[0] == 0
+
+
+def test_enriched_books_are_reindexed(library, shelf):
+    pytest.importorskip("requests")
+    from library.enrich import enrich_library
+
+    bare = library.add_book(book("Heretics of Dune", "Someone Unknown", genre="Other",
+                                 description="A book by Someone Unknown"))
+    assert "Heretics of Dune" not in titles(library.similar_books(shelf["Emma"]))
+
+    class Client:
+        def search(self, query, limit=10):
+            if query.startswith("Heretics"):
+                return [{'genre': "Romance", 'description': "A country village, a young woman and a matchmaker."}]
+            return []
+
+    enrich_library(library.pool, Client(), rate=1000)
+    library._changed()
+    assert titles(library.similar_books(shelf["Emma"]))[0] == "Heretics of Dune"
+    assert library.get_book(bare).genre == "Romance"
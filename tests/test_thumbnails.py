@@ -0,0 +1,102 @@
+import io
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+pytest.importorskip("requests")
+
+from library.thumbnails import SIZES, ThumbnailStore
+
+
+def jpeg(width, height):
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (120, 30, 30)).save(out, format='JPEG')
+    return out.getvalue()
+
+
+class CoverHandler(BaseHTTPRequestHandler):
+    """Serves server.covers by path; anything else is a 404"""
+
+    def do_GET(self):
+        body = self.server.covers.get(self.path)
+        self.server.requests.append(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def covers():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CoverHandler)
+    server.daemon_threads = True
+    server.requests = []
+    server.covers = {'/dune.jpg': jpeg(800, 1200), '/broken.jpg': b"not an image"}
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def store(library, tmp_path):
+    return ThumbnailStore(library.pool, str(tmp_path / "thumbnails"), workers=1)
+
+
+def finish(store):
+    """Wait for the background fetches"""
+    store._executor.shutdown(wait=True)
+
+
+def cached_rows(store):
+    with store.pool.connection() as conn:
+        return conn.execute("SELECT url, digest FROM cover_thumbnails").fetchall()
+
+
+def test_cover_is_resized_and_cached(store, covers):
+    url = covers.url + "/dune.jpg"
+    # Rendering never waits: the first call only schedules the fetch
+    assert store.thumbnail(url) is None
+    finish(store)
+    path = store.thumbnail(url, 'small')
+    [(cached_url, digest)] = cached_rows(store)
+    assert cached_url == url and path == store.relative_path(digest, 'small')
+    for size, (width, height) in SIZES.items():
+        with Image.open(os.path.join(store.root, store.relative_path(digest, size))) as image:
+            assert image.width <= width and image.height <= height
+            assert image.size == (height * 2 // 3, height)
+    assert covers.requests == ["/dune.jpg"]
+
+
+def test_same_cover_at_another_url_is_stored_once(store, covers):
+    covers.covers['/copy.jpg'] = covers.covers['/dune.jpg']
+    first = store.fetch(covers.url + "/dune.jpg")
+    assert store.fetch(covers.url + "/copy.jpg") == first
+    assert len(os.listdir(os.path.join(store.root, first[:2]))) == len(SIZES)
+
+
+def test_placeholder_is_drawn_without_fetching(store, covers):
+    digest = store.fetch("https://via.placeholder.com/150?text=Dune")
+    assert os.path.exists(os.path.join(store.root, store.relative_path(digest, 'large')))
+    assert covers.requests == []
+
+
+@pytest.mark.parametrize("path", ["/missing.jpg", "/broken.jpg"])
+def test_failed_cover_falls_back_and_is_not_retried_at_once(store, covers, path):
+    url = covers.url + path
+    assert store.thumbnail(url) is None
+    finish(store)
+    # No thumbnail, so the card renders without a cover instead of a broken image
+    assert store.thumbnail(url) is None
+    assert cached_rows(store) == []
+    assert covers.requests == [path]
@@ -0,0 +1,73 @@
+import os
+import sys
+import threading
+import subprocess
+
+import pytest
+
+from library import workers
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Holds the purger leadership (and so its lock file) until told to exit
+HOLDER = '''
+import sys
+from library.workers import Leader
+leader = Leader(sys.argv[1], "purger")
+print(leader.elect(), flush=True)
+sys.stdin.readline()
+'''
+
+pytestmark = pytest.mark.skipif(workers.fcntl is None, reason="needs flock")
+
+
+def test_only_one_process_leads_until_it_exits(tmp_path):
+    db_path = str(tmp_path / "library.db")
+    holder = subprocess.Popen([sys.executable, "-c", HOLDER, db_path], cwd=ROOT, text=True,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        assert holder.stdout.readline().strip() == "True"
+        leader = workers.Leader(db_path, "purger")
+        assert not leader.elect()
+        # Retried on every election
+        assert not leader.elect()
+    finally:
+        holder.stdin.write("\n")
+        holder.stdin.close()
+        holder.wait(5)
+    # The OS dropped the dead leader's lock
+    assert leader.elect()
+    assert leader.elect()
+
+
+def test_file_lock_is_exclusive_across_threads(tmp_path):
+    lock = workers.FileLock(str(tmp_path / "write.lock"))
+    other = workers.FileLock(str(tmp_path / "write.lock"))
+    assert lock.acquire(blocking=False)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(lock.acquire(blocking=False)))
+    thread.start()
+    thread.join()
+    # Another thread of this process, and another lock on the same file, both wait
+    assert results == [False]
+    assert not other.acquire(blocking=False)
+    lock.release()
+    assert other.acquire(blocking=False)
+    other.release()
+
+
+def test_blocking_acquire_waits_for_release(tmp_path):
+    path = str(tmp_path / "write.lock")
+    holder = workers.FileLock(path)
+    holder.acquire()
+    acquired = threading.Event()
+
+    def wait_for_lock():
+        with workers.FileLock(path):
+            acquired.set()
+
+    thread = threading.Thread(target=wait_for_lock)
+    thread.start()
+    assert not acquired.wait(0.2)
+    holder.release()
+    assert acquired.wait(5)
+    thread.join()